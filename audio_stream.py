@@ -0,0 +1,156 @@
+import atexit
+import os
+import threading
+import wave
+
+import numpy as np
+import pyaudio
+
+import fruit_metrics
+
+# -----------------------------
+# 常駐的麥克風輸入串流：程式啟動後只開一次裝置，PortAudio callback 持續把聲音寫進
+# 預先配置好的環形緩衝區 (int16 numpy 陣列，callback 只做複製、不配置新的緩衝)。
+# 錄音時從緩衝區取出「按下按鍵前」的一小段 pre-roll，再等到錄滿指定秒數，
+# 不必等待開啟裝置，也不會漏掉剛開口的第一個音節。
+# -----------------------------
+SAMPLE_RATE = 16000
+CHANNELS = 1
+CHUNK = 1024
+FORMAT = pyaudio.paInt16
+# 環形緩衝區長度 (秒)；必須大於 pre-roll + 單次錄音長度
+RING_SECONDS = 10
+PREROLL_S = float(os.environ.get("FRUIT_AUDIO_PREROLL_S", "0.5"))
+
+
+class AudioRingBuffer:
+    """固定大小的 int16 環形緩衝區；position 是累計寫入的樣本數 (單調遞增)"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buffer = np.zeros(capacity, dtype=np.int16)
+        self._position = 0
+        self._cond = threading.Condition()
+
+    def write(self, data):
+        samples = np.frombuffer(data, dtype=np.int16)
+        if len(samples) > self.capacity:
+            samples = samples[-self.capacity:]
+        with self._cond:
+            start = self._position % self.capacity
+            first = min(len(samples), self.capacity - start)
+            self._buffer[start:start + first] = samples[:first]
+            self._buffer[:len(samples) - first] = samples[first:]
+            self._position += len(samples)
+            self._cond.notify_all()
+
+    @property
+    def position(self):
+        with self._cond:
+            return self._position
+
+    def wait_for(self, position, timeout):
+        """等到累計寫入達 position；逾時回傳 False"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._position >= position, timeout)
+
+    def read(self, start, end):
+        """取出 [start, end) 的樣本 (複製)；超出緩衝區保留範圍時丟出 ValueError"""
+        with self._cond:
+            if end > self._position or start < self._position - self.capacity or start > end:
+                raise ValueError(f"samples {start}-{end} are not in the buffer (position {self._position})")
+            first = start % self.capacity
+            count = end - start
+            if first + count <= self.capacity:
+                return self._buffer[first:first + count].copy()
+            return np.concatenate((self._buffer[first:], self._buffer[:first + count - self.capacity]))
+
+
+class AudioInputStream:
+    def __init__(self, rate=SAMPLE_RATE, channels=CHANNELS, chunk=CHUNK, ring_seconds=RING_SECONDS):
+        self.rate = rate
+        self.channels = channels
+        self.chunk = chunk
+        self.ring = AudioRingBuffer(int(rate * channels * ring_seconds))
+        self._pa = None
+        self._stream = None
+
+    def start(self):
+        with fruit_metrics.timed("audio_open"):
+            self._pa = pyaudio.PyAudio()
+            self._stream = self._pa.open(format=FORMAT, channels=self.channels, rate=self.rate, input=True,
+                                         frames_per_buffer=self.chunk, stream_callback=self._callback)
+            self._stream.start_stream()
+        return self
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        self.ring.write(in_data)
+        return None, pyaudio.paContinue
+
+    @property
+    def sample_width(self):
+        return self._pa.get_sample_size(FORMAT)
+
+    def record(self, duration, preroll=PREROLL_S):
+        """回傳 pre-roll + duration 秒的 int16 樣本；從呼叫當下開始計算 duration"""
+        now = self.ring.position
+        per_second = self.rate * self.channels
+        end = now + int(duration * per_second)
+        start = max(0, now - int(preroll * per_second))
+        if end - start > self.ring.capacity:
+            raise ValueError(f"recording of {duration}s + {preroll}s pre-roll exceeds the {RING_SECONDS}s ring buffer")
+        if not self.ring.wait_for(end, timeout=duration + 2.0):
+            print("⚠️ 麥克風沒有送出足夠的音訊，錄音可能被截斷。")
+            end = self.ring.position
+        return self.ring.read(start, end)
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+        if self._pa is not None:
+            self._pa.terminate()
+            self._pa = None
+
+
+_shared_lock = threading.Lock()
+_shared = None
+
+
+def get_stream():
+    """取得 (第一次呼叫時開啟) 共用的輸入串流；互動模式啟動時先呼叫 open_stream()，第一次錄音就有 pre-roll"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = AudioInputStream().start()
+        return _shared
+
+
+def open_stream():
+    """互動模式啟動時預先開啟麥克風；沒有麥克風時只警告，錄音時會再試一次"""
+    try:
+        return get_stream()
+    except Exception as e:
+        print(f"⚠️ 無法開啟麥克風: {e}")
+        return None
+
+
+def close_stream():
+    global _shared
+    with _shared_lock:
+        if _shared is not None:
+            _shared.close()
+            _shared = None
+
+
+atexit.register(close_stream)
+
+
+def write_wav(filename, samples, stream):
+    with wave.open(filename, "wb") as wf:
+        wf.setnchannels(stream.channels)
+        wf.setsampwidth(stream.sample_width)
+        wf.setframerate(stream.rate)
+        wf.writeframes(samples.tobytes())
+    return filename
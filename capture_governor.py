@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import cv2
+
+import fruit_metrics
+
+# -----------------------------
+# 擷取節流：llava / llama3 推論時與攝影機迴圈搶同一顆 CPU。
+# chatbot._ollama_chat 以 inference() 標記進行中的推論，
+# 攝影機迴圈以 CaptureGovernor.read() 取代 cap.read()：有推論進行時以 grab() 跳過多餘的幀
+# (不解碼、不畫疊加)，只處理 THROTTLED_FPS 的畫面，推論結束一段時間後恢復。
+# 不在串流中修改裝置的 CAP_PROP_FPS：許多 V4L2 驅動串流中拒絕 (EBUSY) 且不一定回報失敗。
+# 指標：fruit_capture_frame_seconds{mode} (幀間隔，平均 FPS = count / sum)
+#       fruit_inference_seconds{call_type, capture} (推論時攝影機是否被節流)
+# -----------------------------
+NORMAL_FPS = 15
+NORMAL_SIZE = (640, 480)
+THROTTLED_FPS = float(os.environ.get("FRUIT_THROTTLED_FPS", "3"))
+THROTTLED_SIZE = (320, 240)
+# 節流時一併降低解析度 (預設關閉)：同樣是串流中修改裝置設定，驅動拒絕時 (set() 回傳 False) 自動停用
+RESIZE_WHILE_BUSY = os.environ.get("FRUIT_GOVERNOR_RESIZE", "") == "1"
+# 推論結束後再等這麼久才恢復，避免辨識 → 摘要 → 回答之間來回切換
+RESTORE_DELAY_S = 0.5
+
+MODES = ("normal", "throttled")
+CALL_TYPES = ("classify", "summarize", "answer")
+
+_lock = threading.Lock()
+_inflight = 0
+_last_finished = 0.0
+# 目前有 governor 控制的攝影機時為其模式；伺服器等沒有攝影機的情境為 None
+_capture_mode = None
+
+
+@contextmanager
+def inference(call_type):
+    """包住一次推論：計入進行中的數量，並依推論期間的擷取模式 (結束時) 記錄延遲"""
+    global _inflight, _last_finished
+    with _lock:
+        _inflight += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            _inflight -= 1
+            _last_finished = time.monotonic()
+            capture = _capture_mode or "none"
+        fruit_metrics.observe("fruit_inference_seconds", elapsed, call_type=call_type, capture=capture)
+
+
+def inference_load():
+    """回傳 (進行中的推論數, 距上次推論結束的秒數)"""
+    with _lock:
+        return _inflight, time.monotonic() - _last_finished
+
+
+class CaptureGovernor:
+    def __init__(self, cap, fps=NORMAL_FPS, size=NORMAL_SIZE, throttled_fps=THROTTLED_FPS,
+                 throttled_size=THROTTLED_SIZE, resize=RESIZE_WHILE_BUSY):
+        self.cap = cap
+        self.settings = {"normal": (fps, size), "throttled": (throttled_fps, throttled_size)}
+        self.resize = resize
+        # 節流時每處理一幀之前跳過幾幀 (裝置 FPS 不變，例如 15 → 3 FPS 為跳過 4 幀)
+        self.skip = max(0, round(fps / throttled_fps) - 1) if throttled_fps > 0 else 0
+        self.mode = None
+        self._last_done = None
+        self._frame_started = None
+        # 只保留最新一幀；節流時讀得慢，否則會讀到驅動緩衝區裡的舊畫面 (在第一次讀取、串流開始前設定)
+        if not cap.set(cv2.CAP_PROP_BUFFERSIZE, 1):
+            print("⚠️ 攝影機不支援 CAP_PROP_BUFFERSIZE，節流時跳過的幀會包含緩衝區裡的舊畫面。")
+        self._set_mode("normal")
+
+    def _set_mode(self, mode):
+        global _capture_mode
+        if self.resize and self.mode is not None:
+            width, height = self.settings[mode][1]
+            if not (self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width) and self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)):
+                print("⚠️ 攝影機串流中無法變更解析度，節流時不再調整解析度。")
+                self.resize = False
+        if self.mode is not None:
+            fruit_metrics.inc("fruit_capture_governor_transitions_total", mode=mode)
+        self.mode = mode
+        with _lock:
+            _capture_mode = mode
+
+    def update(self):
+        """依目前的推論負載切換模式，回傳模式"""
+        inflight, idle_for = inference_load()
+        busy = inflight > 0 or idle_for < RESTORE_DELAY_S
+        mode = "throttled" if busy else "normal"
+        if mode != self.mode:
+            self._set_mode(mode)
+        return mode
+
+    def read(self):
+        """取代 cap.read()：節流時先以 grab() 丟掉 skip 幀 (只取出、不解碼)，再讀要處理的那一幀"""
+        if self.mode == "throttled":
+            for _ in range(self.skip):
+                if not self.cap.grab():
+                    return False, None
+            fruit_metrics.inc("fruit_capture_frames_skipped_total", self.skip)
+        return self.cap.read()
+
+    def frame_done(self):
+        """
+        每處理完一幀呼叫：記錄幀間隔，回傳距離下一幀還要等幾秒 (至少 0)。
+        以正常 FPS 計算；節流由 read() 跳過幀達成，read() 本身就會等待裝置送出的幀
+        """
+        now = time.monotonic()
+        mode = self.update()
+        if self._last_done is not None:
+            fruit_metrics.observe("fruit_capture_frame_seconds", now - self._last_done, mode=mode)
+        fruit_metrics.inc("fruit_capture_frames_total", mode=mode)
+        self._last_done = now
+        started = self._frame_started if self._frame_started is not None else now
+        wait = max(0.0, started + 1.0 / self.settings["normal"][0] - now)
+        self._frame_started = now + wait
+        return wait
+
+    def wait_ms(self):
+        """cv2.waitKey 的等待時間 (毫秒)；waitKey 同時處理視窗事件"""
+        return max(1, int(self.frame_done() * 1000))
+
+    def close(self):
+        global _capture_mode
+        with _lock:
+            _capture_mode = None
+
+
+def capture_stats():
+    """各模式的平均擷取 FPS 與推論延遲，顯示節流的取捨"""
+    stats = {}
+    for mode in MODES:
+        count, total = fruit_metrics.get_histogram("fruit_capture_frame_seconds", mode=mode)
+        stats[mode] = {
+            "frames": fruit_metrics.get_counter("fruit_capture_frames_total", mode=mode),
+            "avg_fps": round(count / total, 2) if total else 0.0,
+        }
+    inference_stats = {}
+    for call_type in CALL_TYPES:
+        for capture in MODES + ("none",):
+            count, total = fruit_metrics.get_histogram("fruit_inference_seconds", call_type=call_type, capture=capture)
+            if count:
+                inference_stats.setdefault(call_type, {})[capture] = {
+                    "calls": count, "avg_latency_s": round(total / count, 4)}
+    stats["inference"] = inference_stats
+    return stats
@@ -1,15 +1,29 @@
 import cv2
-import ollama
+import numpy as np
 import re
 import os
 import json
 import sys
+import requests
 import wikipedia
 from difflib import get_close_matches
 from wit import Wit
-import pyaudio
-import wave
 import io
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import audio_stream
+import capture_governor
+import fruit_trace
+import fruit_metrics
+import fruit_roi
+import fruit_classifier
+import fruit_intents
+import fruit_sessions
+import knowledge_pack
+import ollama_pool
+import ollama_tuner
 
 # -----------------------------
 # 參數設定與全域變數
@@ -23,6 +37,24 @@ client = Wit(WIT_ACCESS_TOKEN)
 
 FRUIT_JSON_PATH = "/opt/NanoLLM/ollama_host/fruit_dataset.json"
 
+# 離線知識包 (knowledge_pack.py build 產生)，補齊資料集沒有的水果
+KNOWLEDGE_PACK_PATH = os.environ.get(
+    "FRUIT_KNOWLEDGE_PACK", os.path.join(os.path.dirname(FRUIT_JSON_PATH), "knowledge_pack.json")
+)
+# 設為 1 時資料集與知識包都沒有的水果不再即時查 Wikipedia
+OFFLINE_ONLY = os.environ.get("FRUIT_OFFLINE", "") == "1"
+# 測試時可指向本地的 Wikipedia 替身 (wiki_stub.py)
+WIKIPEDIA_API_URL = os.environ.get("WIKIPEDIA_API_URL", "")
+# 取得水果資訊的總時間預算 (秒)：畫面與語音流程最多等這麼久，
+# 逾時先回傳部分資訊，線上查詢在背景完成後寫入快取
+INFO_DEADLINE_S = float(os.environ.get("FRUIT_INFO_DEADLINE_S", "8"))
+# Wikipedia 單次 HTTP 請求的逾時 (秒)；wikipedia 套件本身不設逾時，斷線時會一直卡住
+WIKIPEDIA_TIMEOUT_S = float(os.environ.get("FRUIT_WIKIPEDIA_TIMEOUT_S", "5"))
+# 進行中的線上查詢超過這麼久 (秒) 仍未完成就視為卡住，下次查詢另開新的
+ONLINE_LOOKUP_EXPIRE_S = 60
+# 線上查詢結果的記憶體快取上限 (水果種類數)
+ONLINE_CACHE_MAX = 64
+
 # 允許辨識的水果清單
 ALLOWED_FRUITS = [
     "Apple", "Banana", "Grape", "Kiwi", "Mango", "Orange",
@@ -30,114 +62,216 @@ ALLOWED_FRUITS = [
     "Guava", "Pineapple", "Cantaloupe"
 ]
 
+# Q&A 對話保留的最多輪數 (達到時丟掉較舊的一半)
+CHAT_SESSION_MAX_TURNS = 6
+# 本機 webcam 介面使用的對話 session
+LOCAL_SESSION_ID = "local"
+
+# 攝影機畫面送 llava 前先裁出主要物體並縮到模型原生大小
+ROI_CROP = True
+# 多水果模式：同時送往 Ollama 的區域數 (與 OLLAMA_NUM_PARALLEL 對齊)
+REGION_WORKERS = ollama_pool.NUM_PARALLEL
+
+# 辨識串接：依序嘗試較便宜的層級，信心值達門檻且標籤在允許清單內才採用，否則才交給 llava
+# FRUIT_CASCADE：逗號分隔，features = 本地特徵分類器 (fruit_classifier.py)，
+# ollama:<model> = 小型視覺模型 (例如 ollama:moondream)；預設不啟用 (每次都用 llava)。
+# 特徵分類器只認得 image_store 裡有的水果，遇到沒有的種類仍可能以高信心回答別的標籤，
+# 啟用前先以 python fruit_classifier.py eval 確認留一法的覆蓋率與準確率
+CASCADE_TIERS = [t.strip() for t in os.environ.get("FRUIT_CASCADE", "").split(",") if t.strip()]
+# 門檻可用 python fruit_classifier.py eval 的留一法結果調整
+CASCADE_CONFIDENCE = float(os.environ.get("FRUIT_CASCADE_CONFIDENCE", "0.9"))
+
 # -----------------------------
-# 使用 PyAudio 錄音
+# 使用 PyAudio 錄音：常駐的輸入串流 (audio_stream.py) 只在第一次錄音時開啟裝置，
+# 錄到的內容包含按鍵前 audio_stream.PREROLL_S 秒的 pre-roll
 # -----------------------------
 def record_audio_pyaudio(duration=3, filename="voice_command.wav"):
-    CHUNK = 1024
-    FORMAT = pyaudio.paInt16
-    CHANNELS = 1
-    RATE = 16000
-    p = pyaudio.PyAudio()
-    stream = p.open(format=FORMAT, channels=CHANNELS, rate=RATE, input=True, frames_per_buffer=CHUNK)
+    stream = audio_stream.get_stream()
 
     print("開始錄音...")
-    frames = []
-    for _ in range(int(RATE / CHUNK * duration)):
-        data = stream.read(CHUNK)
-        frames.append(data)
+    with fruit_metrics.timed("record_audio"):
+        samples = stream.record(duration)
     print("錄音結束")
 
-    stream.stop_stream()
-    stream.close()
-    p.terminate()
-
-    wf = wave.open(filename, 'wb')
-    wf.setnchannels(CHANNELS)
-    wf.setsampwidth(p.get_sample_size(FORMAT))
-    wf.setframerate(RATE)
-    wf.writeframes(b''.join(frames))
-    wf.close()
-    return filename
+    return audio_stream.write_wav(filename, samples, stream)
 
 # -----------------------------
 # Wit.ai 語音辨識
 # -----------------------------
 def recognize_speech_with_wit(audio_file, access_token=WIT_ACCESS_TOKEN):
     client = Wit(access_token)
-    with open(audio_file, 'rb') as f:
+    with open(audio_file, 'rb') as f, fruit_metrics.timed("transcribe"):
         response = client.speech(f, {'Content-Type': 'audio/wav'})
     return response.get('text', None)
 
 
+# -----------------------------
+# 呼叫 Ollama (統一計時並記錄 eval_count / eval_duration；設定多台主機時經由 ollama_pool 分流)
+# -----------------------------
+def _ollama_chat(call_type, timeout=None, **kwargs):
+    """
+    call_type：classify (llava)、summarize (維基摘要)、answer (Q&A)。
+    ollama_tuner.py 產生的 profile 依 call_type 帶入 options 與 keep_alive (呼叫端指定的優先)。
+    timeout：這次呼叫的時間預算 (秒)，超過時丟出 TimeoutError
+    """
+    settings = ollama_tuner.call_settings(call_type, kwargs.get("model"))
+    if settings.get("options"):
+        kwargs["options"] = dict(settings["options"], **(kwargs.get("options") or {}))
+    if "keep_alive" in settings:
+        kwargs.setdefault("keep_alive", settings["keep_alive"])
+    with capture_governor.inference(call_type), fruit_metrics.timed(call_type):
+        response = ollama_pool.chat(timeout=timeout, **kwargs)
+    fruit_metrics.observe_ollama(call_type, kwargs.get("model"), response)
+    return response
+
+
 # -----------------------------------------------------
 # [核心改動區]：先定義一個單次呼叫 LLM 的函式
 # -----------------------------------------------------
-def _shorten_wiki_text_one_call(main_text):
-    """
-    單次呼叫 ollama 進行摘要，回傳 (nutrition_line, health_line)
-    """
-    # 1. 移除 [1], [2] 等參考符號與多餘問號、換行
+# 摘要的兩個欄位 (同時是 JSON key 與輸出行的前綴)
+SUMMARY_FIELDS = ("nutrition", "health")
+SUMMARY_FIELD_DESCRIPTIONS = {"nutrition": "水果的營養相關描述", "health": "水果的健康益處描述"}
+
+# 整個摘要 (含補問) 的時間上限 (秒)，以及防止快速失敗時無限重試的呼叫上限
+SHORTEN_DEADLINE_S = 45
+SHORTEN_MAX_CALLS = 5
+# 補問時只附上原文的這一段 (字元數)，而不是整段原文
+RETRY_EXCERPT_CHARS = 400
+
+
+def _clean_wiki_text(main_text):
+    # 移除 [1], [2] 等參考符號與多餘問號、換行
     text_no_refs = re.sub(r"\[\d+\]", "", main_text)
     text_no_refs = re.sub(r"[\?]{2,}", "", text_no_refs)
-    text_no_refs = re.sub(r"\n+", " ", text_no_refs)
+    return re.sub(r"\n+", " ", text_no_refs)
+
+
+def _valid_summary(value):
+    if not isinstance(value, str):
+        return False
+    value = value.strip()
+    return bool(value) and "???" not in value and value != "無"
+
 
-    # 2. Prompt：要求只輸出 nutrition: 與 health:
-    prompt = f"""請閱讀以下水果資訊，並只用兩行輸出：
-nutrition: <水果的營養相關描述>
-health: <水果的健康益處描述>
-請確保只輸出上述兩行，不要添加任何其他多餘文字或前綴。
+def _parse_summary(raw, fields):
+    """先以 JSON 解析；模型偶爾仍回兩行純文字時，退回原本的正規表示式"""
+    parsed = {}
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        data = None
+    if isinstance(data, dict):
+        for field in fields:
+            value = data.get(field)
+            if _valid_summary(value):
+                parsed[field] = value.strip()
+        return parsed
+
+    for field in fields:
+        match = re.search(rf"{field}:\s*(.+)", raw, re.IGNORECASE)
+        if match and _valid_summary(match.group(1)):
+            parsed[field] = match.group(1).strip()
+    return parsed
+
+
+def _retry_excerpt(clean_text, field):
+    """補問用的節錄：營養從 Nutrition 段落開始取 (原文中接在摘要之後)，其他欄位從開頭取"""
+    start = clean_text.find("Nutrition") if field == "nutrition" else -1
+    start = max(start, 0)
+    return clean_text[start:start + RETRY_EXCERPT_CHARS]
+
+
+def _shorten_wiki_text_one_call(clean_text, fields=("nutrition", "health"), timeout=None):
+    """
+    單次呼叫 ollama 進行摘要 (JSON 格式輸出)，回傳 {欄位: 內容}；
+    沒有取得有效內容的欄位不會出現在結果中。timeout 為這次呼叫的時間預算 (秒)
+    """
+    if len(fields) == len(SUMMARY_FIELDS):
+        prompt = f"""請閱讀以下水果資訊，並只輸出一個 JSON 物件：
+{{"nutrition": "<{SUMMARY_FIELD_DESCRIPTIONS['nutrition']}>", "health": "<{SUMMARY_FIELD_DESCRIPTIONS['health']}>"}}
+不要添加任何其他多餘文字。
 以下是原始內容：
-{text_no_refs}
+{clean_text}
+"""
+    else:
+        # 補問：只要缺少的欄位，指示文字與內容都盡量短
+        field = fields[0]
+        prompt = f"""只輸出 JSON {{"{field}": "<{SUMMARY_FIELD_DESCRIPTIONS[field]}，一句話>"}}。內容：
+{_retry_excerpt(clean_text, field)}
 """
-    response = ollama.chat(
+    response = _ollama_chat(
+        "summarize",
         model="llama3",
-        messages=[{"role": "user", "content": prompt}]
+        messages=[{"role": "user", "content": prompt}],
+        format="json",
+        timeout=timeout,
     )
-    two_lines = response["message"]["content"].strip()
-    
-    # Debug：檢查 LLM 實際回傳內容
-    print("🔍 LLM 回傳內容(單次呼叫)：", repr(two_lines))
-
-    # 3. 透過正規表示式擷取 (nutrition: ... ) 及 (health: ...)
-    nutrition_match = re.search(r"nutrition:\s*(.+)", two_lines, re.IGNORECASE)
-    health_match = re.search(r"health:\s*(.+)", two_lines, re.IGNORECASE)
+    raw = response["message"]["content"].strip()
 
-    nutrition_line = f"nutrition: {nutrition_match.group(1).strip()}" if nutrition_match else "nutrition: 無"
-    health_line = f"health: {health_match.group(1).strip()}" if health_match else "health: 無"
+    # Debug：檢查 LLM 實際回傳內容
+    print("🔍 LLM 回傳內容(單次呼叫)：", repr(raw))
 
-    return nutrition_line, health_line
+    return _parse_summary(raw, fields)
 
 
-def shorten_wiki_text(main_text, max_retry=3):
+def shorten_wiki_text(main_text, deadline_s=SHORTEN_DEADLINE_S):
     """
-    改為具備 Retry 機制：
-    - 如果第一次 LLM 回傳的 health_line 是 ??? 或 health: 無
-      (或模型沒回 health:)，就再呼叫一次 (最多重試 max_retry 次)
+    回傳 (nutrition_line, health_line)。
+    - 已解析成功的欄位保留，之後只針對缺少的欄位以短 prompt 補問
+    - 以 deadline_s 限制總時間：每次呼叫以剩餘時間為逾時，剩餘時間不足以再做一次呼叫就停止
+    - 最後仍缺少的欄位以「無」代替，不會把已取得的內容丟掉
     """
-    for attempt in range(max_retry):
-        nutrition_line, health_line = _shorten_wiki_text_one_call(main_text)
-
-        # 如果 health_line 裡沒有 ???，且不等於"health: 無"(代表真的有內容)
-        # 就算通過 => 回傳
-        if "???" not in health_line and health_line.lower().strip() != "health: 無":
-            return nutrition_line, health_line
-        
-        print(f"⚠️ 第 {attempt+1} 次回傳健康資訊不完整，重試中...")
+    clean_text = _clean_wiki_text(main_text)
+    deadline = time.monotonic() + deadline_s
+    result = {}
+    calls = 0
+    last_call = 0.0
+
+    while len(result) < len(SUMMARY_FIELDS) and calls < SHORTEN_MAX_CALLS:
+        if calls and time.monotonic() + last_call > deadline:
+            print("⚠️ 摘要已達時間上限，停止補問")
+            break
+        missing = tuple(f for f in SUMMARY_FIELDS if f not in result)
+        if calls:
+            print(f"⚠️ 第 {calls} 次回傳缺少 {', '.join(missing)}，僅針對缺少欄位重試中...")
+            fruit_metrics.inc("fruit_summarize_retries_total")
+
+        started = time.monotonic()
+        try:
+            result.update(_shorten_wiki_text_one_call(clean_text, missing, timeout=deadline - started))
+        except TimeoutError:
+            print("⚠️ 摘要呼叫超過時間上限，停止補問")
+            break
+        last_call = time.monotonic() - started
+        calls += 1
 
-    # 多次嘗試後仍失敗 -> fallback
-    print("⚠️ 多次嘗試後仍無法取得有效 health 資訊，改為無")
-    return "nutrition: 無", "health: 無"
+    if len(result) < len(SUMMARY_FIELDS):
+        print("⚠️ 仍無法取得完整資訊，缺少的欄位改為無")
+    nutrition_line = f"nutrition: {result.get('nutrition', '無')}"
+    health_line = f"health: {result.get('health', '無')}"
+    return nutrition_line, health_line
 
 
 # -----------------------------
 # 辨識水果 (OpenCV frame or image path)
 # -----------------------------
-def identify_fruit(frame=None, image_path=None):
+def identify_fruit(frame=None, image_path=None, image_bytes=None, roi=ROI_CROP, cascade=True):
+    # image_bytes：已編碼的圖片內容 (例如 HTTP 服務收到的 JPEG)，
+    # 直接交給 ollama，不經過共用的 current_frame.jpg，避免並行請求互相覆蓋
+    # roi：frame 先裁出主要物體並縮為 llava 原生輸入大小 (frame 必須是未疊加文字的原始畫面)
+    # cascade：先讓 CASCADE_TIERS 回答，信心不足才用 llava
+    image = None
     if frame is not None:
+        if roi:
+            with fruit_metrics.timed("roi_crop"):
+                frame, _ = fruit_roi.crop_to_fruit(frame)
+        image = frame
         temp_path = "current_frame.jpg"
-        cv2.imwrite(temp_path, frame)
+        with fruit_metrics.timed("jpeg_encode"):
+            cv2.imwrite(temp_path, frame)
         image_source = temp_path
+    elif image_bytes is not None:
+        image_source = image_bytes
     elif image_path is not None:
         if not os.path.exists(image_path):
             print(f"❌ 找不到圖片 {image_path}。")
@@ -147,6 +281,21 @@ def identify_fruit(frame=None, image_path=None):
         print("❌ 未提供圖片來源。")
         return None
 
+    start = time.perf_counter()
+    for tier in (CASCADE_TIERS if cascade else []):
+        if tier == "features" and image is None:
+            with fruit_metrics.timed("image_decode"):
+                if image_bytes is not None:
+                    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+                else:
+                    image = cv2.imread(image_path)
+        label, confidence = _cascade_tier(tier, image, image_source)
+        if label in ALLOWED_FRUITS and confidence >= CASCADE_CONFIDENCE:
+            _record_cascade(tier, time.perf_counter() - start)
+            _trace_identify(image_source, label, label, time.perf_counter() - start, model=tier)
+            return label
+        fruit_metrics.inc("fruit_cascade_escalations_total", tier=tier)
+
     llava_prompt = """
     Please analyze this image and output only a single fruit name (for example,
     "Apple", "Banana", "Grape", "Kiwi", "Mango", "Orange", "Strawberry",
@@ -155,7 +304,8 @@ def identify_fruit(frame=None, image_path=None):
     numbers, or explanation.
     """
 
-    response = ollama.chat(
+    response = _ollama_chat(
+        "classify",
         model="llava",
         messages=[{
             "role": "user",
@@ -168,41 +318,171 @@ def identify_fruit(frame=None, image_path=None):
     recognized = match.group(1) if match else fruit_result
     recognized = recognized.title()
     recognized = re.sub(r"[^A-Za-z ]", "", recognized).strip()
+    allowed = recognized in ALLOWED_FRUITS
+    _record_cascade("llava", time.perf_counter() - start)
+    _trace_identify(image_source, recognized if allowed else None, recognized, time.perf_counter() - start)
 
-    if recognized not in ALLOWED_FRUITS:
+    if not allowed:
         print(f"辨識結果 '{recognized}' 不在允許清單中。")
+        fruit_metrics.inc("fruit_recognition_rejected_total")
         return None
 
     return recognized
 
+
+# -----------------------------
+# 辨識串接的各層級與統計
+# -----------------------------
+SMALL_MODEL_PROMPT = (
+    'Which fruit is in this image? Reply in JSON as {"fruit": "<name>", "confidence": <0 to 1>}. '
+    "Use a low confidence if you are unsure."
+)
+
+
+def _cascade_tier(tier, image, image_source):
+    """回傳 (標籤, 信心值)；層級無法作答時回傳 (None, 0.0)"""
+    if tier == "features":
+        classifier = fruit_classifier.load_classifier()
+        if classifier is None or image is None:
+            return None, 0.0
+        with fruit_metrics.timed("classify_features"):
+            return classifier.predict(image)
+    if tier.startswith("ollama:"):
+        response = _ollama_chat(
+            "classify",
+            model=tier.split(":", 1)[1],
+            format="json",
+            messages=[{"role": "user", "content": SMALL_MODEL_PROMPT, "images": [image_source]}],
+        )
+        try:
+            data = json.loads(response["message"]["content"])
+            label = re.sub(r"[^A-Za-z ]", "", str(data.get("fruit", ""))).strip().title()
+            return label, float(data.get("confidence", 0.0))
+        except (ValueError, TypeError, AttributeError):
+            return None, 0.0
+    print(f"⚠️ 未知的辨識層級 '{tier}'，略過。")
+    return None, 0.0
+
+
+def _record_cascade(tier, latency):
+    fruit_metrics.inc("fruit_cascade_served_total", tier=tier)
+    fruit_metrics.observe("fruit_cascade_seconds", latency, tier=tier)
+
+
+def cascade_stats():
+    """各層級處理的辨識比例與平均延遲 (從請求開始計)，以及整體平均辨識延遲"""
+    tiers = {tier: fruit_metrics.get_histogram("fruit_cascade_seconds", tier=tier)
+             for tier in CASCADE_TIERS + ["llava"]}
+    total = sum(count for count, _ in tiers.values())
+    return {
+        "requests": total,
+        "mean_latency_s": round(sum(s for _, s in tiers.values()) / total, 4) if total else 0.0,
+        "tiers": {
+            tier: {
+                "served": count,
+                "fraction": round(count / total, 4) if total else 0.0,
+                "avg_latency_s": round(latency_sum / count, 4) if count else 0.0,
+            }
+            for tier, (count, latency_sum) in tiers.items()
+        },
+    }
+
+
+def _trace_identify(image_source, fruit, raw_label, latency, model="llava"):
+    """記錄辨識事件；輸入圖片以內容雜湊存檔，供 trace_replay.py 重播"""
+    if not fruit_trace.tracing_enabled():
+        return
+    if isinstance(image_source, bytes):
+        digest = fruit_trace.hash_bytes(image_source)
+        saved = fruit_trace.save_trace_image(digest, image_bytes=image_source)
+    else:
+        digest = fruit_trace.hash_file(image_source)
+        saved = fruit_trace.save_trace_image(digest, image_path=image_source)
+    fruit_trace.record_event(
+        "identify", input_hash=digest, image=saved, fruit=fruit, raw_label=raw_label,
+        model=model, latency_s=round(latency, 4),
+    )
+
+
+# -----------------------------
+# 多水果辨識：先找候選區域，再並行分類每個區域
+# -----------------------------
+def _classify_region(frame, box):
+    crop = fruit_roi.square_crop(frame, box)
+    ok, encoded = cv2.imencode(".jpg", crop)
+    if not ok:
+        return None
+    return identify_fruit(image_bytes=encoded.tobytes())
+
+
+def identify_fruits(frame, max_regions=fruit_roi.MAX_REGIONS):
+    """
+    回傳 [(水果名稱, (x, y, w, h)), ...]。llava 一次只能可靠地判斷一張圖，
+    所以各區域分別裁切後以並行批次送出，而不是合成一個多圖請求
+    """
+    with fruit_metrics.timed("propose_regions"):
+        boxes = fruit_roi.propose_regions(frame, max_regions)
+    if not boxes:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(REGION_WORKERS, len(boxes)))) as pool:
+        labels = list(pool.map(lambda box: _classify_region(frame, box), boxes))
+    return [(label, box) for label, box in zip(labels, boxes) if label]
+
+
+def draw_detections(image, detections):
+    for label, (x, y, w, h) in detections:
+        cv2.rectangle(image, (x, y), (x + w, y + h), (0, 255, 0), 2)
+        cv2.putText(image, label, (x + 5, max(y - 8, 20)), cv2.FONT_HERSHEY_SIMPLEX, 0.75, (0, 255, 0), 2)
+
 # -----------------------------
 # 從 Wikipedia 獲取水果資訊 (自動拆分成 nutrition 與 health 兩行)
 # -----------------------------
-def fetch_fruit_info_online(fruit_name):
+class _WikipediaSession(requests.Session):
+    """wikipedia 套件以模組層級的 requests.get 發請求；換成帶預設逾時的 session"""
+
+    def request(self, *args, **kwargs):
+        kwargs.setdefault("timeout", WIKIPEDIA_TIMEOUT_S)
+        return super().request(*args, **kwargs)
+
+
+wikipedia.wikipedia.requests = _WikipediaSession()
+
+
+def fetch_fruit_info_online(fruit_name, on_text=None):
+    """on_text：取得 Wikipedia 原文 (摘要前) 時呼叫，供逾時時組出部分答案"""
     try:
-        wikipedia.set_lang("en")
+        if WIKIPEDIA_API_URL:
+            # API_URL 定義在套件內的 wikipedia.wikipedia 模組；
+            # 不呼叫 set_lang，避免並行建置時被重設回 en.wikipedia.org
+            wikipedia.wikipedia.API_URL = WIKIPEDIA_API_URL
+        else:
+            wikipedia.set_lang("en")
         query_name = fruit_name if fruit_name.lower() != "pear" else "Pear (fruit)"
 
-        # 只抓 2 句 summary
-        main_summary = wikipedia.summary(query_name, sentences=2)
+        with fruit_metrics.timed("wikipedia"):
+            # 只抓 2 句 summary
+            main_summary = wikipedia.summary(query_name, sentences=2)
 
-        # 從完整頁面擷取 Nutrition 區塊（若有）
-        page = wikipedia.page(query_name)
-        content = page.content
+            # 從完整頁面擷取 Nutrition 區塊（若有）
+            page = wikipedia.page(query_name)
+            content = page.content
         idx = content.find("Nutrition")
         nutrition_excerpt = ""
         if idx != -1:
             nutrition_excerpt = content[idx:idx+300]
 
         combined_text = main_summary + "\n" + nutrition_excerpt
+        if on_text:
+            on_text(combined_text)
 
-        # 讓模型只輸出兩行 (帶有 Retry)
-        nutrition_line, health_line = shorten_wiki_text(combined_text, max_retry=3)
+        # 讓模型只輸出兩行 (缺欄位時只補問缺少的部分，總時間有上限)
+        nutrition_line, health_line = shorten_wiki_text(combined_text)
 
-        # 回傳兩行分別給 dictionary
+        # 回傳兩行分別給 dictionary；extract 為摘要前的原文 (知識包保存，供 ollama_tuner 量測摘要)
         return {
             "nutrition": nutrition_line,
-            "health_benefits": health_line
+            "health_benefits": health_line,
+            "extract": combined_text,
         }
 
     except wikipedia.DisambiguationError as e:
@@ -212,61 +492,352 @@ def fetch_fruit_info_online(fruit_name):
         print(f"⚠️ Wikipedia 擷取失敗: {e}")
         return None
 
+
+def _first_sentences(text, max_chars=200):
+    """取開頭幾句完整的句子 (不超過 max_chars)；沒有句點時直接截斷"""
+    text = text.strip()
+    if len(text) <= max_chars:
+        return text
+    cut = max(text.rfind(mark, 0, max_chars) for mark in ".!?。")
+    return text[:cut + 1] if cut > 0 else text[:max_chars]
+
+
+def _partial_info(fruit_name, wiki_text):
+    """LLM 摘要來不及完成時，直接從 Wikipedia 原文取句子當作部分答案"""
+    summary, _, excerpt = wiki_text.partition("\n")
+    excerpt = re.sub(r"^Nutrition[\s=]*", "", excerpt)
+    nutrition = _first_sentences(_clean_wiki_text(excerpt)) or "無"
+    health = _first_sentences(_clean_wiki_text(summary)) or "無"
+    return {
+        "fruit": fruit_name,
+        "nutrition": f"nutrition: {nutrition}",
+        "health_benefits": f"health: {health}",
+        "partial": True,
+    }
+
+
 # -----------------------------
-# 先查 JSON，若無，再查 Wikipedia
+# 線上查詢 (Wikipedia + LLM 摘要) 在背景執行緒進行：
+# 呼叫端只等到自己的期限為止，不會取消已送出的請求；完成的結果寫入快取，
+# 同一水果同時間只有一個查詢，之後的呼叫會接上進行中的那一個。
+# 每個查詢一條 daemon 執行緒：卡住的查詢不會佔住其他水果的名額，也不會讓程式無法結束；
+# 超過 ONLINE_LOOKUP_EXPIRE_S 的查詢不再被接上，改開新的
 # -----------------------------
-def get_fruit_info(fruit_name):
-    if not os.path.exists(FRUIT_JSON_PATH):
-        print(f"❌ 找不到 {FRUIT_JSON_PATH}，請確認路徑。")
-        sys.exit(1)
+_online_lock = threading.Lock()
+_online_cache = OrderedDict()   # 小寫水果名 -> 完整的 info
+_online_inflight = {}           # 小寫水果名 -> _OnlineLookup
+
+
+class _OnlineLookup:
+    def __init__(self, fruit_name):
+        self.fruit_name = fruit_name
+        self.wiki_text = None
+        self.started = time.monotonic()
+        self.future = Future()
+
+    def _set_text(self, text):
+        self.wiki_text = text
+
+    def start(self):
+        threading.Thread(target=self.run, name=f"fruit-info-{self.fruit_name}", daemon=True).start()
+
+    def expired(self, now):
+        return now - self.started > ONLINE_LOOKUP_EXPIRE_S
+
+    def run(self):
+        key = self.fruit_name.lower()
+        try:
+            wiki_info = fetch_fruit_info_online(self.fruit_name, on_text=self._set_text)
+            info = None
+            if wiki_info:
+                info = {
+                    "fruit": self.fruit_name,
+                    "nutrition": wiki_info.get("nutrition", "nutrition: 無"),
+                    "health_benefits": wiki_info.get("health_benefits", "health: 無"),
+                }
+                with _online_lock:
+                    _online_cache[key] = info
+                    _online_cache.move_to_end(key)
+                    while len(_online_cache) > ONLINE_CACHE_MAX:
+                        _online_cache.popitem(last=False)
+            self.future.set_result(info)
+        except Exception as e:
+            self.future.set_exception(e)
+        finally:
+            with _online_lock:
+                # 已過期被取代時，不要移除新的那一個
+                if _online_inflight.get(key) is self:
+                    del _online_inflight[key]
+
+    def result(self, deadline):
+        """等到 deadline (time.monotonic 時間，None = 不設限)；逾時回傳部分資訊或 None"""
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            return self.future.result(timeout=timeout), False
+        except FutureTimeoutError:
+            text = self.wiki_text
+            return (_partial_info(self.fruit_name, text) if text else None), True
+
+
+def _start_online_lookup(fruit_name):
+    key = fruit_name.lower()
+    with _online_lock:
+        lookup = _online_inflight.get(key)
+        if lookup is not None and lookup.expired(time.monotonic()):
+            print(f"⚠️ '{fruit_name}' 的線上查詢已超過 {ONLINE_LOOKUP_EXPIRE_S} 秒，重新查詢。")
+            fruit_metrics.inc("fruit_info_lookups_expired_total")
+            lookup = None
+        if lookup is None:
+            lookup = _online_inflight[key] = _OnlineLookup(fruit_name)
+            lookup.start()
+    return lookup
+
+
+def clear_online_cache():
+    with _online_lock:
+        _online_cache.clear()
+
+
+# -----------------------------
+# 先查 JSON，再查離線知識包與線上查詢快取，若都沒有才查 Wikipedia
+# -----------------------------
+_dataset_warned = False
 
+
+def load_fruit_dataset():
+    global _dataset_warned
+    if not os.path.exists(FRUIT_JSON_PATH):
+        if not _dataset_warned:
+            print(f"❌ 找不到 {FRUIT_JSON_PATH}，請確認路徑；改用知識包與線上查詢。")
+            _dataset_warned = True
+        return []
     with open(FRUIT_JSON_PATH, "r", encoding="utf-8") as file:
-        fruit_data = json.load(file)
+        return json.load(file)
+
+
+def _local_fruit_info(fruit_name, dataset=None):
+    """資料集 → 離線知識包 → 線上查詢快取；回傳 (info, 來源)，都沒有時回傳 (None, None)"""
+    if dataset is None:
+        with fruit_metrics.timed("json_lookup"):
+            dataset = {f["fruit"].lower(): f for f in load_fruit_dataset()}
+    info = dataset.get(fruit_name.lower())
+    if info:
+        return info, "dataset"
 
-    info = next((f for f in fruit_data if f["fruit"].lower() == fruit_name.lower()), None)
+    with fruit_metrics.timed("knowledge_pack_lookup"):
+        info = knowledge_pack.lookup(fruit_name, KNOWLEDGE_PACK_PATH)
     if info:
+        return info, "knowledge_pack"
+
+    with _online_lock:
+        info = _online_cache.get(fruit_name.lower())
+    if info:
+        return info, "cache"
+    return None, None
+
+
+def _finish_online_lookup(fruit_name, lookup, deadline, start):
+    info, timed_out = lookup.result(deadline)
+    if timed_out:
+        source = "partial" if info else "none"
+        print(f"⚠️ '{fruit_name}' 的線上查詢超過時間預算，"
+              f"{'先顯示部分資訊' if info else '暫無資訊'}，完整結果會在背景完成。")
+        fruit_metrics.inc("fruit_info_deadline_exceeded_total")
+    else:
+        source = "wikipedia" if info else "none"
+    fruit_metrics.inc("fruit_info_lookups_total", source=source)
+    fruit_trace.record_event("info", fruit=fruit_name, source=source if info else None,
+                             cache_hit=False, model="llama3",
+                             latency_s=round(time.perf_counter() - start, 4))
+    return info
+
+
+def get_fruit_info(fruit_name, deadline_s=INFO_DEADLINE_S):
+    """
+    依序查資料集、離線知識包、線上查詢快取，都沒有才查 Wikipedia + LLM 摘要。
+    deadline_s 是整體時間預算 (None = 不設限)：逾時回傳從 Wikipedia 原文取出的部分資訊
+    ("partial": True，連原文都還沒拿到時回傳 None)，完整結果在背景寫入快取
+    """
+    start = time.perf_counter()
+    deadline = None if deadline_s is None else time.monotonic() + deadline_s
+
+    info, source = _local_fruit_info(fruit_name)
+    if info:
+        fruit_metrics.inc("fruit_info_lookups_total", source=source)
+        fruit_trace.record_event("info", fruit=fruit_name, source=source, cache_hit=True,
+                                 latency_s=round(time.perf_counter() - start, 4))
         return info
 
+    if OFFLINE_ONLY:
+        print(f"⚠️ 離線模式：資料庫與知識包中都沒有 '{fruit_name}' 的資訊。")
+        fruit_metrics.inc("fruit_info_lookups_total", source="none")
+        return None
+
     print(f"⚠️ 資料庫中無 '{fruit_name}' 的資訊，改從 Wikipedia 搜尋...")
-    wiki_info = fetch_fruit_info_online(fruit_name)
-    if wiki_info:
-        return {
-            "fruit": fruit_name,
-            "nutrition": wiki_info.get("nutrition", "nutrition: 無"),
-            "health_benefits": wiki_info.get("health_benefits", "health: 無"),
-        }
-    return None
+    return _finish_online_lookup(fruit_name, _start_online_lookup(fruit_name), deadline, start)
+
+def get_fruit_infos(fruit_names, deadline_s=INFO_DEADLINE_S):
+    """
+    一次查詢多種水果，回傳 {水果名稱: info 或 None}。
+    資料集只讀取一次；需要線上查詢的水果同時開始，共用同一個時間預算
+    """
+    start = time.perf_counter()
+    deadline = None if deadline_s is None else time.monotonic() + deadline_s
+    names = list(dict.fromkeys(fruit_names))
+    with fruit_metrics.timed("json_lookup"):
+        by_name = {f["fruit"].lower(): f for f in load_fruit_dataset()}
+
+    result = {}
+    lookups = {}
+    for name in names:
+        info, source = _local_fruit_info(name, by_name)
+        if info:
+            fruit_metrics.inc("fruit_info_lookups_total", source=source)
+            result[name] = info
+        elif OFFLINE_ONLY:
+            fruit_metrics.inc("fruit_info_lookups_total", source="none")
+            result[name] = None
+        else:
+            lookups[name] = _start_online_lookup(name)
+    for name, lookup in lookups.items():
+        result[name] = _finish_online_lookup(name, lookup, deadline, start)
+    return {name: result[name] for name in names}
 
 # -----------------------------
 # 使用 LLM 針對水果作 Q&A
 # -----------------------------
-def query_ai_for_fruit(fruit_name, fruit_info, query_type="general", question=None):
+ANSWER_SYSTEM_PROMPT = """You are a fruit expert. Answer the user's questions about the fruit below concisely in English.
+Use the facts provided; if they are insufficient, use your general knowledge about this fruit."""
+
+# 對話模式：對話歷史存在 fruit_sessions 的 session 中 (每個水果一份 messages)
+# 水果資料只放在第一則 system 訊息，之後每輪只附加新問題；
+# 前綴不變，Ollama 會沿用已計算的 KV cache，只需 prefill 新加入的 token
+
+
+def _relevant_fields(question):
+    """依意圖路由判斷問題只需要哪一個欄位，縮短 prompt"""
+    intents = fruit_intents.route(question)
+    if "conditions" in intents:
+        # 疾病 / 風險問題需要營養數據與健康敘述一起判斷
+        return ("nutrition", "health_benefits")
+    wants_health = "health_benefits" in intents
+    wants_nutrition = any(intent != "health_benefits" for intent in intents)
+    if wants_nutrition == wants_health:
+        return ("nutrition", "health_benefits")
+    return ("nutrition",) if wants_nutrition else ("health_benefits",)
+
+
+def _fruit_facts(fruit_name, fruit_info, fields=("nutrition", "health_benefits")):
+    lines = [f"Fruit: {fruit_name}"]
+    if "nutrition" in fields:
+        lines.append(f"Nutrition: {fruit_info.get('nutrition', 'Not available')}")
+    if "health_benefits" in fields:
+        lines.append(f"Health benefits: {fruit_info.get('health_benefits', 'Not available')}")
+    return "\n".join(lines)
+
+
+def _session_system(session, fruit_name, fruit_info):
     """
-    - query_type 可為 'calories', 'vitamins', 'health_benefits', 或 'general'
-    - 若為 general，則將所有資訊帶入 prompt，讓模型自由回答
+    回傳這個水果的 system prompt。session 既有的對話是以不同的 fruit_info 建立時
+    (例如先前線上查詢只拿到部分或空的結果)，清除依舊資訊得到的對話與答案快取
     """
-    if query_type == "calories":
-        return "解析卡路里資訊 (示範)"
-    elif query_type == "vitamins":
-        return "解析維生素資訊 (示範)"
-    elif query_type == "health_benefits":
-        return "解析健康益處 (示範)"
-    else:
-        prompt = f"""You are an expert in fruits, including their nutritional value and health benefits.
-Please answer the user's question based on the following information. If the provided data is insufficient,
-you may incorporate your general knowledge about this fruit. Please respond concisely in English.
+    system = f"{ANSWER_SYSTEM_PROMPT}\n\n{_fruit_facts(fruit_name, fruit_info)}"
+    with session.lock:
+        messages = session.chat(fruit_name)
+        if messages is not None and messages[0]["content"] != system:
+            session.reset(fruit_name)
+    return system
+
+
+def _session_messages(session, fruit_name, system, question):
+    """取得 (或建立) 對話歷史，並附上新問題；回傳送出用的 messages 副本"""
+    with session.lock:
+        messages = session.chat(fruit_name, create=[{"role": "system", "content": system}])
+        # 每輪 = user + assistant 兩則；達到上限時一次丟掉較舊的一半，只留最近的幾輪。
+        # 不逐輪丟棄：前綴在接下來幾輪保持不變，Ollama 才能沿用快取的 KV
+        if len(messages) - 1 >= CHAT_SESSION_MAX_TURNS * 2:
+            del messages[1:len(messages) - (CHAT_SESSION_MAX_TURNS // 2) * 2]
+        return messages + [{"role": "user", "content": question}]
+
+
+def _remember_turn(session_id, fruit_name, question, answer):
+    session = fruit_sessions.get_session(session_id, create=False)
+    if session is None:
+        return
+    with session.lock:
+        messages = session.chat(fruit_name)
+        if messages is not None:
+            messages.append({"role": "user", "content": question})
+            messages.append({"role": "assistant", "content": answer})
 
-Fruit name: {fruit_name}
-Nutrition info: {fruit_info.get('nutrition', 'nutrition: Not available')}
-Health benefits: {fruit_info.get('health_benefits', 'health: Not available')}
 
-The user's question is: "{question}"
-"""
-        response = ollama.chat(
-            model="llama3",
-            messages=[{"role": "user", "content": prompt}]
-        )
-        return response["message"]["content"]
+def reset_chat_session(session_id, fruit_name=None):
+    """清除某個 session 的對話歷史與答案快取；fruit_name 為 None 時清除該 session 全部水果"""
+    session = fruit_sessions.get_session(session_id, create=False)
+    if session is not None:
+        session.reset(fruit_name)
+
+
+def query_ai_for_fruit(fruit_name, fruit_info, query_type="general", question=None, session_id=None):
+    """
+    - query_type 為 fruit_intents 的意圖 ('calories', 'vitamins', 'health_benefits' ...) 或 'general'
+    - general 時先以意圖路由分析問題，能從水果資料直接回答就不呼叫 LLM
+    - 其餘交給 llama3 回答：
+      * session_id 為 None：單次問答，prompt 只帶問題需要的欄位
+      * 指定 session_id：沿用該 session 對這個水果的對話歷史，水果資料只 prefill 一次；
+        同一個 session 重複問同樣的問題時直接回傳先前的答案
+    """
+    start = time.perf_counter()
+    fruit_info = fruit_info or {}
+    if query_type == "general":
+        answer, intents = fruit_intents.answer_question(fruit_name, fruit_info, question)
+    else:
+        intents = [query_type]
+        answer = fruit_intents.answer(fruit_name, fruit_info, intents)
+        question = question or f"Tell me about the {query_type.replace('_', ' ')} of {fruit_name}."
+    if answer is not None:
+        fruit_metrics.inc("fruit_answers_total", route="intent")
+        if session_id is not None:
+            _remember_turn(session_id, fruit_name, question, answer)
+        fruit_trace.record_event("ask", fruit=fruit_name, question=question, query_type=query_type,
+                                 intents=intents, model=None, session_id=session_id,
+                                 latency_s=round(time.perf_counter() - start, 4))
+        return answer
+
+    session = fruit_sessions.get_session(session_id) if session_id is not None else None
+    system = _session_system(session, fruit_name, fruit_info) if session else None
+    cache_key = " ".join((question or "").lower().split())
+    cached = session.cached_answer(fruit_name, cache_key) if session else None
+    if cached is not None:
+        fruit_metrics.inc("fruit_answers_total", route="cache")
+        fruit_trace.record_event("ask", fruit=fruit_name, question=question, query_type=query_type,
+                                 model=None, session_id=session_id, cache_hit=True,
+                                 latency_s=round(time.perf_counter() - start, 4))
+        return cached
+
+    fruit_metrics.inc("fruit_answers_total", route="llm")
+    if session_id is None:
+        facts = _fruit_facts(fruit_name, fruit_info, _relevant_fields(question))
+        messages = [
+            {"role": "system", "content": f"{ANSWER_SYSTEM_PROMPT}\n\n{facts}"},
+            {"role": "user", "content": question},
+        ]
+    else:
+        messages = _session_messages(session, fruit_name, system, question)
+
+    response = _ollama_chat(
+        "answer",
+        model="llama3",
+        messages=messages
+    )
+    answer = response["message"]["content"]
+    if session is not None:
+        _remember_turn(session_id, fruit_name, question, answer)
+        session.remember_answer(fruit_name, cache_key, answer)
+    fruit_trace.record_event("ask", fruit=fruit_name, question=question, query_type=query_type,
+                             model="llama3", session_id=session_id, cache_hit=False,
+                             latency_s=round(time.perf_counter() - start, 4))
+    return answer
 
 # -----------------------------
 # 顯示水果資訊 (兩行)
@@ -313,14 +884,8 @@ def voice_chat(access_token, fruit_name_on_screen, local_fruit_info):
     question = recognize_speech_with_wit(audio_file, access_token)
     if question:
         print("Wit.ai recognized question:", question)
-        if "calorie" in question.lower() or "卡路里" in question:
-            answer = query_ai_for_fruit(fruit_name_on_screen, local_fruit_info, query_type="calories")
-        elif "vitamin" in question.lower() or "維生素" in question:
-            answer = query_ai_for_fruit(fruit_name_on_screen, local_fruit_info, query_type="vitamins")
-        elif "health" in question.lower() or "益處" in question:
-            answer = query_ai_for_fruit(fruit_name_on_screen, local_fruit_info, query_type="health_benefits")
-        else:
-            answer = query_ai_for_fruit(fruit_name_on_screen, local_fruit_info, question=question)
+        answer = query_ai_for_fruit(fruit_name_on_screen, local_fruit_info, question=question,
+                                    session_id=LOCAL_SESSION_ID)
         print("AI answer:", answer)
     else:
         print("No speech detected.")
@@ -349,115 +914,196 @@ def combined_operation_with_frame(frame, access_token):
         print("未偵測到語音。")
         return
 
-    # 按關鍵字判斷
-    if "calorie" in voice_command.lower() or "卡路里" in voice_command:
-        answer = query_ai_for_fruit(fruit_name_on_screen, local_fruit_info, query_type="calories")
-    elif "vitamin" in voice_command.lower() or "維生素" in voice_command:
-        answer = query_ai_for_fruit(fruit_name_on_screen, local_fruit_info, query_type="vitamins")
-    elif "health" in voice_command.lower() or "益處" in voice_command:
-        answer = query_ai_for_fruit(fruit_name_on_screen, local_fruit_info, query_type="health_benefits")
-    else:
-        answer = query_ai_for_fruit(fruit_name_on_screen, local_fruit_info, question=voice_command)
+    # 意圖路由能從資料回答的問題直接回答，其餘才交給 llama3
+    answer = query_ai_for_fruit(fruit_name_on_screen, local_fruit_info, question=voice_command,
+                                session_id=LOCAL_SESSION_ID)
 
     print("AI answer:", answer)
 
 # -----------------------------
 # 啟動 Webcam 模式
 # -----------------------------
+CAMERA_INDEX = 4  # 視需求調整攝影機編號
+
+
+def open_camera(index=CAMERA_INDEX, width=640, height=480, fps=15):
+    cap = cv2.VideoCapture(index, cv2.CAP_V4L2)
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    cap.set(cv2.CAP_PROP_FPS, fps)
+    return cap
+
+
+class WebcamState:
+    """畫面上顯示的辨識結果；視窗模式與 headless_webcam.py 共用同一套指令"""
+
+    COMMANDS = {
+        "o": "identify the fruit",
+        "m": "identify every fruit in view",
+        "s": "voice recognition",
+        "c": "voice chat",
+        "x": "combined operation",
+    }
+
+    def __init__(self, access_token=WIT_ACCESS_TOKEN):
+        self.access_token = access_token
+        self.fruit_name = ""
+        self.nutrition = ""
+        self.health_benefits = ""
+        self.fruit_info = {}
+        self.voice_command = ""
+        self.detections = []
+        # 執行中的指令說明 (空字串表示閒置)，畫面上會顯示
+        self.busy = ""
+
+    def run_command(self, command, frame):
+        """handle_command 並在執行期間標記 busy；供背景執行緒呼叫"""
+        self.busy = self.COMMANDS.get(command, command)
+        try:
+            return self.handle_command(command, frame)
+        finally:
+            self.busy = ""
+
+    def handle_command(self, command, frame):
+        """執行一個指令；frame 必須是未疊加文字的原始畫面。未知指令回傳 False"""
+        if command == "o":
+            self.detections = []
+            self.fruit_name = identify_fruit(frame=frame)
+            if self.fruit_name:
+                self.fruit_info = get_fruit_info(self.fruit_name)
+                if self.fruit_info:
+                    self.nutrition = self.fruit_info.get("nutrition", "nutrition: 無")
+                    self.health_benefits = self.fruit_info.get("health_benefits", "health: 無")
+                else:
+                    self.nutrition = "nutrition: 無"
+                    self.health_benefits = "health: 無"
+        elif command == "m":
+            self.detections = identify_fruits(frame)
+            labels = [label for label, _ in self.detections]
+            self.fruit_name = ", ".join(labels)
+            infos = get_fruit_infos(labels)
+            for label in infos:
+                display_fruit_info(infos[label])
+            # 畫面上的營養資訊顯示第一個 (面積最大) 的水果
+            self.fruit_info = infos[labels[0]] if labels and infos[labels[0]] else {}
+            self.nutrition = self.fruit_info.get("nutrition", "nutrition: 無")
+            self.health_benefits = self.fruit_info.get("health_benefits", "health: 無")
+        elif command == "s":
+            audio_file = record_audio_pyaudio(duration=3)
+            recognized = recognize_speech_with_wit(audio_file, self.access_token)
+            if recognized:
+                self.voice_command = recognized
+                print("Wit.ai recognized voice:", self.voice_command)
+            else:
+                self.voice_command = "No voice command detected."
+        elif command == "c":
+            print(f"\nVoice Chat Mode about {self.fruit_name}:")
+            voice_chat(self.access_token, self.fruit_name, self.fruit_info)
+        elif command == "x":
+            combined_operation_with_frame(frame, self.access_token)
+        else:
+            return False
+        return True
+
+    def snapshot(self):
+        return {
+            "fruit": self.fruit_name or "",
+            "nutrition": self.nutrition,
+            "health_benefits": self.health_benefits,
+            "voice": self.voice_command,
+            "detections": [{"fruit": label, "box": list(box)} for label, box in self.detections],
+            "busy": self.busy,
+        }
+
+
+def draw_overlay(frame, state, max_width=800):
+    """在 frame 的副本上畫出辨識結果；frame 保持乾淨供辨識使用"""
+    display = frame.copy()
+
+    # 顯示 Fruit 名稱
+    fruit_lines = wrap_text(f"Fruit: {state.fruit_name}", cv2.FONT_HERSHEY_SIMPLEX, 1, 2, max_width)
+    line_y = 50
+    for line in fruit_lines:
+        cv2.putText(display, line, (10, line_y), cv2.FONT_HERSHEY_SIMPLEX, 0.75, (255, 255, 255), 1)
+        line_y += 25
+
+    # 顯示 nutrition
+    nutrition_lines = wrap_text(state.nutrition, cv2.FONT_HERSHEY_SIMPLEX, 1, 1, max_width)
+    ny = 100
+    for line in nutrition_lines:
+        cv2.putText(display, line, (10, ny), cv2.FONT_HERSHEY_SIMPLEX, 0.75, (0, 0, 0), 1)
+        ny += 25
+
+    # 顯示 health
+    ny += 30
+    health_lines = wrap_text(state.health_benefits, cv2.FONT_HERSHEY_SIMPLEX, 1, 1, max_width)
+    for line in health_lines:
+        cv2.putText(display, line, (10, ny), cv2.FONT_HERSHEY_SIMPLEX, 0.75, (0, 0, 0), 1)
+        ny += 25
+
+    # 顯示語音內容
+    cv2.putText(display, f"Voice: {state.voice_command}", (10, ny + 30), cv2.FONT_HERSHEY_SIMPLEX, 0.75, (0, 0, 255), 1)
+
+    # 多水果模式的外框
+    draw_detections(display, state.detections)
+
+    # 指令在背景執行時提示使用者
+    if state.busy:
+        cv2.putText(display, f"{state.busy}...", (10, display.shape[0] - 15),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.75, (0, 255, 255), 2)
+    return display
+
+
 def run_webcam_mode():
-    cap = cv2.VideoCapture(4, cv2.CAP_V4L2)  # 視需求調整攝影機編號
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-    cap.set(cv2.CAP_PROP_FPS, 15)
+    cap = open_camera()
 
     if not cap.isOpened():
         print("無法開啟攝影機。")
         sys.exit(1)
 
-    fruit_name_on_screen = ""
-    nutrition_on_screen = ""
-    health_benefits_on_screen = ""
-    local_fruit_info = {}
-    voice_command = ""
+    state = WebcamState()
 
-    print("Press 'o' to identify the fruit, 's' for voice recognition,")
+    print("Press 'o' to identify the fruit, 'm' to identify every fruit in view, 's' for voice recognition,")
     print("Press 'c' for voice chat, 'x' for combined operation, 'q' to quit.")
 
     cv2.namedWindow("Fruit Information", cv2.WINDOW_NORMAL)
     cv2.resizeWindow("Fruit Information", 850, 600)
     cv2.moveWindow("Fruit Information", 100, 200)
 
-    max_width = 800
-    fruit_name_y_pos = 50
-    y_pos = 100
+    # 麥克風一開始就開啟並持續錄進環形緩衝區，第一次按 s / c / x 就不必等裝置、也有 pre-roll
+    audio_stream.open_stream()
 
-    access_token = WIT_ACCESS_TOKEN
+    # 指令在背景執行緒依序執行，畫面持續更新；推論進行中由 governor 降低擷取頻率
+    governor = capture_governor.CaptureGovernor(cap)
+    commands = ThreadPoolExecutor(max_workers=1, thread_name_prefix="webcam-command")
+    pending = None
 
     while True:
-        ret, frame = cap.read()
+        with fruit_metrics.timed("capture"):
+            ret, frame = governor.read()
         if not ret:
             break
 
-        # 顯示 Fruit 名稱
-        fruit_lines = wrap_text(f"Fruit: {fruit_name_on_screen}", cv2.FONT_HERSHEY_SIMPLEX, 1, 2, max_width)
-        line_y = fruit_name_y_pos
-        for line in fruit_lines:
-            cv2.putText(frame, line, (10, line_y), cv2.FONT_HERSHEY_SIMPLEX, 0.75, (255, 255, 255), 1)
-            line_y += 25
-
-        # 顯示 nutrition
-        nutrition_lines = wrap_text(nutrition_on_screen, cv2.FONT_HERSHEY_SIMPLEX, 1, 1, max_width)
-        ny = y_pos
-        for line in nutrition_lines:
-            cv2.putText(frame, line, (10, ny), cv2.FONT_HERSHEY_SIMPLEX, 0.75, (0, 0, 0), 1)
-            ny += 25
-
-        # 顯示 health
-        ny += 30
-        health_lines = wrap_text(health_benefits_on_screen, cv2.FONT_HERSHEY_SIMPLEX, 1, 1, max_width)
-        for line in health_lines:
-            cv2.putText(frame, line, (10, ny), cv2.FONT_HERSHEY_SIMPLEX, 0.75, (0, 0, 0), 1)
-            ny += 25
-
-        # 顯示語音內容
-        cv2.putText(frame, f"Voice: {voice_command}", (10, ny + 30), cv2.FONT_HERSHEY_SIMPLEX, 0.75, (0, 0, 255), 1)
-
-        cv2.imshow("Fruit Information", frame)
-        key = cv2.waitKey(1) & 0xFF
+        cv2.imshow("Fruit Information", draw_overlay(frame, state))
+        key = cv2.waitKey(governor.wait_ms()) & 0xFF
         if key == ord('q'):
             break
-        elif key == ord('o'):
-            fruit_name_on_screen = identify_fruit(frame=frame)
-            if fruit_name_on_screen:
-                local_fruit_info = get_fruit_info(fruit_name_on_screen)
-                if local_fruit_info:
-                    nutrition_on_screen = local_fruit_info.get("nutrition", "nutrition: 無")
-                    health_benefits_on_screen = local_fruit_info.get("health_benefits", "health: 無")
-                else:
-                    nutrition_on_screen = "nutrition: 無"
-                    health_benefits_on_screen = "health: 無"
-            ny = y_pos  # 重置顯示位置
-        elif key == ord('s'):
-            audio_file = record_audio_pyaudio(duration=3)
-            recognized = recognize_speech_with_wit(audio_file, access_token)
-            if recognized:
-                voice_command = recognized
-                print("Wit.ai recognized voice:", voice_command)
+        elif key != 0xFF and chr(key) in WebcamState.COMMANDS:
+            if pending is not None and not pending.done():
+                print(f"⏳ 正在執行「{state.busy}」，請稍候。")
             else:
-                voice_command = "No voice command detected."
-            ny = y_pos
-        elif key == ord('c'):
-            print(f"\nVoice Chat Mode about {fruit_name_on_screen}:")
-            voice_chat(access_token, fruit_name_on_screen, local_fruit_info)
-            ny = y_pos
-        elif key == ord('x'):
-            combined_operation_with_frame(frame, access_token)
-            ny = y_pos
+                pending = commands.submit(state.run_command, chr(key), frame)
 
+    commands.shutdown(wait=False)
+    governor.close()
+    audio_stream.close_stream()
     cap.release()
     cv2.destroyAllWindows()
+    stats = capture_governor.capture_stats()
+    print(f"📷 capture: {stats['normal']['avg_fps']} fps normal, {stats['throttled']['avg_fps']} fps while inferring")
 
 def main():
+    fruit_metrics.configure_from_env()
     run_webcam_mode()
 
 if __name__ == "__main__":
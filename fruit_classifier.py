@@ -0,0 +1,148 @@
+import argparse
+import threading
+
+import cv2
+import numpy as np
+
+import image_store
+
+# -----------------------------
+# 本地特徵分類器：以 image_store 的縮圖建立 HSV 色彩直方圖，
+# 用 kNN 投票給出標籤與信心值 (毫秒級，不需要 GPU)。
+# 作為辨識串接的第一層，信心不足時才交給 llava。
+#   python fruit_classifier.py eval      # 留一法估計各門檻的準確率與覆蓋率
+# -----------------------------
+# H / S / V 各分幾格；色相切細一點，飽和度與亮度較粗
+HIST_BINS = (18, 4, 4)
+KNN_K = 7
+# 中央橢圓區域以外的像素不計入 (縮圖多半把水果放在中間，四周是背景)
+CENTER_RATIO = 0.8
+
+_classifier_lock = threading.Lock()
+_classifier_cache = {}
+
+
+def _center_mask(size):
+    mask = np.zeros((size, size), np.uint8)
+    axis = int(size * CENTER_RATIO / 2)
+    cv2.ellipse(mask, (size // 2, size // 2), (axis, axis), 0, 0, 360, 255, -1)
+    return mask
+
+
+def extract_features(thumbnail, mask=None):
+    """回傳 L1 正規化後開根號的 HSV 直方圖 (Hellinger 空間，可直接做內積)"""
+    if mask is None:
+        mask = _center_mask(thumbnail.shape[0])
+    hsv = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1, 2], mask, list(HIST_BINS), [0, 180, 0, 256, 0, 256]).ravel()
+    total = hist.sum()
+    if total:
+        hist /= total
+    return np.sqrt(hist).astype(np.float32)
+
+
+class FeatureClassifier:
+    def __init__(self, features, labels, k=KNN_K):
+        self.features = features
+        self.labels = np.asarray(labels)
+        self.names = sorted(set(labels))
+        self.k = min(k, len(labels))
+        self.size = image_store.THUMB_SIZE
+        self._mask = _center_mask(self.size)
+
+    @classmethod
+    def from_store(cls, store, k=KNN_K):
+        mask = _center_mask(store.size)
+        features = np.stack([extract_features(store.images[i], mask) for i in range(len(store))])
+        classifier = cls(features, store.labels, k)
+        classifier.size = store.size
+        classifier._mask = mask
+        return classifier
+
+    def _vote(self, similarities):
+        top = np.argpartition(-similarities, self.k - 1)[:self.k]
+        scores = {}
+        for i in top:
+            scores[self.labels[i]] = scores.get(self.labels[i], 0.0) + float(similarities[i])
+        label = max(scores, key=scores.get)
+        total = sum(scores.values())
+        return str(label), (scores[label] / total if total else 0.0)
+
+    def predict(self, image):
+        """image：任意大小的 BGR 影像。回傳 (標籤, 信心值 0~1)；信心值為 kNN 中相似度加權的得票比例"""
+        thumbnail = image_store.normalize_image(image, self.size)
+        return self._vote(self.features @ extract_features(thumbnail, self._mask))
+
+
+def load_classifier(store_dir=image_store.STORE_DIR):
+    """
+    讀取 (並快取) 縮圖庫建立的分類器；縮圖庫不存在時回傳 None。
+    只快取成功的結果，之後建好縮圖庫不必重啟程式
+    """
+    with _classifier_lock:
+        if store_dir in _classifier_cache:
+            return _classifier_cache[store_dir]
+        try:
+            classifier = FeatureClassifier.from_store(image_store.load_store(store_dir))
+        except FileNotFoundError:
+            print(f"⚠️ 找不到縮圖庫 {store_dir} (請先執行 python image_store.py build)，略過本地分類器。")
+            return None
+        _classifier_cache[store_dir] = classifier
+        return classifier
+
+
+def leave_one_out(classifier):
+    """每張圖拿掉自己後分類，回傳 [(預測, 信心值, 正確標籤), ...]"""
+    similarities = classifier.features @ classifier.features.T
+    np.fill_diagonal(similarities, -1.0)
+    return [classifier._vote(row) + (str(truth),) for row, truth in zip(similarities, classifier.labels)]
+
+
+def held_out_stats(classifier, threshold):
+    """留一法下信心值達 threshold 的覆蓋率與準確率 (不會拿建庫的圖片本身評分)"""
+    results = leave_one_out(classifier)
+    covered = [(p, t) for p, c, t in results if c >= threshold]
+    return {
+        "images": len(results),
+        "threshold": threshold,
+        "coverage": round(len(covered) / len(results), 4) if results else 0.0,
+        "accuracy": round(sum(p == t for p, t in covered) / len(covered), 4) if covered else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local colour-histogram fruit classifier")
+    sub = parser.add_subparsers(dest="command", required=True)
+    evaluate = sub.add_parser("eval", help="leave-one-out accuracy and coverage per confidence threshold")
+    evaluate.add_argument("--store", default=image_store.STORE_DIR)
+    predict = sub.add_parser("predict", help="classify image files")
+    predict.add_argument("--store", default=image_store.STORE_DIR)
+    predict.add_argument("images", nargs="+")
+    args = parser.parse_args()
+
+    classifier = load_classifier(args.store)
+    if classifier is None:
+        return
+
+    if args.command == "predict":
+        for path in args.images:
+            image = cv2.imread(path)
+            if image is None:
+                print(f"⚠️ 無法讀取 {path}，略過。")
+                continue
+            label, confidence = classifier.predict(image)
+            print(f"{path}: {label} ({confidence:.2f})")
+        return
+
+    results = leave_one_out(classifier)
+    print(f"{len(results)} images, overall accuracy "
+          f"{sum(p == t for p, _, t in results) / len(results):.3f}")
+    print("threshold  coverage  accuracy(covered)")
+    for threshold in (0.5, 0.6, 0.7, 0.8, 0.9):
+        covered = [(p, t) for p, c, t in results if c >= threshold]
+        accuracy = sum(p == t for p, t in covered) / len(covered) if covered else 0.0
+        print(f"{threshold:>9.2f}  {len(covered) / len(results):>8.3f}  {accuracy:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,12 +5,14 @@ import re
 import sys
 from difflib import get_close_matches
 import wikipedia  # 載入 wikipedia 套件
+import fruit_intents
+import fruit_sessions
 
 # **水果資料庫**（水果名稱保持英文）
 FRUIT_JSON_PATH = "/ollama_host/fruit_dataset.json"
 
-# **紀錄使用者問過的問題，防止重複回答**
-question_history = {}
+# **對話狀態 (目前的水果、問過的問題) 存在 fruit_sessions，防止重複回答**
+SESSION_ID = "cli"
 
 def identify_fruit(image_path):
     """辨識水果名稱（保持英文），並嘗試從回應中提取出答案部分"""
@@ -120,70 +122,23 @@ def get_fruit_info(fruit_name):
         print("⚠️ Unable to retrieve valid info from Wikipedia.")
     return None
 
-def query_ai_for_fruit(fruit_name, fruit_info, query_type="general"):
+def query_ai_for_fruit(fruit_name, fruit_info, query_type="general", session=None, question=None):
     """
-    根據使用者的問題類型，利用 fruit_info 中的資訊回答：
-      - 若資訊為結構化（例如 JSON 中 "Per 100g:" 開頭的資訊），則直接解析出關鍵數據。
-      - 若資訊來自線上（非結構化），則利用正則表達式從中擷取營養相關內容。
+    根據使用者的問題類型 (fruit_intents.route 的意圖)，利用 fruit_info 中的資訊回答：
+      - 結構化資訊（例如 JSON 中 "Per 100g:" 開頭的資訊）與線上取得的文字都由 fruit_intents 擷取關鍵數據。
     """
-    if fruit_name not in question_history:
-        question_history[fruit_name] = set()
-    
-    if query_type in question_history[fruit_name]:
+    if session is None:
+        session = fruit_sessions.get_session(SESSION_ID)
+    if session.cached_answer(fruit_name, query_type) is not None:
         return "🤖 AI: You already asked that. Please try a different question."
-    question_history[fruit_name].add(query_type)
-    
-    structured = "Per 100g:" in fruit_info['nutrition']
-    
-    if query_type == "calories":
-        if structured:
-            try:
-                # 從 "Per 100g: 52 calories, ..." 擷取卡路里
-                calories = fruit_info['nutrition'].split(':')[1].split(',')[0].strip()
-                return f"{fruit_name} per 100g contains {calories} calories."
-            except Exception:
-                return "⚠️ Unable to parse calorie information."
-        else:
-            match = re.search(r'(\d+)\s*kilocalories', fruit_info['nutrition'], re.IGNORECASE)
-            if match:
-                cal = match.group(1)
-                return f"{fruit_name} per 100g contains {cal} kilocalories."
-            else:
-                return f"Unable to find calorie information for {fruit_name}."
-    
-    elif query_type == "vitamins":
-        if structured:
-            try:
-                # 從 "rich in ..." 擷取維生素資訊
-                match = re.search(r"rich in (.+)", fruit_info['nutrition'], re.IGNORECASE)
-                if match:
-                    vitamins = match.group(1).strip()
-                    return f"{fruit_name} is rich in {vitamins}."
-                else:
-                    return f"No vitamin information found for {fruit_name}."
-            except Exception:
-                return "⚠️ Unable to parse vitamin information."
-        else:
-            matches = re.findall(r'vitamin\s*([A-Za-z]+)', fruit_info['nutrition'], re.IGNORECASE)
-            if matches:
-                vitamins = ", ".join(sorted(set(matches)))
-                return f"{fruit_name} is rich in vitamins: {vitamins}."
-            else:
-                return f"No vitamin information found for {fruit_name}."
-    
-    elif query_type == "health_benefits":
-        if structured:
-            return f"Health benefits of {fruit_name}: {fruit_info['health_benefits']}"
-        else:
-            idx = fruit_info['nutrition'].find("Research")
-            if idx != -1:
-                health_text = fruit_info['nutrition'][idx:]
-                return f"Health benefits of {fruit_name}: {health_text}"
-            else:
-                return f"Health benefits of {fruit_name}: {fruit_info['nutrition']}"
     
+    if query_type == "general":
+        answer = f"{fruit_name} is a nutrient-rich fruit. What specific information do you need?"
     else:
-        return f"{fruit_name} is a nutrient-rich fruit. What specific information do you need?"
+        answer = fruit_intents.answer(fruit_name, fruit_info, [query_type], question)
+        answer = answer or f"No {query_type.replace('_', ' ')} information found for {fruit_name}."
+    session.remember_answer(fruit_name, query_type, answer)
+    return answer
 
 def display_fruit_info(fruit_info):
     """顯示水果資訊"""
@@ -196,17 +151,16 @@ def display_fruit_info(fruit_info):
     print(f"🔹 Nutrition: {fruit_info['nutrition']}")
     print(f"🔹 Health Benefits: {fruit_info['health_benefits']}")
 
-def change_image(new_image_path):
+def change_image(new_image_path, session):
     """
-    處理 change_image 指令，若成功切換圖片則更新全域變數，
+    處理 change_image 指令，若成功切換圖片則更新 session 目前的水果，
     並在內層對話中回覆換圖成功，**但不跳出內層迴圈**。
     """
-    global fruit_name, fruit_info
     if os.path.exists(new_image_path):
         fruit_name = identify_fruit(new_image_path)
         fruit_info = get_fruit_info(fruit_name)
         display_fruit_info(fruit_info)
-        question_history[fruit_name] = set()
+        session.set_fruit(fruit_name, fruit_info)
         print("\n✅ Fruit switched. You can now ask questions about the new fruit!")
         return True
     else:
@@ -214,6 +168,8 @@ def change_image(new_image_path):
         return False
 
 # **主程式：外層迴圈**
+# 整個對話沿用同一個 session 物件並傳給 change_image / query_ai_for_fruit，閒置逐出後也不會換到另一個空的 session
+session = fruit_sessions.get_session(SESSION_ID)
 while True:
     image_path = input("\n📸 Enter image path (or type `exit` to quit): ").strip()
     if image_path.lower() == "exit":
@@ -223,6 +179,7 @@ while True:
     # 初始圖片辨識與資訊取得
     fruit_name = identify_fruit(image_path)
     fruit_info = get_fruit_info(fruit_name)
+    session.set_fruit(fruit_name, fruit_info)
 
     if not fruit_info:
         print(f"⚠️ No information available for '{fruit_name}'. Please manually search for its info.")
@@ -242,21 +199,16 @@ while True:
         elif user_input.lower().startswith("change_image"):
             # 直接在內層對話中換圖片
             new_image_path = user_input.replace("change_image", "").strip()
-            change_image(new_image_path)
+            change_image(new_image_path, session)
         elif user_input.lower() == "new_image":
             # 結束內層對話，回到外層重新輸入圖片路徑
             break
-        elif "calories" in user_input.lower() or "卡路里" in user_input:
-            response = query_ai_for_fruit(fruit_name, fruit_info, query_type="calories")
-            print(f"🤖 AI: {response}")
-        elif "vitamin" in user_input.lower() or "維生素" in user_input:
-            response = query_ai_for_fruit(fruit_name, fruit_info, query_type="vitamins")
-            print(f"🤖 AI: {response}")
-        elif "health" in user_input.lower() or "益處" in user_input:
-            response = query_ai_for_fruit(fruit_name, fruit_info, query_type="health_benefits")
-            print(f"🤖 AI: {response}")
         else:
-            response = query_ai_for_fruit(fruit_name, fruit_info)
+            # 依意圖路由回答；沒有命中任何意圖時給通用回應 (這裡沒有 LLM 可退，用寬鬆的關鍵字)
+            intents = fruit_intents.route(user_input, broad=True) or ["general"]
+            response = " ".join(query_ai_for_fruit(session.fruit_name, session.fruit_info, query_type=intent,
+                                                   session=session, question=user_input)
+                                for intent in intents)
             print(f"🤖 AI: {response}")
 
     # 走到這裡表示使用者輸入了 "new_image"，回到外層迴圈重新輸入圖片路徑
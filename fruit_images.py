@@ -0,0 +1,33 @@
+import os
+
+# -----------------------------
+# images/ 參考資料集的共用工具
+# -----------------------------
+IMAGES_DIR = "images"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def label_for_image(path):
+    """images/grapes_fruit/Image_1.jpg -> "Grape" (與 ALLOWED_FRUITS 的寫法一致)"""
+    folder = os.path.basename(os.path.dirname(path))
+    return folder.split("_")[0].title().rstrip("s")
+
+
+def list_reference_images(images_dir=IMAGES_DIR, per_label=None):
+    """回傳排序後的 (path, label) 清單；per_label 可限制每種水果取幾張"""
+    items = []
+    for root, _, files in os.walk(images_dir):
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                items.append(os.path.join(root, name))
+    items.sort()
+
+    result = []
+    counts = {}
+    for path in items:
+        label = label_for_image(path)
+        if per_label is not None and counts.get(label, 0) >= per_label:
+            continue
+        counts[label] = counts.get(label, 0) + 1
+        result.append((path, label))
+    return result
@@ -0,0 +1,220 @@
+import re
+from collections import deque
+
+# -----------------------------
+# 中英文問句的意圖路由：同義詞表在載入時編譯成 Aho-Corasick 自動機，
+# 一次掃描問句就找出所有命中的營養欄位；能從資料直接回答的問題不必呼叫 LLM。
+# 意圖名稱沿用 query_ai_for_fruit 的 query_type (calories / vitamins / health_benefits ...)
+# -----------------------------
+MINERAL_NAMES = {
+    "potassium": ("potassium", "鉀"),
+    "manganese": ("manganese", "錳"),
+    "magnesium": ("magnesium", "鎂"),
+    "calcium": ("calcium", "鈣"),
+    "iron": ("iron", "鐵"),
+    "copper": ("copper", "銅"),
+    "zinc": ("zinc", "鋅"),
+    "phosphorus": ("phosphorus", "磷"),
+}
+MINERALS = tuple(MINERAL_NAMES)
+
+# 英文同義詞以整個單字比對 (前後不能是字母或數字)，所以複數等變化要另外列出；
+# 中文同義詞沒有詞界，直接以子字串比對
+INTENT_SYNONYMS = {
+    "calories": ("calorie", "calories", "kcal", "kilocalorie", "kilocalories", "energy",
+                 "卡路里", "熱量", "大卡", "卡洛里"),
+    "sugar": ("sugar", "sugars", "sugary", "sweetness", "how sweet", "糖", "甜"),
+    "protein": ("protein", "proteins", "蛋白質", "蛋白"),
+    "fiber": ("fiber", "fibers", "fibre", "fibres", "纖維"),
+    "carbohydrates": ("carb", "carbs", "carbohydrate", "carbohydrates", "碳水"),
+    "vitamins": ("vitamin", "vitamins", "維生素", "維他命"),
+    "minerals": ("mineral", "minerals", "礦物質") + tuple(n for names in MINERAL_NAMES.values() for n in names),
+    "nutrition": ("nutrition", "nutrient", "nutrients", "nutritional", "營養"),
+    "health_benefits": ("health benefit", "health benefits", "benefit", "benefits", "healthy",
+                        "益處", "好處", "功效"),
+    # 特定疾病 / 風險的問題 (能不能吃、會不會影響) 不能用好處清單回答，一律交給 LLM；
+    # 列在這裡是為了以最長比對蓋過 "sugar" / "糖" 等營養意圖
+    "conditions": ("good for", "bad for", "safe for", "blood sugar", "blood pressure", "diabetes", "diabetic",
+                   "heart", "kidney", "kidneys", "allergy", "allergies", "allergic", "pregnant", "pregnancy",
+                   "cholesterol",
+                   "糖尿病", "血糖", "血壓", "心臟", "腎", "過敏", "懷孕", "膽固醇", "可以吃", "能吃"),
+}
+# 較寬鬆的關鍵字：只給沒有 LLM 可退的 CLI 迴圈 (ollama_chat.py、fruit_identifier1.py) 使用，
+# 那裡答不出來只會得到通用回應；有 LLM 的路徑 "health effects" 之類的問題交給 LLM
+BROAD_SYNONYMS = {
+    "health_benefits": ("health", "健康"),
+}
+# 沒有結構化答案的意圖：命中時整題交給 LLM
+LLM_ONLY_INTENTS = {"conditions"}
+
+# 從營養敘述中擷取的數量欄位 (結構化 "Per 100g: 13.8g carbohydrates" 與維基文字都適用)
+AMOUNT_PATTERNS = {
+    "calories": re.compile(r"(\d+(?:\.\d+)?)\s*(?:kilocalories|kcal|calories)", re.IGNORECASE),
+    "carbohydrates": re.compile(r"(\d+(?:\.\d+)?\s*g)\s+(?:of\s+)?carbohydrates?", re.IGNORECASE),
+    "fiber": re.compile(r"(\d+(?:\.\d+)?\s*g)\s+(?:of\s+)?(?:dietary\s+)?fib(?:er|re)", re.IGNORECASE),
+    "sugar": re.compile(r"(\d+(?:\.\d+)?\s*g)\s+(?:of\s+)?sugars?", re.IGNORECASE),
+    "protein": re.compile(r"(\d+(?:\.\d+)?\s*g)\s+(?:of\s+)?protein", re.IGNORECASE),
+}
+# 中文問句的「維生素C嗎」後面緊接中文字，不能用 \b
+VITAMIN_PATTERN = re.compile(r"(?:vitamin|維生素|維他命)\s*([A-K]\d{0,2})(?![A-Za-z0-9])", re.IGNORECASE)
+NUTRIENT_INTENTS = set(AMOUNT_PATTERNS) | {"vitamins", "minerals"}
+
+
+def _is_word_char(ch):
+    return ch.isalnum() or ch == "_"
+
+
+class IntentMatcher:
+    """
+    多模式字串比對 (Aho-Corasick)；比對前一律轉小寫。
+    ASCII 的同義詞只接受前後都不是字母、數字的命中 ("carb" 不會命中 "carbonated")
+    """
+
+    def __init__(self, synonyms):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]  # 每個狀態結束的 (長度, 意圖)
+        for intent, phrases in synonyms.items():
+            for phrase in phrases:
+                self._add(phrase.lower(), intent)
+        self._link()
+
+    def _add(self, phrase, intent):
+        state = 0
+        for ch in phrase:
+            if ch not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[state][ch] = len(self._goto) - 1
+            state = self._goto[state][ch]
+        self._out[state].append((len(phrase), intent, phrase.isascii()))
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text):
+        """回傳所有命中 [(起點, 終點, 意圖), ...]"""
+        text = text.lower()
+        matches = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for length, intent, whole_word in self._out[state]:
+                start, end = i + 1 - length, i + 1
+                if whole_word and ((start > 0 and _is_word_char(text[start - 1]))
+                                   or (end < len(text) and _is_word_char(text[end]))):
+                    continue
+                matches.append((start, end, intent))
+        return matches
+
+
+_matcher = IntentMatcher(INTENT_SYNONYMS)
+_broad_matcher = IntentMatcher({
+    intent: INTENT_SYNONYMS.get(intent, ()) + BROAD_SYNONYMS.get(intent, ())
+    for intent in set(INTENT_SYNONYMS) | set(BROAD_SYNONYMS)
+})
+
+
+def route(question, broad=False):
+    """
+    回傳問句命中的意圖 (依出現順序、不重複)。
+    重疊的命中只取較長者，例如「糖尿病」算健康而不是糖分、"blood sugar" 不算 sugar。
+    broad=True 時另外比對 BROAD_SYNONYMS (沒有 LLM 可退的呼叫端使用)
+    """
+    matcher = _broad_matcher if broad else _matcher
+    intents = []
+    covered_until = 0
+    for start, end, intent in sorted(matcher.find(question or ""), key=lambda m: (m[0], -(m[1] - m[0]))):
+        if start < covered_until:
+            continue
+        covered_until = end
+        if intent not in intents:
+            intents.append(intent)
+    return intents
+
+
+def _strip_prefix(text, prefix):
+    text = (text or "").strip()
+    return text[len(prefix):].strip() if text.lower().startswith(prefix) else text
+
+
+def _named_minerals(question):
+    """問句中點名的礦物質 (英文以整個單字比對，中文以子字串比對)"""
+    question = (question or "").lower()
+    return [mineral for mineral, names in MINERAL_NAMES.items()
+            if any(re.search(rf"\b{name}\b", question) if name.isascii() else name in question for name in names)]
+
+
+def _answer_one(intent, fruit_name, fruit_info, question=None):
+    nutrition = _strip_prefix(fruit_info.get("nutrition"), "nutrition:")
+    if intent in AMOUNT_PATTERNS:
+        match = AMOUNT_PATTERNS[intent].search(nutrition)
+        if not match:
+            return None
+        if intent == "calories":
+            return f"{fruit_name} per 100g contains {match.group(1)} calories."
+        return f"{fruit_name} has {match.group(1).replace(' ', '')} of {intent} per 100g."
+    if intent == "vitamins":
+        vitamins = sorted({v.upper() for v in VITAMIN_PATTERN.findall(nutrition)})
+        # 問到特定維生素 (例如 vitamin D) 時，資料裡要有才直接回答，否則交給 LLM
+        asked = sorted({v.upper() for v in VITAMIN_PATTERN.findall(question or "")})
+        if asked:
+            return f"{fruit_name} contains vitamin {', '.join(asked)}." if set(asked) <= set(vitamins) else None
+        if not vitamins:
+            return None
+        return f"{fruit_name} is rich in vitamin {', '.join(vitamins)}."
+    if intent == "minerals":
+        minerals = [m for m in MINERALS if m in nutrition.lower()]
+        asked = _named_minerals(question)
+        if asked:
+            return f"{fruit_name} contains {', '.join(asked)}." if set(asked) <= set(minerals) else None
+        if not minerals:
+            return None
+        return f"{fruit_name} contains {', '.join(minerals)}."
+    if intent == "nutrition":
+        return f"{fruit_name} nutrition: {nutrition}" if nutrition and nutrition != "無" else None
+    if intent in LLM_ONLY_INTENTS:
+        return None
+    if intent == "health_benefits":
+        health = _strip_prefix(fruit_info.get("health_benefits"), "health:")
+        if not health or health == "無" or "???" in health:
+            return None
+        return f"Health benefits of {fruit_name}: {health}"
+    return None
+
+
+def answer(fruit_name, fruit_info, intents, question=None):
+    """
+    以結構化資料回答這些意圖。任一意圖無法從資料回答時回傳 None，
+    呼叫端應改交給 LLM。有給 question 時，問到資料裡沒有的特定維生素 / 礦物質也回傳 None
+    """
+    if not intents or not fruit_info:
+        return None
+    # nutrition 整段已包含各營養欄位，問到更具體的欄位時不重複輸出
+    if "nutrition" in intents and any(i in NUTRIENT_INTENTS for i in intents):
+        intents = [i for i in intents if i != "nutrition"]
+    sentences = []
+    for intent in intents:
+        sentence = _answer_one(intent, fruit_name, fruit_info, question)
+        if sentence is None:
+            return None
+        sentences.append(sentence)
+    return " ".join(sentences)
+
+
+def answer_question(fruit_name, fruit_info, question):
+    """路由問句並嘗試直接回答；回傳 (答案或 None, 意圖清單)"""
+    intents = route(question)
+    return answer(fruit_name, fruit_info, intents, question), intents
@@ -0,0 +1,189 @@
+import argparse
+import base64
+import json
+import os
+import random
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from fruit_images import IMAGES_DIR, list_reference_images
+
+# -----------------------------
+# 參數設定
+# -----------------------------
+DEFAULT_URL = "http://127.0.0.1:8088"
+DEFAULT_TRACE_PATH = "request_traces.jsonl"
+
+CANNED_QUESTIONS = [
+    "How many calories does it have?",
+    "Is it good for my heart?",
+    "Which vitamins does it contain?",
+    "Can I eat it after a workout?",
+]
+
+
+# -----------------------------
+# 產生請求
+# -----------------------------
+def _event_to_request(event, encoded):
+    """把 fruit_trace 的事件轉成對應的 HTTP 請求；無法重現的事件 (圖片不在、沒有問題) 回傳 None"""
+    kind = event.get("kind")
+    if kind == "identify":
+        image = event.get("image")
+        if not image or not os.path.exists(image):
+            return None
+        if image not in encoded:
+            with open(image, "rb") as f:
+                encoded[image] = base64.b64encode(f.read()).decode("ascii")
+        return {"method": "POST", "endpoint": "/identify", "body": {"image_b64": encoded[image]}}
+    if kind == "info" and event.get("fruit"):
+        return {"method": "GET", "endpoint": f"/info?fruit={quote(event['fruit'])}"}
+    if kind == "ask" and event.get("fruit") and event.get("question"):
+        body = {"fruit": event["fruit"], "question": event["question"]}
+        if event.get("session_id"):
+            # 多輪對話要在同一個 session 重播，伺服器才會沿用相同的對話歷史與答案快取
+            body["session_id"] = f"replay:{event['session_id']}"
+        return {"method": "POST", "endpoint": "/ask", "body": body}
+    return None
+
+
+def load_trace(path):
+    """
+    讀取錄製好的請求 (JSON Lines)，每行可以是：
+    - HTTP 請求：{"method": "POST", "endpoint": "/identify", "body": {...}}
+    - fruit_trace 記錄的事件 (FRUIT_TRACE_PATH 錄製，kind 為 identify / info / ask)，
+      轉成對應端點的請求；identify 讀取事件中保存的圖片 (trace_images/)
+    """
+    trace = []
+    encoded = {}
+    skipped = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if "endpoint" in item:
+                trace.append(item)
+            elif "kind" in item:
+                request = _event_to_request(item, encoded)
+                if request is None:
+                    skipped += 1
+                else:
+                    trace.append(request)
+    if skipped:
+        print(f"⚠️ {skipped} 筆事件無法轉成請求 (圖片不存在或沒有問題內容)，略過。")
+    return trace
+
+
+def synthetic_requests(count, images_dir=IMAGES_DIR, mix=(0.6, 0.2, 0.2), seed=0):
+    """依 identify / info / ask 的比例，從 images/ 產生合成負載"""
+    rng = random.Random(seed)
+    reference = list_reference_images(images_dir)
+    images = [path for path, _ in reference]
+    fruits = sorted({label for _, label in reference}) or ["Apple"]
+
+    encoded = {}
+    requests = []
+    for _ in range(count):
+        kind = rng.choices(["identify", "info", "ask"], weights=mix)[0]
+        if kind == "identify" and images:
+            path = rng.choice(images)
+            if path not in encoded:
+                with open(path, "rb") as f:
+                    encoded[path] = base64.b64encode(f.read()).decode("ascii")
+            requests.append({"method": "POST", "endpoint": "/identify", "body": {"image_b64": encoded[path]}})
+        elif kind == "info":
+            fruit = rng.choice(fruits)
+            requests.append({"method": "GET", "endpoint": f"/info?fruit={quote(fruit)}"})
+        else:
+            requests.append({
+                "method": "POST",
+                "endpoint": "/ask",
+                "body": {"fruit": rng.choice(fruits), "question": rng.choice(CANNED_QUESTIONS)},
+            })
+    return requests
+
+
+# -----------------------------
+# 送出請求與統計
+# -----------------------------
+def send_request(base_url, item, timeout):
+    data = None
+    headers = {}
+    if item.get("body") is not None:
+        data = json.dumps(item["body"]).encode("utf-8")
+        headers["Content-Type"] = "application/json"
+    req = urllib.request.Request(base_url + item["endpoint"], data=data, headers=headers,
+                                 method=item.get("method", "POST" if data else "GET"))
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = "error"
+    return status, time.perf_counter() - start
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(pct / 100 * (len(values) - 1)))))
+    return values[k]
+
+
+def run_load(base_url, requests, concurrency=8, timeout=120):
+    statuses = {}
+    latencies = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for status, latency in pool.map(lambda item: send_request(base_url, item, timeout), requests):
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append(latency)
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(requests),
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(requests) / elapsed, 2) if elapsed > 0 else 0.0,
+        "ok_throughput_rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        "status_counts": {str(k): v for k, v in statuses.items()},
+        "latency_p50_s": round(percentile(latencies, 50), 4),
+        "latency_p95_s": round(percentile(latencies, 95), 4),
+        "latency_p99_s": round(percentile(latencies, 99), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for fruit_server.py")
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="number of synthetic requests")
+    parser.add_argument("--trace", help=f"replay a recorded trace (e.g. {DEFAULT_TRACE_PATH}) instead of synthetic load")
+    parser.add_argument("--images", default=IMAGES_DIR)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.trace:
+        requests = load_trace(args.trace)
+    else:
+        requests = synthetic_requests(args.requests, args.images, seed=args.seed)
+    if not requests:
+        print("⚠️ 沒有可送出的請求。")
+        return
+
+    print(f"🚀 Sending {len(requests)} requests to {args.url} (concurrency={args.concurrency})")
+    print(json.dumps(run_load(args.url.rstrip("/"), requests, args.concurrency, args.timeout), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+import atexit
+import bisect
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# -----------------------------
+# 參數設定
+# -----------------------------
+# FRUIT_METRICS_PORT：在本機開 /metrics (Prometheus 文字格式)
+# FRUIT_METRICS_FILE：程式結束時把指標寫到檔案
+METRICS_PORT = os.environ.get("FRUIT_METRICS_PORT", "")
+METRICS_FILE = os.environ.get("FRUIT_METRICS_FILE", "")
+
+# 秒數直方圖的 bucket 上界，涵蓋 JSON 查詢 (毫秒級) 到 llava 推論 (數十秒)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket_counts, sum, count]
+_help = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def describe(name, text):
+    _help[name] = text
+
+
+def inc(name, amount=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS, **labels):
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [[0] * len(buckets), 0.0, 0, buckets]
+        idx = bisect.bisect_left(hist[3], value)
+        if idx < len(buckets):
+            hist[0][idx] += 1
+        hist[1] += value
+        hist[2] += 1
+
+
+def get_counter(name, **labels):
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+
+def get_histogram(name, **labels):
+    """回傳 (count, sum)，方便測試與 CLI 顯示平均值"""
+    with _lock:
+        hist = _histograms.get(_key(name, labels))
+        return (hist[2], hist[1]) if hist else (0, 0.0)
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+# -----------------------------
+# 各階段計時
+# -----------------------------
+@contextmanager
+def timed(stage):
+    """量測一個階段的耗時，寫入 fruit_stage_seconds{stage=...}"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("fruit_stage_seconds", time.perf_counter() - start, stage=stage)
+
+
+def timed_stage(stage):
+    """timed() 的裝飾器版本"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe_ollama(call_type, model, response):
+    """
+    記錄 Ollama 回應自帶的統計 (eval_count / eval_duration 等，單位奈秒)，
+    可看出時間花在 prefill (prompt_eval) 還是生成 (eval)
+    """
+    try:
+        fields = {
+            "eval_count": response.get("eval_count"),
+            "eval_duration": response.get("eval_duration"),
+            "prompt_eval_count": response.get("prompt_eval_count"),
+            "prompt_eval_duration": response.get("prompt_eval_duration"),
+            "load_duration": response.get("load_duration"),
+        }
+    except AttributeError:
+        return
+    labels = {"call_type": call_type, "model": model}
+    if fields["eval_count"]:
+        inc("ollama_eval_tokens_total", fields["eval_count"], **labels)
+    if fields["prompt_eval_count"]:
+        inc("ollama_prompt_eval_tokens_total", fields["prompt_eval_count"], **labels)
+    if fields["eval_duration"]:
+        observe("ollama_eval_seconds", fields["eval_duration"] / 1e9, **labels)
+    if fields["prompt_eval_duration"]:
+        observe("ollama_prompt_eval_seconds", fields["prompt_eval_duration"] / 1e9, **labels)
+    if fields["load_duration"]:
+        observe("ollama_load_seconds", fields["load_duration"] / 1e9, **labels)
+
+
+# -----------------------------
+# Prometheus 文字格式輸出
+# -----------------------------
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + body + "}"
+
+
+def render_prometheus():
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((k, (list(v[0]), v[1], v[2], v[3])) for k, v in _histograms.items())
+
+    lines = []
+    seen = set()
+    for (name, labels), value in counters:
+        if name not in seen:
+            seen.add(name)
+            if name in _help:
+                lines.append(f"# HELP {name} {_help[name]}")
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for (name, labels), (counts, total, count, buckets) in histograms:
+        if name not in seen:
+            seen.add(name)
+            if name in _help:
+                lines.append(f"# HELP {name} {_help[name]}")
+            lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, bucket_count in zip(buckets, counts):
+            cumulative += bucket_count
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+        lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve_metrics(port, host="127.0.0.1"):
+    """在背景執行緒提供 http://host:port/metrics"""
+    server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"📈 Metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def dump_metrics(path):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+
+
+def dump_on_exit(path):
+    atexit.register(dump_metrics, path)
+
+
+def configure_from_env():
+    """依 FRUIT_METRICS_PORT / FRUIT_METRICS_FILE 啟用輸出，兩者皆未設定則不做事"""
+    server = None
+    if METRICS_PORT:
+        server = serve_metrics(METRICS_PORT)
+    if METRICS_FILE:
+        dump_on_exit(METRICS_FILE)
+    return server
+
+
+describe("fruit_stage_seconds", "Wall time spent in each pipeline stage.")
+describe("fruit_summarize_retries_total", "Extra LLM generations spent re-asking for a missing field.")
+describe("fruit_info_lookups_total", "Fruit info lookups by source (dataset, knowledge pack, cache, online fetch, partial).")
+describe("fruit_info_deadline_exceeded_total", "Online fruit info lookups that ran past their time budget.")
+describe("fruit_info_lookups_expired_total", "In-flight online lookups abandoned as stuck and restarted.")
+describe("fruit_capture_frames_total", "Camera frames processed, by capture governor mode.")
+describe("fruit_capture_frame_seconds", "Interval between processed camera frames, by capture governor mode.")
+describe("fruit_capture_frames_skipped_total", "Camera frames grabbed and dropped without decoding while throttled.")
+describe("fruit_capture_governor_transitions_total", "Capture governor switches into each mode.")
+describe("fruit_inference_seconds", "Ollama call latency, labelled with the camera capture mode at the time.")
+describe("fruit_headless_triggers_rejected_total", "Headless webcam triggers refused with 409 because a command was already running.")
+describe("fruit_headless_trigger_errors_total", "Headless webcam triggers whose command raised and returned 500.")
+describe("ollama_backend_requests_total", "Ollama calls served by each pooled backend, by model.")
+describe("ollama_backend_seconds", "Ollama call latency per pooled backend.")
+describe("ollama_backend_failures_total", "Failed Ollama calls per pooled backend.")
+describe("ollama_backend_ejections_total", "Times a pooled backend was ejected after failures or a failed health check.")
+describe("fruit_recognition_rejected_total", "Recognitions dropped because the label is not in ALLOWED_FRUITS.")
+describe("fruit_cascade_served_total", "Recognitions answered by each cascade tier.")
+describe("fruit_cascade_escalations_total", "Recognitions a cascade tier passed on (low confidence or label not allowed).")
+describe("fruit_cascade_seconds", "End-to-end recognition latency by the tier that answered.")
+describe("fruit_answers_total", "Q&A answers served from structured data (intent), the session cache, or the LLM.")
+describe("ollama_eval_tokens_total", "Tokens generated, from Ollama eval_count.")
+describe("ollama_prompt_eval_tokens_total", "Prompt tokens processed, from Ollama prompt_eval_count.")
+describe("ollama_eval_seconds", "Generation time reported by Ollama eval_duration.")
+describe("ollama_prompt_eval_seconds", "Prefill time reported by Ollama prompt_eval_duration.")
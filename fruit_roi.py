@@ -0,0 +1,173 @@
+import cv2
+import numpy as np
+
+# -----------------------------
+# 參數設定
+# -----------------------------
+# llava (CLIP ViT-L/14-336) 的原生輸入大小；送更大的圖只會在伺服器端被縮小
+LLAVA_INPUT_SIZE = 336
+# 裁切框往外多留的比例，避免切掉水果邊緣
+ROI_MARGIN = 0.12
+# 候選區域面積至少佔整張畫面的比例，太小的多半是雜訊
+MIN_REGION_RATIO = 0.02
+# 分析用的縮圖寬度；輪廓分析在小圖上做就夠了
+ANALYSIS_WIDTH = 320
+# 多水果模式最多提出幾個候選區域
+MAX_REGIONS = 4
+# 顏色分割的色相區間 (OpenCV hue 0-179)；紅色跨越 0 度，兩段合併
+HUE_BANDS = (
+    ((0, 10), (170, 180)),  # 紅：蘋果、草莓、櫻桃
+    ((10, 22),),            # 橙：柳橙、芒果
+    ((22, 35),),            # 黃：香蕉、鳳梨
+    ((35, 85),),            # 綠：奇異果、芭樂
+    ((85, 170),),           # 紫：葡萄
+)
+# 顏色分割只看夠鮮豔的像素
+MIN_SATURATION = 60
+# 兩個候選框重疊超過此比例 (以較小者為準) 視為同一個物體
+OVERLAP_THRESHOLD = 0.6
+
+
+def _foreground_mask(small):
+    """
+    便宜的前景遮罩：水果通常比背景 (桌面、牆面) 飽和度高、邊緣多，
+    以 HSV 飽和度 (Otsu 門檻) 加上 Canny 邊緣，再做形態學閉運算連成塊
+    """
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+    saturation = cv2.GaussianBlur(hsv[:, :, 1], (5, 5), 0)
+    _, sat_mask = cv2.threshold(saturation, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    edges = cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 50, 150)
+    edges = cv2.dilate(edges, np.ones((3, 3), np.uint8), iterations=2)
+
+    mask = cv2.bitwise_or(sat_mask, edges)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (9, 9))
+    return cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
+
+
+def _saliency_box(small):
+    """有 opencv-contrib 時，以 spectral residual 顯著度作為備援"""
+    if not hasattr(cv2, "saliency"):
+        return None
+    saliency = cv2.saliency.StaticSaliencySpectralResidual_create()
+    ok, saliency_map = saliency.computeSaliency(small)
+    if not ok:
+        return None
+    saliency_map = (saliency_map * 255).astype("uint8")
+    _, mask = cv2.threshold(saliency_map, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    points = cv2.findNonZero(mask)
+    return cv2.boundingRect(points) if points is not None else None
+
+
+def _analysis_image(frame):
+    h, w = frame.shape[:2]
+    scale = ANALYSIS_WIDTH / w if w > ANALYSIS_WIDTH else 1.0
+    if scale < 1:
+        return cv2.resize(frame, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA), scale
+    return frame, scale
+
+
+def region_boxes(frame, max_regions=None, min_ratio=MIN_REGION_RATIO):
+    """
+    回傳前景區域的外框 [(x, y, w, h), ...] (原圖座標)，依面積由大到小排序
+    """
+    small, scale = _analysis_image(frame)
+    mask = _foreground_mask(small)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_area = min_ratio * small.shape[0] * small.shape[1]
+    contours = sorted((c for c in contours if cv2.contourArea(c) >= min_area), key=cv2.contourArea, reverse=True)
+    if max_regions is not None:
+        contours = contours[:max_regions]
+
+    boxes = []
+    for contour in contours:
+        x, y, bw, bh = cv2.boundingRect(contour)
+        boxes.append((int(x / scale), int(y / scale), int(bw / scale), int(bh / scale)))
+
+    if not boxes:
+        box = _saliency_box(small)
+        if box is not None:
+            x, y, bw, bh = box
+            boxes.append((int(x / scale), int(y / scale), int(bw / scale), int(bh / scale)))
+    return boxes
+
+
+def _overlap(a, b):
+    """交集面積 / 較小框面積；用來判斷重疊或包含"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    iw = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    ih = max(0, min(ay + ah, by + bh) - max(ay, by))
+    smaller = min(aw * ah, bw * bh)
+    return (iw * ih) / smaller if smaller else 0.0
+
+
+def propose_regions(frame, max_regions=MAX_REGIONS, min_ratio=MIN_REGION_RATIO):
+    """
+    多水果候選區域：在前景遮罩內依色相分段找輪廓 (顏色不同的水果即使相鄰也能分開)，
+    重疊的框只保留較大者。沒有任何顏色區域時退回 region_boxes()。
+    回傳 [(x, y, w, h), ...] (原圖座標)，依面積由大到小排序
+    """
+    small, scale = _analysis_image(frame)
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+    foreground = _foreground_mask(small)
+    saturated = cv2.inRange(hsv[:, :, 1], MIN_SATURATION, 255)
+    base = cv2.bitwise_and(foreground, saturated)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (7, 7))
+    min_area = min_ratio * small.shape[0] * small.shape[1]
+
+    candidates = []
+    for band in HUE_BANDS:
+        hue_mask = np.zeros(base.shape, np.uint8)
+        for lo, hi in band:
+            hue_mask |= cv2.inRange(hsv[:, :, 0], lo, hi - 1)
+        mask = cv2.morphologyEx(cv2.bitwise_and(base, hue_mask), cv2.MORPH_OPEN, kernel)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        for contour in contours:
+            area = cv2.contourArea(contour)
+            if area >= min_area:
+                candidates.append((area, cv2.boundingRect(contour)))
+
+    kept = []
+    for _, box in sorted(candidates, key=lambda c: c[0], reverse=True):
+        if all(_overlap(box, other) < OVERLAP_THRESHOLD for other in kept):
+            kept.append(box)
+        if len(kept) >= max_regions:
+            break
+
+    if not kept:
+        return region_boxes(frame, max_regions, min_ratio)
+    return [(int(x / scale), int(y / scale), int(bw / scale), int(bh / scale)) for x, y, bw, bh in kept]
+
+
+def find_fruit_region(frame):
+    """畫面中最主要 (面積最大) 的物體外框，找不到時回傳 None"""
+    boxes = region_boxes(frame, max_regions=1)
+    return boxes[0] if boxes else None
+
+
+def square_crop(frame, box, size=LLAVA_INPUT_SIZE, margin=ROI_MARGIN):
+    """以 box 為中心裁成正方形 (外擴 margin)，再縮放為 size x size"""
+    h, w = frame.shape[:2]
+    x, y, bw, bh = box
+    side = int(max(bw, bh) * (1 + 2 * margin))
+    side = min(max(side, 1), w, h)
+    cx, cy = x + bw // 2, y + bh // 2
+    left = min(max(cx - side // 2, 0), w - side)
+    top = min(max(cy - side // 2, 0), h - side)
+    crop = frame[top:top + side, left:left + side]
+    interpolation = cv2.INTER_AREA if side > size else cv2.INTER_LINEAR
+    return cv2.resize(crop, (size, size), interpolation=interpolation)
+
+
+def crop_to_fruit(frame, size=LLAVA_INPUT_SIZE):
+    """
+    回傳 (裁切後影像, 外框)。找不到主要物體時取畫面中央的正方形，外框為 None
+    """
+    box = find_fruit_region(frame)
+    if box is None:
+        h, w = frame.shape[:2]
+        return square_crop(frame, (0, 0, w, h), size, margin=0), None
+    return square_crop(frame, box, size), box
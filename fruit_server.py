@@ -0,0 +1,382 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+import chatbot
+import fruit_metrics
+from fruit_images import IMAGES_DIR
+import fruit_sessions
+import ollama_pool
+
+# -----------------------------
+# 參數設定
+# -----------------------------
+SERVER_HOST = os.environ.get("FRUIT_SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.environ.get("FRUIT_SERVER_PORT", "8088"))
+
+# 辨識請求的收集窗口：一次最多收幾個、最多等多久 (秒)，用來合併相同的圖片
+BATCH_MAX_SIZE = 8
+BATCH_WINDOW_S = 0.02
+
+# 辨識佇列上限，滿了直接回 429
+RECOGNITION_QUEUE_SIZE = 32
+
+# 同時送往 Ollama 的呼叫數，應與 Ollama 端 OLLAMA_NUM_PARALLEL 一致
+INFERENCE_WORKERS = ollama_pool.NUM_PARALLEL
+
+# info / ask 使用另一個執行緒池，辨識請求大量湧入時不會被擠在後面
+CALL_WORKERS = int(os.environ.get("FRUIT_SERVER_CALL_WORKERS", str(INFERENCE_WORKERS)))
+
+# info / ask 同時處理中的請求上限，超過回 429
+MAX_PENDING_CALLS = 16
+
+MAX_BODY_BYTES = 8 * 1024 * 1024
+
+# /identify 的 image_path 只接受這個目錄底下的檔案 (伺服器本機的參考圖片)
+SERVER_IMAGES_DIR = os.environ.get("FRUIT_SERVER_IMAGES_DIR", IMAGES_DIR)
+
+HTTP_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# -----------------------------
+# 辨識請求的去重與併發上限
+# -----------------------------
+class RecognitionBatcher:
+    """
+    收集短時間內同時到達的辨識請求並去重 (不是模型端的批次推論，llava 仍是一張圖一次呼叫)：
+    - 內容相同的圖片 (例如多台攝影機拍到同一畫面) 只送一次 llava，結果分給所有請求
+    - 不同的圖片各自送出，同時進行的呼叫數受 max_inflight (預設 INFERENCE_WORKERS) 限制
+    每個呼叫是獨立的 task，完成就回覆；收集迴圈不等整批結束，慢的辨識不會擋住後面的請求。
+    佇列有上限，滿了 submit() 會丟出 HTTPError(429)。
+    """
+
+    def __init__(self, executor, max_batch=BATCH_MAX_SIZE, window=BATCH_WINDOW_S,
+                 queue_size=RECOGNITION_QUEUE_SIZE, max_inflight=INFERENCE_WORKERS):
+        self.executor = executor
+        self.max_batch = max_batch
+        self.window = window
+        self.max_inflight = max_inflight
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.batches = 0
+        self.requests = 0
+        self.model_calls = 0
+        self._task = None
+        self._slots = None
+        self._calls = set()
+
+    def start(self):
+        self._slots = asyncio.Semaphore(self.max_inflight)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        tasks = ([self._task] if self._task else []) + list(self._calls)
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def submit(self, image_bytes=None, image_path=None):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((image_bytes, image_path, future))
+        except asyncio.QueueFull:
+            raise HTTPError(429, "recognition queue is full")
+        return await future
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _call(self, image_bytes, image_path, futures):
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(
+                self.executor, lambda: chatbot.identify_fruit(image_bytes=image_bytes, image_path=image_path))
+        except Exception as e:
+            result = e
+        finally:
+            self._slots.release()
+        for future in futures:
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            groups = {}
+            for image_bytes, image_path, future in batch:
+                if image_bytes is not None:
+                    key = hashlib.sha1(image_bytes).hexdigest()
+                else:
+                    key = f"path:{image_path}"
+                groups.setdefault(key, (image_bytes, image_path, []))[2].append(future)
+            self.batches += 1
+            self.requests += len(batch)
+
+            # 只在所有呼叫名額都在使用中時才等待 (此時新請求留在佇列，滿了回 429)
+            for image_bytes, image_path, futures in groups.values():
+                await self._slots.acquire()
+                self.model_calls += 1
+                task = loop.create_task(self._call(image_bytes, image_path, futures))
+                self._calls.add(task)
+                task.add_done_callback(self._calls.discard)
+
+
+# -----------------------------
+# HTTP 服務
+# -----------------------------
+class FruitService:
+    def __init__(self, host=SERVER_HOST, port=SERVER_PORT, workers=INFERENCE_WORKERS, call_workers=CALL_WORKERS):
+        self.host = host
+        self.port = port
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ollama")
+        self.call_executor = ThreadPoolExecutor(max_workers=call_workers, thread_name_prefix="ollama-call")
+        self.batcher = RecognitionBatcher(self.executor, max_inflight=workers)
+        self.pending_calls = 0
+        self.rejected = 0
+        self.server = None
+
+    async def start(self):
+        self.batcher.start()
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        print(f"🍎 Fruit service listening on http://{self.host}:{self.port}")
+
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        await self.batcher.stop()
+        self.executor.shutdown(wait=False)
+        self.call_executor.shutdown(wait=False)
+
+    async def _call(self, func, *args):
+        # info / ask 不做批次，但同樣有上限，避免 Ollama 被塞爆
+        if self.pending_calls >= MAX_PENDING_CALLS:
+            raise HTTPError(429, "too many pending requests")
+        self.pending_calls += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.call_executor, func, *args)
+        finally:
+            self.pending_calls -= 1
+
+    # ---------- 各端點 ----------
+    @staticmethod
+    def _resolve_image_path(image_path):
+        """image_path 必須位於 SERVER_IMAGES_DIR 之內 (解析符號連結後)，否則回 403"""
+        root = os.path.realpath(SERVER_IMAGES_DIR)
+        path = os.path.realpath(os.path.join(root, image_path))
+        if os.path.commonpath([root, path]) != root:
+            raise HTTPError(403, f"image_path must be inside {SERVER_IMAGES_DIR}")
+        return path
+
+    async def identify(self, body):
+        if body.get("image_b64"):
+            if not isinstance(body["image_b64"], str):
+                raise HTTPError(400, "image_b64 must be a string")
+            try:
+                image_bytes = base64.b64decode(body["image_b64"], validate=True)
+            except ValueError:
+                raise HTTPError(400, "image_b64 is not valid base64")
+            fruit = await self.batcher.submit(image_bytes=image_bytes)
+        elif body.get("image_path"):
+            if not isinstance(body["image_path"], str):
+                raise HTTPError(400, "image_path must be a string")
+            fruit = await self.batcher.submit(image_path=self._resolve_image_path(body["image_path"]))
+        else:
+            raise HTTPError(400, "image_b64 or image_path is required")
+        return {"fruit": fruit}
+
+    async def info(self, query):
+        fruit = (query.get("fruit") or [""])[0].strip()
+        if not fruit:
+            raise HTTPError(400, "fruit is required")
+        info = await self._call(chatbot.get_fruit_info, fruit)
+        return {"fruit": fruit, "info": info}
+
+    async def ask(self, body):
+        for field in ("fruit", "question", "session_id"):
+            if body.get(field) is not None and not isinstance(body[field], str):
+                raise HTTPError(400, f"{field} must be a string")
+        fruit = (body.get("fruit") or "").strip()
+        question = (body.get("question") or "").strip()
+        if not fruit or not question:
+            raise HTTPError(400, "fruit and question are required")
+        info = body.get("info")
+        if info is not None and not isinstance(info, dict):
+            raise HTTPError(400, "info must be a JSON object")
+        if info is None:
+            info = await self._call(chatbot.get_fruit_info, fruit) or {}
+        # 帶 session_id 的請求沿用該 session 的對話歷史 (水果資料只 prefill 一次)
+        answer = await self._call(chatbot.query_ai_for_fruit, fruit, info, "general", question,
+                                  body.get("session_id"))
+        return {"fruit": fruit, "question": question, "answer": answer}
+
+    def health(self):
+        return {
+            "status": "ok",
+            "queue_depth": self.batcher.queue.qsize(),
+            "pending_calls": self.pending_calls,
+            "batches": self.batcher.batches,
+            "batched_requests": self.batcher.requests,
+            "model_calls": self.batcher.model_calls,
+            "rejected": self.rejected,
+            "sessions": fruit_sessions.session_stats(),
+            "ollama_backends": ollama_pool.pool_stats(),
+            "cascade": chatbot.cascade_stats(),
+        }
+
+    async def dispatch(self, method, target, body_bytes):
+        url = urlsplit(target)
+        if url.path == "/health":
+            return self.health()
+        if url.path == "/metrics":
+            return fruit_metrics.render_prometheus()
+        if url.path == "/info":
+            if method != "GET":
+                raise HTTPError(405, "use GET")
+            return await self.info(parse_qs(url.query))
+        if url.path in ("/identify", "/ask"):
+            if method != "POST":
+                raise HTTPError(405, "use POST")
+            try:
+                body = json.loads(body_bytes or b"{}")
+            except ValueError:
+                raise HTTPError(400, "body must be JSON")
+            if not isinstance(body, dict):
+                raise HTTPError(400, "body must be a JSON object")
+            if url.path == "/identify":
+                return await self.identify(body)
+            return await self.ask(body)
+        raise HTTPError(404, f"unknown endpoint {url.path}")
+
+    # ---------- HTTP/1.1 解析 ----------
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "malformed request line"}, False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                try:
+                    length = int(headers.get("content-length", "0") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self._respond(writer, 400, {"error": "invalid Content-Length"}, False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {"error": "body too large"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                try:
+                    status, payload = 200, await self.dispatch(method.upper(), target, body)
+                except HTTPError as e:
+                    if e.status == 429:
+                        self.rejected += 1
+                        fruit_metrics.inc("fruit_server_rejected_total", endpoint=urlsplit(target).path)
+                    status, payload = e.status, {"error": e.message}
+                except Exception as e:
+                    # 例外內容 (路徑、主機位址等) 只記在伺服器端，用戶端收到一般的錯誤訊息
+                    print(f"⚠️ 服務處理失敗 {method} {target}: {e!r}")
+                    fruit_metrics.inc("fruit_server_errors_total", endpoint=urlsplit(target).path)
+                    status, payload = 500, {"error": "internal server error"}
+
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            # /metrics 以 Prometheus 文字格式回傳
+            body = payload.encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        head = [
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, 'Unknown')}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        if status == 429:
+            head.append("Retry-After: 1")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+
+def main():
+    host = sys.argv[1] if len(sys.argv) > 1 else SERVER_HOST
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else SERVER_PORT
+    fruit_metrics.configure_from_env()
+    service = FruitService(host, port)
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        print("👋 Fruit service stopped.")
+
+
+if __name__ == "__main__":
+    main()
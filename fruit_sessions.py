@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# -----------------------------
+# 多使用者的對話狀態：每個 session id 各有目前的水果、問答紀錄 (兼答案快取) 與 LLM 對話歷史。
+# 取代 ollama_chat.py / fruit_identifier1.py 的模組全域變數，也承載 chatbot 的 Q&A 對話歷史。
+# 閒置過久的 session 會被清除，各層容量都有上限 (超過時丟掉最久沒用到的)。
+# 每個 session 有自己的鎖，store 本身另有一把鎖；操作都很短、不做 I/O，
+# 執行緒或 asyncio 工作 (經由 executor) 同時存取都安全。
+# -----------------------------
+SESSION_IDLE_TIMEOUT_S = float(os.environ.get("FRUIT_SESSION_IDLE_S", "1800"))
+MAX_SESSIONS = int(os.environ.get("FRUIT_MAX_SESSIONS", "256"))
+# 單一 session 最多記住幾種水果的紀錄、每種水果最多快取幾個答案
+MAX_FRUITS_PER_SESSION = 16
+MAX_ANSWERS_PER_FRUIT = 32
+
+
+def _bounded_set(mapping, key, value, limit):
+    mapping[key] = value
+    mapping.move_to_end(key)
+    while len(mapping) > limit:
+        mapping.popitem(last=False)
+
+
+class Session:
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.lock = threading.RLock()
+        self.fruit_name = ""
+        self.fruit_info = {}
+        self.last_used = time.monotonic()
+        self._answers = OrderedDict()  # 小寫水果名 -> OrderedDict(問題 key -> 答案)
+        self._chats = OrderedDict()    # 小寫水果名 -> LLM messages
+
+    def set_fruit(self, fruit_name, fruit_info):
+        """切換目前的水果，並重置該水果的問答紀錄"""
+        with self.lock:
+            self.fruit_name = fruit_name
+            self.fruit_info = fruit_info or {}
+            self._answers.pop((fruit_name or "").lower(), None)
+
+    def cached_answer(self, fruit_name, key):
+        """這個水果問過同樣的問題時回傳先前的答案，否則回傳 None"""
+        with self.lock:
+            answers = self._answers.get((fruit_name or "").lower())
+            return answers.get(key) if answers else None
+
+    def remember_answer(self, fruit_name, key, answer):
+        with self.lock:
+            fruit = (fruit_name or "").lower()
+            answers = self._answers.get(fruit)
+            if answers is None:
+                answers = OrderedDict()
+                _bounded_set(self._answers, fruit, answers, MAX_FRUITS_PER_SESSION)
+            else:
+                self._answers.move_to_end(fruit)
+            _bounded_set(answers, key, answer, MAX_ANSWERS_PER_FRUIT)
+
+    def chat(self, fruit_name, create=None):
+        """
+        回傳這個水果的 LLM 對話歷史 (呼叫端須持有 self.lock 再修改)；
+        不存在時若有給 create (初始 messages) 就建立，否則回傳 None
+        """
+        with self.lock:
+            fruit = fruit_name.lower()
+            messages = self._chats.get(fruit)
+            if messages is None and create is not None:
+                messages = list(create)
+                _bounded_set(self._chats, fruit, messages, MAX_FRUITS_PER_SESSION)
+            elif messages is not None:
+                self._chats.move_to_end(fruit)
+            return messages
+
+    def reset(self, fruit_name=None):
+        """清除問答紀錄與對話歷史；fruit_name 為 None 時清除全部水果"""
+        with self.lock:
+            if fruit_name is None:
+                self._answers.clear()
+                self._chats.clear()
+            else:
+                self._answers.pop(fruit_name.lower(), None)
+                self._chats.pop(fruit_name.lower(), None)
+
+
+class SessionStore:
+    def __init__(self, idle_timeout=SESSION_IDLE_TIMEOUT_S, max_sessions=MAX_SESSIONS):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()  # 依最近使用排序，最舊的在前
+        self.evicted = 0
+
+    def _evict(self, now):
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - session.last_used < self.idle_timeout:
+                break
+            del self._sessions[session_id]
+            self.evicted += 1
+
+    def get(self, session_id, create=True):
+        """取得 session (並更新最後使用時間)；不存在且 create=False 時回傳 None"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                if not create:
+                    return None
+                session = self._sessions[session_id] = Session(session_id)
+            self._sessions.move_to_end(session_id)
+            session.last_used = now
+            self._evict(now)
+            return session
+
+    def discard(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def stats(self):
+        with self._lock:
+            return {"sessions": len(self._sessions), "evicted": self.evicted}
+
+
+_store = SessionStore()
+
+
+def get_session(session_id, create=True):
+    return _store.get(session_id, create)
+
+
+def discard_session(session_id):
+    _store.discard(session_id)
+
+
+def session_stats():
+    return _store.stats()
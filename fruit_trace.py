@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+# -----------------------------
+# 參數設定
+# -----------------------------
+# 設定 FRUIT_TRACE_PATH 才會開始記錄；未設定時 record_event() 不做任何事
+TRACE_PATH = os.environ.get("FRUIT_TRACE_PATH", "")
+# 辨識請求的圖片另存於此 (以內容雜湊命名)，重播時才找得到原始輸入
+TRACE_IMAGES_DIR = os.environ.get("FRUIT_TRACE_IMAGES_DIR", "trace_images")
+
+_lock = threading.Lock()
+_trace_file = None
+
+
+def enable_tracing(path, images_dir=None):
+    """開始將事件寫入 path (JSON Lines)；path 為空字串則停止記錄"""
+    global TRACE_PATH, TRACE_IMAGES_DIR, _trace_file
+    with _lock:
+        if _trace_file is not None:
+            _trace_file.close()
+            _trace_file = None
+        TRACE_PATH = path or ""
+        if images_dir is not None:
+            TRACE_IMAGES_DIR = images_dir
+
+
+def disable_tracing():
+    enable_tracing("")
+
+
+def tracing_enabled():
+    return bool(TRACE_PATH)
+
+
+def hash_bytes(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def hash_file(path):
+    with open(path, "rb") as f:
+        return hash_bytes(f.read())
+
+
+def save_trace_image(digest, image_path=None, image_bytes=None):
+    """把辨識輸入存成 TRACE_IMAGES_DIR/<digest><ext>，同內容只存一次"""
+    ext = os.path.splitext(image_path)[1].lower() if image_path else ".jpg"
+    target = os.path.join(TRACE_IMAGES_DIR, digest + (ext or ".jpg"))
+    if os.path.exists(target):
+        return target
+    os.makedirs(TRACE_IMAGES_DIR, exist_ok=True)
+    if image_bytes is not None:
+        with open(target, "wb") as f:
+            f.write(image_bytes)
+    else:
+        shutil.copyfile(image_path, target)
+    return target
+
+
+def record_event(kind, **fields):
+    """
+    記錄一筆事件，kind 為 identify / info / ask。
+    常見欄位：input_hash, fruit, question, model, latency_s, cache_hit
+    """
+    global _trace_file
+    if not TRACE_PATH:
+        return
+    event = {"ts": round(time.time(), 6), "kind": kind}
+    event.update(fields)
+    line = json.dumps(event, ensure_ascii=False)
+    with _lock:
+        if not TRACE_PATH:
+            return
+        if _trace_file is None:
+            _trace_file = open(TRACE_PATH, "a", encoding="utf-8")
+        _trace_file.write(line + "\n")
+        _trace_file.flush()
+
+
+def load_events(path):
+    """讀回 record_event() 寫出的事件，依時間排序"""
+    events = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            event = json.loads(line)
+            if event.get("kind") in ("identify", "info", "ask"):
+                events.append(event)
+    events.sort(key=lambda e: e.get("ts", 0))
+    return events
@@ -0,0 +1,256 @@
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+
+import audio_stream
+import capture_governor
+import chatbot
+import fruit_metrics
+
+# -----------------------------
+# 無螢幕的 Webcam 模式：不開視窗，把疊加結果的畫面以 MJPEG 串流提供給瀏覽器，
+# 辨識 / 語音指令改由 HTTP 觸發 (取代 cv2.waitKey)。
+# 只有在有用戶端連線時才畫疊加文字、編碼 JPEG，且頻率有上限。
+#   python headless_webcam.py --port 8090
+#   瀏覽器開 http://127.0.0.1:8090/ ，或 curl -X POST http://127.0.0.1:8090/trigger/o
+# -----------------------------
+STREAM_PORT = 8090
+# 串流的最高編碼頻率；攝影機仍以原本的 FPS 讀取，只是不是每張都編碼
+STREAM_FPS = float(os.environ.get("FRUIT_STREAM_FPS", "5"))
+JPEG_QUALITY = 75
+BOUNDARY = "fruitframe"
+
+INDEX_PAGE = """<!doctype html>
+<html><head><meta charset="utf-8"><title>Fruit Information</title></head>
+<body>
+<img src="/stream" alt="stream"><br>
+{buttons}
+<pre id="state"></pre>
+<script>
+async function trigger(cmd) {{
+  const r = await fetch('/trigger/' + cmd, {{method: 'POST'}});
+  document.getElementById('state').textContent = JSON.stringify(await r.json(), null, 2);
+}}
+</script>
+</body></html>
+"""
+
+
+class FrameHub:
+    """保存最新的原始畫面；有串流用戶端時才依頻率上限產生疊加後的 JPEG"""
+
+    def __init__(self, state, fps=STREAM_FPS):
+        self.state = state
+        self.min_interval = 1.0 / fps if fps > 0 else 0.0
+        self._cond = threading.Condition()
+        self._frame = None
+        self._jpeg = None
+        self._jpeg_id = 0
+        self._encoded_at = 0.0
+        self.clients = 0
+        self.frames_read = 0
+
+    def _encode(self, frame):
+        with fruit_metrics.timed("stream_encode"):
+            ok, encoded = cv2.imencode(".jpg", chatbot.draw_overlay(frame, self.state),
+                                       [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        return encoded.tobytes() if ok else None
+
+    def update(self, frame):
+        """由擷取迴圈呼叫"""
+        now = time.monotonic()
+        with self._cond:
+            self._frame = frame
+            self.frames_read += 1
+            due = self.clients > 0 and now - self._encoded_at >= self.min_interval
+            if due:
+                self._encoded_at = now
+        if not due:
+            return
+        jpeg = self._encode(frame)
+        if jpeg is None:
+            return
+        with self._cond:
+            self._jpeg = jpeg
+            self._jpeg_id += 1
+            self._cond.notify_all()
+        fruit_metrics.inc("fruit_stream_frames_total")
+
+    def latest_frame(self):
+        with self._cond:
+            return self._frame
+
+    def snapshot(self):
+        """目前畫面的 JPEG (按需編碼，不影響串流頻率)"""
+        frame = self.latest_frame()
+        return None if frame is None else self._encode(frame)
+
+    def next_jpeg(self, last_id, timeout=5.0):
+        """等待比 last_id 更新的一張 JPEG；逾時回傳 (last_id, None)"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._jpeg_id > last_id, timeout)
+            if self._jpeg_id > last_id:
+                return self._jpeg_id, self._jpeg
+            return last_id, None
+
+    def add_client(self, delta):
+        with self._cond:
+            self.clients += delta
+
+    def stats(self):
+        with self._cond:
+            return {"clients": self.clients, "frames_read": self.frames_read, "frames_encoded": self._jpeg_id}
+
+
+class HeadlessHandler(BaseHTTPRequestHandler):
+    server_version = "FruitHeadless/0.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload):
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json")
+
+    def do_GET(self):
+        hub = self.server.hub
+        if self.path == "/":
+            buttons = "\n".join(f'<button onclick="trigger(\'{cmd}\')">{cmd}: {text}</button>'
+                                for cmd, text in chatbot.WebcamState.COMMANDS.items())
+            self._send(200, INDEX_PAGE.format(buttons=buttons).encode("utf-8"), "text/html; charset=utf-8")
+        elif self.path == "/stream":
+            self._stream(hub)
+        elif self.path == "/snapshot.jpg":
+            jpeg = hub.snapshot()
+            if jpeg is None:
+                self._send_json(503, {"error": "no frame yet"})
+            else:
+                self._send(200, jpeg, "image/jpeg")
+        elif self.path == "/state":
+            self._send_json(200, dict(hub.state.snapshot(), stream=hub.stats()))
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def _stream(self, hub):
+        self.send_response(200)
+        self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        hub.add_client(1)
+        last_id = 0
+        try:
+            while not self.server.stop_event.is_set():
+                last_id, jpeg = hub.next_jpeg(last_id)
+                if jpeg is None:
+                    continue
+                self.wfile.write(f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                                 f"Content-Length: {len(jpeg)}\r\n\r\n".encode("ascii"))
+                self.wfile.write(jpeg)
+                self.wfile.write(b"\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            hub.add_client(-1)
+
+    def do_POST(self):
+        if not self.path.startswith("/trigger/"):
+            self._send_json(404, {"error": "not found"})
+            return
+        command = self.path[len("/trigger/"):]
+        if command == "q":
+            self.server.stop_event.set()
+            self._send_json(200, {"stopping": True})
+            return
+        if command not in chatbot.WebcamState.COMMANDS:
+            self._send_json(404, {"error": f"unknown command '{command}'"})
+            return
+        frame = self.server.hub.latest_frame()
+        if frame is None:
+            self._send_json(503, {"error": "no frame yet"})
+            return
+        # 與視窗模式相同：已有指令在執行時直接拒絕，不排在後面等
+        if not self.server.command_lock.acquire(blocking=False):
+            fruit_metrics.inc("fruit_headless_triggers_rejected_total")
+            self._send_json(409, dict(self.server.hub.state.snapshot(), error="busy"))
+            return
+        # 指令在另一個執行緒中執行，擷取迴圈不會被辨識或錄音卡住
+        try:
+            self.server.commands.submit(self.server.hub.state.run_command, command, frame).result()
+        except Exception as e:
+            # 例如 Ollama 沒有回應；細節只印在伺服器端，用戶端收到一般的錯誤訊息
+            print(f"❌ 指令 {command} 執行失敗: {e}")
+            fruit_metrics.inc("fruit_headless_trigger_errors_total")
+            self._send_json(500, dict(self.server.hub.state.snapshot(), error="command failed"))
+            return
+        finally:
+            self.server.command_lock.release()
+        self._send_json(200, self.server.hub.state.snapshot())
+
+
+def run_headless_mode(camera=chatbot.CAMERA_INDEX, host="127.0.0.1", port=STREAM_PORT, fps=STREAM_FPS):
+    cap = chatbot.open_camera(camera)
+    if not cap.isOpened():
+        print("無法開啟攝影機。")
+        return
+
+    hub = FrameHub(chatbot.WebcamState(), fps)
+    server = ThreadingHTTPServer((host, port), HeadlessHandler)
+    server.daemon_threads = True
+    server.hub = hub
+    server.stop_event = threading.Event()
+    server.commands = ThreadPoolExecutor(max_workers=1)
+    server.command_lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"📡 Headless webcam on http://{host}:{server.server_address[1]}/ "
+          f"(stream /stream, POST /trigger/<o|m|s|c|x|q>)")
+
+    # 麥克風預先開啟，第一次語音指令就有 pre-roll
+    audio_stream.open_stream()
+    # 推論進行中降低擷取頻率，把 CPU 讓給 Ollama
+    governor = capture_governor.CaptureGovernor(cap)
+    try:
+        while not server.stop_event.is_set():
+            with fruit_metrics.timed("capture"):
+                ret, frame = governor.read()
+            if not ret:
+                break
+            hub.update(frame)
+            server.stop_event.wait(governor.frame_done())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop_event.set()
+        server.shutdown()
+        server.commands.shutdown(wait=False)
+        governor.close()
+        audio_stream.close_stream()
+        cap.release()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Webcam mode without a window: MJPEG stream and HTTP triggers")
+    parser.add_argument("--camera", type=int, default=chatbot.CAMERA_INDEX)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=STREAM_PORT)
+    parser.add_argument("--fps", type=float, default=STREAM_FPS, help="max stream frames per second")
+    args = parser.parse_args()
+
+    fruit_metrics.configure_from_env()
+    run_headless_mode(args.camera, args.host, args.port, args.fps)
+
+
+if __name__ == "__main__":
+    main()
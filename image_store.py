@@ -0,0 +1,188 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from fruit_images import IMAGES_DIR, list_reference_images
+
+# -----------------------------
+# 參數設定
+# -----------------------------
+# images/ 約 350 張大小不一的 JPEG/PNG；一次解碼、正規化成固定大小的縮圖，
+# 存成連續的 .npy (N, S, S, 3) uint8 (BGR，與 OpenCV 一致)，之後以 memmap 零複製讀取
+STORE_DIR = "image_store"
+THUMB_SIZE = 224
+INGEST_WORKERS = os.cpu_count() or 2
+STORE_SCHEMA = 1
+
+IMAGES_FILE = "images.npy"
+INDEX_FILE = "index.json"
+
+
+def _file_key(path):
+    stat = os.stat(path)
+    return {"path": path, "mtime": stat.st_mtime_ns, "bytes": stat.st_size}
+
+
+def _signature(keys):
+    digest = hashlib.sha1()
+    for key in keys:
+        digest.update(f"{key['path']}|{key['mtime']}|{key['bytes']}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def normalize_image(image, size=THUMB_SIZE):
+    """補邊成正方形 (保持比例，以邊緣像素延伸)，再縮放為 size x size"""
+    h, w = image.shape[:2]
+    side = max(h, w)
+    top, left = (side - h) // 2, (side - w) // 2
+    square = cv2.copyMakeBorder(image, top, side - h - top, left, side - w - left, cv2.BORDER_REPLICATE)
+    interpolation = cv2.INTER_AREA if side > size else cv2.INTER_LINEAR
+    return cv2.resize(square, (size, size), interpolation=interpolation)
+
+
+def decode_thumbnail(path, size=THUMB_SIZE):
+    """解碼並正規化一張圖，無法解碼時回傳 None"""
+    image = cv2.imread(path, cv2.IMREAD_COLOR)
+    return None if image is None else normalize_image(image, size)
+
+
+def _decode_job(args):
+    path, size = args
+    return decode_thumbnail(path, size)
+
+
+class ImageStore:
+    """已建置的縮圖庫：images 為唯讀 memmap，切片不會複製資料"""
+
+    def __init__(self, store_dir=STORE_DIR):
+        with open(os.path.join(store_dir, INDEX_FILE), "r", encoding="utf-8") as f:
+            self.index = json.load(f)
+        self.images = np.load(os.path.join(store_dir, IMAGES_FILE), mmap_mode="r")
+        self.items = self.index["items"]
+        self.paths = [item["path"] for item in self.items]
+        self.labels = [item["label"] for item in self.items]
+        self.size = self.index["size"]
+
+    def __len__(self):
+        return len(self.items)
+
+    def label_names(self):
+        return sorted(set(self.labels))
+
+    def indices_for(self, label):
+        return [i for i, name in enumerate(self.labels) if name == label]
+
+    def label_array(self):
+        """每張圖對應 label_names() 中的索引，方便餵給分類器"""
+        names = self.label_names()
+        lookup = {name: i for i, name in enumerate(names)}
+        return np.array([lookup[name] for name in self.labels], dtype=np.int32)
+
+
+def load_store(store_dir=STORE_DIR):
+    return ImageStore(store_dir)
+
+
+def _read_index(store_dir):
+    path = os.path.join(store_dir, INDEX_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        index = json.load(f)
+    return index if index.get("schema") == STORE_SCHEMA else None
+
+
+def build_store(images_dir=IMAGES_DIR, store_dir=STORE_DIR, size=THUMB_SIZE, workers=INGEST_WORKERS, force=False):
+    """
+    建置 (或增量更新) 縮圖庫。檔案未變動的圖直接沿用舊縮圖，只解碼新增或修改過的圖，
+    解碼以 process pool 並行。回傳 (index, 解碼張數)
+    """
+    reference = list_reference_images(images_dir)
+    keys = [dict(_file_key(path), label=label) for path, label in reference]
+    signature = _signature(keys)
+
+    previous = None if force else _read_index(store_dir)
+    if previous and previous["size"] == size and previous["source_signature"] == signature:
+        return previous, 0
+
+    reusable = {}
+    old_images = None
+    if previous and previous["size"] == size:
+        old_images = np.load(os.path.join(store_dir, IMAGES_FILE), mmap_mode="r")
+        for i, item in enumerate(previous["items"]):
+            reusable[(item["path"], item["mtime"], item["bytes"])] = i
+
+    todo = [k for k in keys if (k["path"], k["mtime"], k["bytes"]) not in reusable]
+    decoded = {}
+    if todo:
+        with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+            jobs = [(k["path"], size) for k in todo]
+            for key, thumb in zip(todo, pool.map(_decode_job, jobs, chunksize=8)):
+                if thumb is None:
+                    print(f"⚠️ 無法解碼 {key['path']}，略過。")
+                    continue
+                decoded[key["path"]] = thumb
+
+    items = [k for k in keys if k["path"] in decoded or (k["path"], k["mtime"], k["bytes"]) in reusable]
+    os.makedirs(store_dir, exist_ok=True)
+    tmp_images = os.path.join(store_dir, IMAGES_FILE + ".tmp.npy")
+    out = np.lib.format.open_memmap(tmp_images, mode="w+", dtype=np.uint8, shape=(len(items), size, size, 3))
+    for i, key in enumerate(items):
+        if key["path"] in decoded:
+            out[i] = decoded[key["path"]]
+        else:
+            out[i] = old_images[reusable[(key["path"], key["mtime"], key["bytes"])]]
+    out.flush()
+    del out, old_images
+
+    index = {
+        "schema": STORE_SCHEMA,
+        "size": size,
+        "count": len(items),
+        "color": "BGR",
+        "source_signature": signature,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "items": items,
+    }
+    tmp_index = os.path.join(store_dir, INDEX_FILE + ".tmp")
+    with open(tmp_index, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=1, ensure_ascii=False)
+    os.replace(tmp_images, os.path.join(store_dir, IMAGES_FILE))
+    os.replace(tmp_index, os.path.join(store_dir, INDEX_FILE))
+    return index, len(decoded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory-mapped thumbnail store for the reference images")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="ingest images/ (only changed files are decoded again)")
+    build.add_argument("--images", default=IMAGES_DIR)
+    build.add_argument("--out", default=STORE_DIR)
+    build.add_argument("--size", type=int, default=THUMB_SIZE)
+    build.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    build.add_argument("--force", action="store_true", help="decode everything again")
+    info = sub.add_parser("info", help="print store summary")
+    info.add_argument("--store", default=STORE_DIR)
+    args = parser.parse_args()
+
+    if args.command == "info":
+        store = load_store(args.store)
+        print(f"{len(store)} thumbnails {store.size}x{store.size}, built {store.index['built_at']}")
+        for label in store.label_names():
+            print(f"- {label}: {len(store.indices_for(label))}")
+        return
+
+    start = time.perf_counter()
+    index, decoded = build_store(args.images, args.out, args.size, args.workers, args.force)
+    elapsed = time.perf_counter() - start
+    print(f"📦 {index['count']} thumbnails in {args.out} ({decoded} decoded, {elapsed:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
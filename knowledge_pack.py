@@ -0,0 +1,198 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+# -----------------------------
+# 離線知識包：事先把 ALLOWED_FRUITS 中資料集沒有的水果
+# 從 Wikipedia 抓下、用 LLM 摘要並驗證，存成帶版本的 JSON，
+# 執行時由 chatbot.get_fruit_info 直接讀取，不必在請求當下連網。
+#   python knowledge_pack.py build --workers 4
+# -----------------------------
+PACK_SCHEMA = 1
+BUILD_WORKERS = 4
+
+_cache_lock = threading.Lock()
+_cache = {"path": None, "mtime": None, "entries": {}}
+
+
+def validate_entry(entry):
+    """回傳問題清單；空清單代表通過"""
+    problems = []
+    for field, prefix in (("nutrition", "nutrition:"), ("health_benefits", "health:")):
+        value = (entry.get(field) or "").strip()
+        body = value[len(prefix):].strip() if value.lower().startswith(prefix) else value
+        if not body or body == "無" or "???" in body:
+            problems.append(f"{field} is empty")
+        elif len(body) < 10:
+            problems.append(f"{field} is too short")
+    if not (entry.get("fruit") or "").strip():
+        problems.append("fruit name is missing")
+    return problems
+
+
+def read_pack(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        pack = json.load(f)
+    if pack.get("schema") != PACK_SCHEMA:
+        print(f"⚠️ 知識包 {path} 格式版本 {pack.get('schema')} 不支援，略過。")
+        return None
+    return pack
+
+
+def load_entries(path):
+    """讀取知識包並依檔案修改時間快取，回傳 {小寫水果名: entry}"""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}
+    with _cache_lock:
+        if _cache["path"] == path and _cache["mtime"] == mtime:
+            return _cache["entries"]
+    try:
+        pack = read_pack(path)
+    except ValueError as e:
+        print(f"⚠️ 知識包 {path} 無法解析: {e}")
+        pack = None
+    entries = {e["fruit"].lower(): e for e in (pack or {}).get("entries", [])}
+    with _cache_lock:
+        _cache.update(path=path, mtime=mtime, entries=entries)
+    return entries
+
+
+def lookup(fruit_name, path):
+    entry = load_entries(path).get(fruit_name.lower())
+    if entry is None:
+        return None
+    return {
+        "fruit": entry["fruit"],
+        "nutrition": entry["nutrition"],
+        "health_benefits": entry["health_benefits"],
+    }
+
+
+def extracts(path):
+    """知識包保存的 Wikipedia 原文 {水果名: 原文}；舊版知識包沒有這個欄位"""
+    return {e["fruit"]: e["extract"] for e in load_entries(path).values() if e.get("extract")}
+
+
+def write_pack(path, entries, failed):
+    previous = read_pack(path) or {}
+    pack = {
+        "schema": PACK_SCHEMA,
+        "version": previous.get("version", 0) + 1,
+        "built_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "entries": sorted(entries, key=lambda e: e["fruit"]),
+        "failed": sorted(failed),
+    }
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(pack, f, indent=4, ensure_ascii=False)
+    # 先寫暫存檔再替換，執行中的程式不會讀到寫一半的知識包
+    os.replace(tmp_path, path)
+    return pack
+
+
+# -----------------------------
+# 批次建置
+# -----------------------------
+def _build_one(fetch, fruit):
+    start = time.perf_counter()
+    info = fetch(fruit)
+    elapsed = time.perf_counter() - start
+    if not info:
+        return fruit, None, ["fetch failed"], elapsed
+    entry = {
+        "fruit": fruit,
+        "nutrition": info.get("nutrition", ""),
+        "health_benefits": info.get("health_benefits", ""),
+        "source": "wikipedia+llama3",
+    }
+    if info.get("extract"):
+        entry["extract"] = info["extract"]
+    return fruit, entry, validate_entry(entry), elapsed
+
+
+def build_pack(fruits, path, workers=BUILD_WORKERS, fetch=None):
+    """
+    並行抓取、摘要並驗證每種水果，寫出新版本的知識包。
+    驗證失敗的水果若舊版知識包中有有效資料，沿用舊資料。
+    """
+    if fetch is None:
+        import chatbot
+        fetch = chatbot.fetch_fruit_info_online
+
+    previous = {e["fruit"].lower(): e for e in (read_pack(path) or {}).get("entries", [])}
+    entries = {}
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(_build_one, fetch, fruit) for fruit in fruits]
+        for future in as_completed(futures):
+            fruit, entry, problems, elapsed = future.result()
+            if entry is not None and not problems:
+                entries[fruit.lower()] = entry
+                print(f"✅ {fruit} ({elapsed:.1f}s)")
+                continue
+            print(f"⚠️ {fruit} 驗證失敗: {', '.join(problems)} ({elapsed:.1f}s)")
+            failed.append(fruit)
+            if fruit.lower() in previous:
+                entries[fruit.lower()] = previous[fruit.lower()]
+
+    # 這次沒有重建的舊資料也保留
+    for key, entry in previous.items():
+        entries.setdefault(key, entry)
+    return write_pack(path, list(entries.values()), failed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the offline fruit knowledge pack")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="fetch, summarize and validate fruits into the pack")
+    build.add_argument("--all", action="store_true", help="rebuild every allowed fruit, not only dataset gaps")
+    build.add_argument("--fruits", help="comma separated fruit names (default: ALLOWED_FRUITS)")
+    build.add_argument("--workers", type=int, default=BUILD_WORKERS)
+    build.add_argument("--out", help="pack path (default: chatbot.KNOWLEDGE_PACK_PATH)")
+    show = sub.add_parser("show", help="print pack version and entries")
+    show.add_argument("--path", help="pack path (default: chatbot.KNOWLEDGE_PACK_PATH)")
+    args = parser.parse_args()
+
+    import chatbot
+
+    if args.command == "show":
+        pack = read_pack(args.path or chatbot.KNOWLEDGE_PACK_PATH)
+        if not pack:
+            print("⚠️ 找不到知識包。")
+            return
+        print(f"version {pack['version']} built {pack['built_at']}")
+        for entry in pack["entries"]:
+            print(f"- {entry['fruit']}")
+        if pack.get("failed"):
+            print(f"failed: {', '.join(pack['failed'])}")
+        return
+
+    fruits = [f.strip() for f in args.fruits.split(",")] if args.fruits else list(chatbot.ALLOWED_FRUITS)
+    if not args.all and not args.fruits:
+        known = {f["fruit"].lower() for f in chatbot.load_fruit_dataset()}
+        fruits = [f for f in fruits if f.lower() not in known]
+    if not fruits:
+        print("✅ 所有允許的水果都已在資料集中，無需建置。")
+        return
+
+    path = args.out or chatbot.KNOWLEDGE_PACK_PATH
+    print(f"📦 Building {len(fruits)} fruits into {path} with {args.workers} workers")
+    pack = build_pack(fruits, path, args.workers)
+    print(f"📦 Knowledge pack v{pack['version']}: {len(pack['entries'])} entries, {len(pack['failed'])} failed")
+    if pack["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from datetime import datetime, timezone
+
+# -----------------------------
+# 非模型熱路徑的微基準測試：ollama / wikipedia / wit / pyaudio 以 sys.modules 替身取代，
+# 只量測每次請求都會跑、平常量不到的 Python / OpenCV 程式碼：
+#   wrap_text 逐字 getTextSize、get_fruit_info 重讀 JSON 與掃描、identify_fruit 的正規表示式清理、
+#   query_ai_for_fruit 的營養字串解析、畫面 cv2.imwrite 來回
+#   python micro_benchmark.py run                       → bench_results/<commit>.json
+#   python micro_benchmark.py compare old.json new.json → 比較兩次結果，變慢超過門檻時 exit 1
+# -----------------------------
+RESULTS_DIR = "bench_results"
+# 每一輪至少量測這麼久 (秒)，迭代次數依此自動校準
+MIN_ROUND_S = 0.05
+ROUNDS = 7
+# compare 時中位數變慢超過此比例視為退步
+REGRESSION_THRESHOLD = 0.10
+# 攝影機迴圈的幀率 (chatbot.open_camera 預設)，用來換算每幀預算占比
+CAMERA_FPS = 15
+FRAME_SIZES = ((640, 480), (1280, 720))
+DATASET_SIZES = (13, 1000, 10000)
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+LLAVA_REPLY = "**Answer:** banana."
+WIKI_TEXT = "The banana is an elongated, edible fruit. It is one of the most widely eaten fruits in the world."
+
+
+# -----------------------------
+# 外部服務替身：只提供 chatbot 匯入與熱路徑會碰到的名稱
+# -----------------------------
+def _install_stubs():
+    ollama = types.ModuleType("ollama")
+
+    def chat(**kwargs):
+        return {"message": {"role": "assistant", "content": LLAVA_REPLY}, "eval_count": 4,
+                "eval_duration": 1_000_000, "prompt_eval_count": 32, "prompt_eval_duration": 1_000_000}
+
+    class Client:
+        def __init__(self, host=None, **kwargs):
+            self.host = host
+
+        def chat(self, **kwargs):
+            return chat(**kwargs)
+
+    class ResponseError(Exception):
+        pass
+
+    ollama.chat, ollama.Client, ollama.ResponseError = chat, Client, ResponseError
+
+    wikipedia = types.ModuleType("wikipedia")
+
+    class DisambiguationError(Exception):
+        def __init__(self, title="", options=()):
+            super().__init__(title)
+            self.options = list(options)
+
+    wikipedia.wikipedia = types.SimpleNamespace(API_URL="")
+    wikipedia.DisambiguationError = DisambiguationError
+    wikipedia.set_lang = lambda lang: None
+    wikipedia.summary = lambda title, sentences=2: WIKI_TEXT
+    wikipedia.page = lambda title: types.SimpleNamespace(content=WIKI_TEXT)
+
+    wit = types.ModuleType("wit")
+
+    class Wit:
+        def __init__(self, access_token):
+            self.access_token = access_token
+
+        def speech(self, audio, headers):
+            return {"text": ""}
+
+    wit.Wit = Wit
+
+    pyaudio = types.ModuleType("pyaudio")
+    pyaudio.paInt16, pyaudio.paContinue = 8, 0
+
+    class PyAudio:
+        def get_sample_size(self, fmt):
+            return 2
+
+    pyaudio.PyAudio = PyAudio
+
+    sys.modules.update(ollama=ollama, wikipedia=wikipedia, wit=wit, pyaudio=pyaudio)
+
+
+def _import_chatbot(workdir):
+    """chatbot 匯入時會讀取目前目錄的 wit_token.txt，並把畫面寫到 current_frame.jpg，都放在暫存目錄"""
+    _install_stubs()
+    with open(os.path.join(workdir, "wit_token.txt"), "w") as f:
+        f.write("benchmark")
+    os.environ.pop("FRUIT_TRACE_PATH", None)
+    os.environ["FRUIT_OLLAMA_PROFILE"] = os.path.join(workdir, "ollama_profile.json")
+    os.environ["FRUIT_KNOWLEDGE_PACK"] = os.path.join(workdir, "knowledge_pack.json")
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_DIR)
+    import chatbot
+    return chatbot
+
+
+# -----------------------------
+# 量測
+# -----------------------------
+def _time_case(fn, rounds=ROUNDS, min_round_s=MIN_ROUND_S):
+    """校準每輪的迭代次數，回傳每次呼叫的秒數統計"""
+    fn()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_round_s:
+            break
+        number = max(number * 2, int(number * min_round_s / max(elapsed, 1e-9)))
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return {
+        "iterations": number,
+        "rounds": rounds,
+        "min_us": round(min(samples) * 1e6, 3),
+        "median_us": round(statistics.median(samples) * 1e6, 3),
+        "mean_us": round(statistics.fmean(samples) * 1e6, 3),
+        "stdev_us": round(statistics.stdev(samples) * 1e6, 3) if rounds > 1 else 0.0,
+    }
+
+
+def _cases(chatbot, workdir):
+    """回傳 [(名稱, 函式, 每幀是否都會執行)]"""
+    import cv2
+    import numpy as np
+
+    with open(os.path.join(REPO_DIR, "fruit_dataset.json"), "r", encoding="utf-8") as f:
+        base = json.load(f)
+    cases = []
+
+    # wrap_text：draw_overlay 每幀對三段文字各呼叫一次
+    entry = base[0]
+    for name, text, scale, thickness in (
+        ("fruit", f"Fruit: {entry['fruit']}", 1, 2),
+        ("nutrition", f"nutrition: {entry['nutrition']}", 1, 1),
+        ("health", f"health: {entry['health_benefits']}", 1, 1),
+    ):
+        cases.append((f"wrap_text[{name}]",
+                       lambda t=text, s=scale, th=thickness: chatbot.wrap_text(t, cv2.FONT_HERSHEY_SIMPLEX, s, th, 800),
+                       True))
+
+    # get_fruit_info：每次都重新讀取並掃描 JSON；查最後一筆 (最壞情況)
+    for size in DATASET_SIZES:
+        dataset = [dict(base[i % len(base)], fruit=base[i % len(base)]["fruit"] + ("" if i < len(base) else f" {i}"))
+                   for i in range(size)]
+        path = os.path.join(workdir, f"fruit_dataset_{size}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(dataset, f, ensure_ascii=False)
+        target = dataset[-1]["fruit"]
+
+        def lookup(path=path, target=target):
+            chatbot.FRUIT_JSON_PATH = path
+            return chatbot.get_fruit_info(target)
+        cases.append((f"get_fruit_info[{size}]", lookup, False))
+
+    # identify_fruit：替身直接回覆，量到的是 prompt 組裝、計時與回覆的正規表示式清理
+    image_path = os.path.join(workdir, "frame.jpg")
+    cv2.imwrite(image_path, np.full((480, 640, 3), 128, np.uint8))
+    cases.append(("identify_fruit[cleanup]",
+                  lambda: chatbot.identify_fruit(image_path=image_path, cascade=False), False))
+
+    # query_ai_for_fruit：結構化問題由意圖路由解析營養字串作答，不呼叫模型
+    fruit_info = base[0]
+    for name, question in (("calories", "How many calories does it have?"), ("zh_sugar_fiber", "它有多少糖和纖維？"),
+                           ("benefits", "What are its health benefits?")):
+        cases.append((f"query_ai_for_fruit[{name}]",
+                      lambda q=question: chatbot.query_ai_for_fruit(fruit_info["fruit"], fruit_info, question=q),
+                      False))
+
+    # 畫面來回：identify_fruit 把畫面寫成 JPEG 再交給模型 (模型端讀檔)
+    rng = np.random.default_rng(0)
+    for width, height in FRAME_SIZES:
+        # 平滑的漸層加少量雜訊，壓縮比接近真實攝影機畫面
+        gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+        frame = np.clip(gradient + rng.normal(0, 8, (height, width, 3)), 0, 255).astype(np.uint8)
+        frame_path = os.path.join(workdir, f"frame_{width}x{height}.jpg")
+
+        def round_trip(frame=frame, frame_path=frame_path):
+            cv2.imwrite(frame_path, frame)
+            return cv2.imread(frame_path)
+        cases.append((f"imwrite_round_trip[{width}x{height}]", round_trip, True))
+    return cases
+
+
+def _git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("-dirty" if dirty else "")
+
+
+def run(only=None, rounds=ROUNDS):
+    import cv2
+    import numpy as np
+
+    workdir = tempfile.mkdtemp(prefix="fruit_bench_")
+    cwd = os.getcwd()
+    try:
+        chatbot = _import_chatbot(workdir)
+        results = {}
+        frame_budget_us = 1e6 / CAMERA_FPS
+        for name, fn, per_frame in _cases(chatbot, workdir):
+            if only and not any(pattern in name for pattern in only):
+                continue
+            # 這些路徑會印出提示文字，量測時不輸出
+            stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+            try:
+                stats = _time_case(fn, rounds)
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+            if per_frame:
+                stats["frame_budget_pct"] = round(100 * stats["median_us"] / frame_budget_us, 3)
+            results[name] = stats
+            print(f"  {name:<48} {stats['median_us']:>12.1f} µs  (±{stats['stdev_us']:.1f}, n={stats['iterations']})")
+    finally:
+        os.chdir(cwd)
+    return {
+        "commit": _git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "camera_fps": CAMERA_FPS,
+        "results": results,
+    }
+
+
+def compare(old, new, threshold=REGRESSION_THRESHOLD):
+    """回傳變慢超過門檻的案例名稱清單，並印出每個案例的比例"""
+    regressions = []
+    print(f"{old['commit']} → {new['commit']}")
+    for name, stats in new["results"].items():
+        before = old["results"].get(name)
+        if before is None:
+            print(f"  {name:<48} {'(new)':>12}")
+            continue
+        ratio = stats["median_us"] / before["median_us"] if before["median_us"] else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  ⚠️ slower"
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            flag = "  ✅ faster"
+        print(f"  {name:<48} {before['median_us']:>10.1f} → {stats['median_us']:>10.1f} µs  x{ratio:.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the non-model hot paths")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("run", help="run the suite and write the results JSON")
+    bench.add_argument("--only", action="append", help="run cases whose name contains this text (repeatable)")
+    bench.add_argument("--rounds", type=int, default=ROUNDS)
+    bench.add_argument("--out", help=f"results path (default {RESULTS_DIR}/<commit>.json)")
+    diff = sub.add_parser("compare", help="compare two results files")
+    diff.add_argument("old")
+    diff.add_argument("new")
+    diff.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.old, "r", encoding="utf-8") as f:
+            old = json.load(f)
+        with open(args.new, "r", encoding="utf-8") as f:
+            new = json.load(f)
+        regressions = compare(old, new, args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)} case(s) slower than {args.threshold:.0%}")
+            sys.exit(1)
+        return
+
+    print("⏱️ Running microbenchmarks (model and network calls are stubbed)...")
+    report = run(args.only, args.rounds)
+    out = args.out or os.path.join(RESULTS_DIR, f"{report['commit']}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    tmp_path = out + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, out)
+    print(f"📄 Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
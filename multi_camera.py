@@ -0,0 +1,309 @@
+import argparse
+import sys
+import threading
+import time
+from collections import deque
+
+import cv2
+
+import chatbot
+import fruit_metrics
+import fruit_roi
+import ollama_pool
+
+# -----------------------------
+# 參數設定
+# -----------------------------
+# 每台攝影機最多排隊幾張待辨識的畫面；滿了就丟掉最舊的 (只留最新畫面)
+CAMERA_QUEUE_LIMIT = 2
+# 同時送往 Ollama 的辨識數，應與 OLLAMA_NUM_PARALLEL 一致
+SCHEDULER_WORKERS = ollama_pool.NUM_PARALLEL
+# 每台攝影機自動送出辨識的間隔 (秒)，0 表示只在按 'o' 時送出
+AUTO_RECOGNIZE_INTERVAL = 3.0
+LATENCY_WINDOW = 100
+
+
+class CameraStats:
+    def __init__(self):
+        self.submitted = 0
+        self.dropped = 0
+        self.completed = 0
+        self.failed = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.waits = deque(maxlen=LATENCY_WINDOW)
+
+    def snapshot(self, queue_depth):
+        latencies = sorted(self.latencies)
+        return {
+            "queue_depth": queue_depth,
+            "submitted": self.submitted,
+            "dropped": self.dropped,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_wait_s": round(sum(self.waits) / len(self.waits), 3) if self.waits else 0.0,
+            "avg_latency_s": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            "p95_latency_s": round(latencies[int(0.95 * (len(latencies) - 1))], 3) if latencies else 0.0,
+        }
+
+
+# -----------------------------
+# 共用推論排程器
+# -----------------------------
+class InferenceScheduler:
+    """
+    所有攝影機共用一個 Ollama：每台攝影機各有一個小佇列，
+    worker 以平滑加權輪詢 (smooth weighted round-robin) 挑選下一台有工作的攝影機。
+    權重全為 1 時就是一般的輪詢；權重較高的攝影機分到較多次，但不會讓其他攝影機餓死。
+    只要任何佇列有工作，worker 就不會閒置，模型維持滿載。
+    """
+
+    def __init__(self, workers=SCHEDULER_WORKERS, queue_limit=CAMERA_QUEUE_LIMIT, classify=None):
+        self.queue_limit = queue_limit
+        self.classify = classify or _classify_frame
+        self._cond = threading.Condition()
+        self._queues = {}
+        self._weights = {}
+        self._current = {}
+        self._stats = {}
+        self._running = True
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"scheduler-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for t in self._threads:
+            t.start()
+
+    def add_camera(self, camera_id, weight=1):
+        with self._cond:
+            self._queues[camera_id] = deque()
+            self._weights[camera_id] = max(1, int(weight))
+            self._current[camera_id] = 0
+            self._stats[camera_id] = CameraStats()
+
+    def submit(self, camera_id, frame, callback):
+        """排入一張畫面；callback(camera_id, fruit_name, latency) 會在 worker 執行緒被呼叫"""
+        with self._cond:
+            queue = self._queues[camera_id]
+            stats = self._stats[camera_id]
+            if len(queue) >= self.queue_limit:
+                queue.popleft()
+                stats.dropped += 1
+                fruit_metrics.inc("fruit_camera_dropped_total", camera=camera_id)
+            queue.append((frame, time.perf_counter(), callback))
+            stats.submitted += 1
+            self._cond.notify()
+
+    def pending(self, camera_id):
+        with self._cond:
+            return len(self._queues[camera_id])
+
+    def _pick(self):
+        ready = [cid for cid, q in self._queues.items() if q]
+        if not ready:
+            return None
+        total = 0
+        for cid in ready:
+            self._current[cid] += self._weights[cid]
+            total += self._weights[cid]
+        chosen = max(ready, key=lambda cid: self._current[cid])
+        self._current[chosen] -= total
+        return chosen
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                camera_id = self._pick()
+                while camera_id is None and self._running:
+                    self._cond.wait()
+                    camera_id = self._pick()
+                if not self._running:
+                    return
+                frame, submitted_at, callback = self._queues[camera_id].popleft()
+
+            started = time.perf_counter()
+            try:
+                fruit = self.classify(frame)
+                failed = False
+            except Exception as e:
+                print(f"⚠️ 攝影機 {camera_id} 辨識失敗: {e}")
+                fruit, failed = None, True
+            finished = time.perf_counter()
+
+            with self._cond:
+                stats = self._stats[camera_id]
+                stats.failed += failed
+                stats.completed += not failed
+                stats.waits.append(started - submitted_at)
+                stats.latencies.append(finished - submitted_at)
+            fruit_metrics.observe("fruit_camera_wait_seconds", started - submitted_at, camera=camera_id)
+            fruit_metrics.observe("fruit_camera_latency_seconds", finished - submitted_at, camera=camera_id)
+            try:
+                callback(camera_id, fruit, finished - submitted_at)
+            except Exception as e:
+                # callback 出錯不能讓 worker 執行緒結束，否則排程器會少一個 worker 且沒有任何訊息
+                print(f"⚠️ 攝影機 {camera_id} 的結果處理失敗: {e}")
+                fruit_metrics.inc("fruit_camera_callback_errors_total", camera=camera_id)
+
+    def stats(self):
+        with self._cond:
+            return {cid: self._stats[cid].snapshot(len(self._queues[cid])) for cid in self._queues}
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+
+def _classify_frame(frame):
+    if chatbot.ROI_CROP:
+        with fruit_metrics.timed("roi_crop"):
+            frame, _ = fruit_roi.crop_to_fruit(frame)
+    # 多個 worker 並行時不能共用 current_frame.jpg，改為在記憶體中編碼
+    with fruit_metrics.timed("jpeg_encode"):
+        ok, encoded = cv2.imencode(".jpg", frame)
+    if not ok:
+        return None
+    return chatbot.identify_fruit(image_bytes=encoded.tobytes())
+
+
+# -----------------------------
+# 攝影機 / 影片來源
+# -----------------------------
+class CameraFeed:
+    """背景執行緒持續讀取畫面，只保留最新一張；影片檔播完會從頭重播"""
+
+    def __init__(self, camera_id, source, width=640, height=480, fps=15):
+        self.camera_id = camera_id
+        self.source = int(source) if str(source).isdigit() else source
+        self.is_file = not isinstance(self.source, int)
+        if self.is_file:
+            self.cap = cv2.VideoCapture(self.source)
+        else:
+            self.cap = cv2.VideoCapture(self.source, cv2.CAP_V4L2)
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+            self.cap.set(cv2.CAP_PROP_FPS, fps)
+        file_fps = self.cap.get(cv2.CAP_PROP_FPS) if self.is_file else 0
+        self.frame_interval = 1.0 / file_fps if file_fps and file_fps > 0 else 0
+        self.lock = threading.Lock()
+        self.frame = None
+        self.running = self.cap.isOpened()
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+
+    def start(self):
+        if self.running:
+            self.thread.start()
+        return self.running
+
+    def _loop(self):
+        while self.running:
+            with fruit_metrics.timed("capture"):
+                ret, frame = self.cap.read()
+            if not ret:
+                if self.is_file:
+                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                break
+            with self.lock:
+                self.frame = frame
+            if self.frame_interval:
+                time.sleep(self.frame_interval)
+        self.running = False
+
+    def latest(self):
+        with self.lock:
+            return None if self.frame is None else self.frame.copy()
+
+    def release(self):
+        self.running = False
+        if self.thread.is_alive():
+            self.thread.join(timeout=1)
+        self.cap.release()
+
+
+# -----------------------------
+# 多攝影機模式
+# -----------------------------
+def run_multi_camera_mode(sources, weights=None, interval=AUTO_RECOGNIZE_INTERVAL, workers=SCHEDULER_WORKERS):
+    scheduler = InferenceScheduler(workers=workers)
+    feeds = []
+    results = {}
+    results_lock = threading.Lock()
+
+    for i, source in enumerate(sources):
+        camera_id = f"cam{i}"
+        feed = CameraFeed(camera_id, source)
+        if not feed.start():
+            print(f"無法開啟來源 {source}，略過。")
+            continue
+        feeds.append(feed)
+        scheduler.add_camera(camera_id, weights[i] if weights and i < len(weights) else 1)
+        results[camera_id] = ("", 0.0)
+        cv2.namedWindow(camera_id, cv2.WINDOW_NORMAL)
+
+    if not feeds:
+        print("沒有可用的攝影機。")
+        sys.exit(1)
+
+    def on_result(camera_id, fruit, latency):
+        with results_lock:
+            results[camera_id] = (fruit or "", latency)
+
+    print("Press 'o' to identify on every camera, 'p' to print scheduler stats, 'q' to quit.")
+    last_submit = {feed.camera_id: 0.0 for feed in feeds}
+
+    while any(feed.running for feed in feeds):
+        now = time.monotonic()
+        key = cv2.waitKey(1) & 0xFF
+        stats = scheduler.stats()
+
+        for feed in feeds:
+            frame = feed.latest()
+            if frame is None:
+                continue
+            camera_id = feed.camera_id
+            due = interval > 0 and now - last_submit[camera_id] >= interval
+            # 已有待辨識畫面時不再重複送，避免單一攝影機灌爆佇列
+            if (key == ord('o') or due) and scheduler.pending(camera_id) == 0:
+                scheduler.submit(camera_id, frame.copy(), on_result)
+                last_submit[camera_id] = now
+
+            with results_lock:
+                fruit, latency = results[camera_id]
+            cam_stats = stats[camera_id]
+            cv2.putText(frame, f"Fruit: {fruit}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.75, (255, 255, 255), 1)
+            cv2.putText(frame, f"queue={cam_stats['queue_depth']} last={latency:.2f}s "
+                               f"avg={cam_stats['avg_latency_s']:.2f}s",
+                        (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 1)
+            cv2.imshow(camera_id, frame)
+
+        if key == ord('q'):
+            break
+        elif key == ord('p'):
+            for camera_id, cam_stats in stats.items():
+                print(camera_id, cam_stats)
+
+    scheduler.stop()
+    for feed in feeds:
+        feed.release()
+    cv2.destroyAllWindows()
+    for camera_id, cam_stats in scheduler.stats().items():
+        print(camera_id, cam_stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fruit recognition on several cameras sharing one Ollama")
+    parser.add_argument("sources", nargs="+", help="camera indexes (e.g. 4) or video file paths")
+    parser.add_argument("--weights", help="comma separated scheduling weights per source, e.g. 2,1,1")
+    parser.add_argument("--interval", type=float, default=AUTO_RECOGNIZE_INTERVAL,
+                        help="seconds between automatic recognitions per camera (0 = only on 'o')")
+    parser.add_argument("--workers", type=int, default=SCHEDULER_WORKERS)
+    args = parser.parse_args()
+
+    weights = [int(w) for w in args.weights.split(",")] if args.weights else None
+    fruit_metrics.configure_from_env()
+    run_multi_camera_mode(args.sources, weights, args.interval, args.workers)
+
+
+if __name__ == "__main__":
+    main()
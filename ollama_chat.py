@@ -6,16 +6,16 @@ import json
 import sys
 import wikipedia
 from difflib import get_close_matches
+import fruit_roi
+import fruit_intents
+import fruit_sessions
 
 # 統一水果資料庫的 JSON 檔案路徑
 FRUIT_JSON_PATH = "/opt/NanoLLM/ollama_host/fruit_dataset.json"
 
-# 記錄使用者問過的問題，防止重複回答
-question_history = {}
-
-# 全域變數，方便在 CLI 模式下更換圖片時更新水果資訊
-fruit_name = ""
-fruit_info = {}
+# 對話狀態 (目前的水果、問過的問題) 存在 fruit_sessions，依 session id 區分使用者
+CLI_SESSION_ID = "cli"
+WEBCAM_SESSION_ID = "webcam"
 
 def identify_fruit(frame=None, image_path=None, confirm=True):
     """
@@ -23,6 +23,8 @@ def identify_fruit(frame=None, image_path=None, confirm=True):
     若 confirm 為 True 則會請使用者確認辨識結果（CLI 模式）。
     """
     if frame is not None:
+        # 只送出主要物體區域，並縮到 llava 原生輸入大小
+        frame, _ = fruit_roi.crop_to_fruit(frame)
         temp_path = "current_frame.jpg"
         cv2.imwrite(temp_path, frame)
         image_source = temp_path
@@ -131,70 +133,34 @@ def get_fruit_info(fruit_name):
             }
     return None
 
-def query_ai_for_fruit(fruit_name, fruit_info, query_type="general"):
+def query_ai_for_fruit(fruit_name, fruit_info, query_type="general", session=None, question=None):
     """
-    根據使用者詢問的問題類型，從 fruit_info 中解析資訊回答：
-      - calories：解析每 100g 的卡路里資訊
-      - vitamins：解析水果所含維生素資訊
+    根據使用者詢問的問題類型 (fruit_intents.route 的意圖)，從 fruit_info 中解析資訊回答：
+      - calories / sugar / protein / fiber / carbohydrates：每 100g 的含量
+      - vitamins / minerals：水果所含維生素、礦物質
       - health_benefits：回傳健康益處相關內容
       - general：給出通用回應
+    同一個 session 對同一個水果重複問同類問題時會提醒使用者
     """
-    if fruit_name not in question_history:
-        question_history[fruit_name] = set()
-    
-    if query_type in question_history[fruit_name]:
+    if session is None:
+        session = fruit_sessions.get_session(CLI_SESSION_ID)
+    if session.cached_answer(fruit_name, query_type) is not None:
         return "🤖 AI: You already asked that. Please try a different question."
-    question_history[fruit_name].add(query_type)
-    
-    structured = "Per 100g:" in fruit_info.get('nutrition', "")
-    
-    if query_type == "calories":
-        if structured:
-            try:
-                calories = fruit_info['nutrition'].split(':')[1].split(',')[0].strip()
-                return f"{fruit_name} per 100g contains {calories} calories."
-            except Exception:
-                return "⚠️ Unable to parse calorie information."
-        else:
-            match = re.search(r'(\d+)\s*kilocalories', fruit_info.get('nutrition', ""), re.IGNORECASE)
-            if match:
-                cal = match.group(1)
-                return f"{fruit_name} per 100g contains {cal} kilocalories."
-            else:
-                return f"Unable to find calorie information for {fruit_name}."
-    
-    elif query_type == "vitamins":
-        if structured:
-            try:
-                match = re.search(r"rich in (.+)", fruit_info.get('nutrition', ""), re.IGNORECASE)
-                if match:
-                    vitamins = match.group(1).strip()
-                    return f"{fruit_name} is rich in {vitamins}."
-                else:
-                    return f"No vitamin information found for {fruit_name}."
-            except Exception:
-                return "⚠️ Unable to parse vitamin information."
-        else:
-            matches = re.findall(r'vitamin\s*([A-Za-z]+)', fruit_info.get('nutrition', ""), re.IGNORECASE)
-            if matches:
-                vitamins = ", ".join(sorted(set(matches)))
-                return f"{fruit_name} is rich in vitamins: {vitamins}."
-            else:
-                return f"No vitamin information found for {fruit_name}."
-    
-    elif query_type == "health_benefits":
-        if structured:
-            return f"Health benefits of {fruit_name}: {fruit_info.get('health_benefits', 'No health benefits info.')}"
-        else:
-            idx = fruit_info.get('nutrition', "").find("Research")
-            if idx != -1:
-                health_text = fruit_info.get('nutrition', "")[idx:]
-                return f"Health benefits of {fruit_name}: {health_text}"
-            else:
-                return f"Health benefits of {fruit_name}: {fruit_info.get('nutrition', '')}"
     
+    if query_type == "general":
+        answer = f"{fruit_name} is a nutrient-rich fruit. What specific information do you need?"
     else:
-        return f"{fruit_name} is a nutrient-rich fruit. What specific information do you need?"
+        answer = fruit_intents.answer(fruit_name, fruit_info or {}, [query_type], question)
+        answer = answer or f"No {query_type.replace('_', ' ')} information found for {fruit_name}."
+    session.remember_answer(fruit_name, query_type, answer)
+    return answer
+
+
+def answer_intents(fruit_name, fruit_info, user_input, session=None):
+    """依意圖路由回答問題；沒有命中任何意圖時給通用回應 (這裡沒有 LLM 可退，用寬鬆的關鍵字)"""
+    intents = fruit_intents.route(user_input, broad=True)
+    return " ".join(query_ai_for_fruit(fruit_name, fruit_info, intent, session, question=user_input)
+                    for intent in intents or ["general"])
 
 def display_fruit_info(fruit_info):
     """在 CLI 模式下將水果資訊印出來"""
@@ -206,17 +172,16 @@ def display_fruit_info(fruit_info):
     print(f"🔹 Nutrition: {fruit_info.get('nutrition', 'N/A')}")
     print(f"🔹 Health Benefits: {fruit_info.get('health_benefits', 'N/A')}")
 
-def change_image(new_image_path):
+def change_image(new_image_path, session):
     """
-    在 CLI 對話中切換圖片，更新全域變數 fruit_name 與 fruit_info，
+    在 CLI 對話中切換圖片，更新 session 目前的水果與資訊，
     並重置該水果的問答紀錄。
     """
-    global fruit_name, fruit_info
     if os.path.exists(new_image_path):
         fruit_name = identify_fruit(image_path=new_image_path, confirm=True)
         fruit_info = get_fruit_info(fruit_name)
         display_fruit_info(fruit_info)
-        question_history[fruit_name] = set()
+        session.set_fruit(fruit_name, fruit_info)
         print("\n✅ Fruit switched. You can now ask questions about the new fruit!")
         return True
     else:
@@ -282,11 +247,13 @@ def run_webcam_mode():
         ret, frame = cap.read()
         if not ret:
             break
+        # Draw on a copy so recognition gets the frame without overlay text
+        display = frame.copy()
 
         # Wrap the fruit name (this part remains unchanged)
         fruit_lines = wrap_text(f"Fruit: {fruit_name_on_screen}", cv2.FONT_HERSHEY_SIMPLEX, 1.5, 2, max_width)
         for line in fruit_lines:
-            cv2.putText(frame, line, (10, fruit_name_y_pos), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 255, 255), 2)
+            cv2.putText(display, line, (10, fruit_name_y_pos), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 255, 255), 2)
             # No need to update fruit_name_y_pos, keeping it fixed
 
         # Position for nutrition info (fixed position)
@@ -294,7 +261,7 @@ def run_webcam_mode():
         # Wrap nutrition information
         nutrition_lines = wrap_text(nutrition_on_screen, cv2.FONT_HERSHEY_SIMPLEX, 1, 1, max_width)
         for line in nutrition_lines:
-            cv2.putText(frame, line, (10, nutrition_y_pos), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 1)
+            cv2.putText(display, line, (10, nutrition_y_pos), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 1)
             nutrition_y_pos += 50
 
         # Position for health benefits info (fixed position)
@@ -302,10 +269,10 @@ def run_webcam_mode():
         # Wrap health benefits information
         health_benefits_lines = wrap_text(health_benefits_on_screen, cv2.FONT_HERSHEY_SIMPLEX, 1, 1, max_width)
         for line in health_benefits_lines:
-            cv2.putText(frame, line, (10, health_benefits_y_pos), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 1)
+            cv2.putText(display, line, (10, health_benefits_y_pos), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 1)
             health_benefits_y_pos += 50
 
-        cv2.imshow("Fruit Information", frame)
+        cv2.imshow("Fruit Information", display)
         key = cv2.waitKey(1) & 0xFF
 
         if key == ord('q'):
@@ -322,18 +289,13 @@ def run_webcam_mode():
                 health_benefits_on_screen = local_fruit_info.get("health_benefits", "No health benefits info available.")
         elif key == ord('c'):
             print(f"\nChatting about {fruit_name_on_screen}:")
+            session = fruit_sessions.get_session(WEBCAM_SESSION_ID)
             while True:
                 user_input = input("🗨️ You (type 'exit' to go back): ").lower()
                 if user_input in ["exit", "quit", "back"]:
                     break
-                elif "calories" in user_input:
-                    print(query_ai_for_fruit(fruit_name_on_screen, local_fruit_info, query_type="calories"))
-                elif "vitamin" in user_input:
-                    print(query_ai_for_fruit(fruit_name_on_screen, local_fruit_info, query_type="vitamins"))
-                elif "health" in user_input:
-                    print(query_ai_for_fruit(fruit_name_on_screen, local_fruit_info, query_type="health_benefits"))
                 else:
-                    print(query_ai_for_fruit(fruit_name_on_screen, local_fruit_info))
+                    print(answer_intents(fruit_name_on_screen, local_fruit_info, user_input, session))
 
     cap.release()
     cv2.destroyAllWindows()
@@ -345,7 +307,9 @@ def run_cli_mode():
     CLI 模式：使用者依提示輸入圖片路徑進行水果辨識，之後進入對話迴圈，
     可使用 change_image 指令切換圖片，或 new_image 開始新對話。
     """
-    global fruit_name, fruit_info
+    # 整個對話沿用同一個 session 物件並傳給 change_image / answer_intents；
+    # 不再以 id 重新查詢，閒置逐出後也不會換到另一個空的 session
+    session = fruit_sessions.get_session(CLI_SESSION_ID)
     while True:
         image_path = input("\n📸 Enter image path (or type `exit` to quit): ").strip()
         if image_path.lower() == "exit":
@@ -354,6 +318,7 @@ def run_cli_mode():
 
         fruit_name = identify_fruit(image_path=image_path, confirm=True)
         fruit_info = get_fruit_info(fruit_name)
+        session.set_fruit(fruit_name, fruit_info)
 
         if not fruit_info:
             print(f"⚠️ No information available for '{fruit_name}'. Please manually search for its info.")
@@ -371,22 +336,13 @@ def run_cli_mode():
                 sys.exit(0)
             elif user_input.lower().startswith("change_image"):
                 new_image_path = user_input.replace("change_image", "").strip()
-                change_image(new_image_path)
+                change_image(new_image_path, session)
             elif user_input.lower() == "new_image":
                 break
-            elif "calories" in user_input.lower() or "卡路里" in user_input:
-                response = query_ai_for_fruit(fruit_name, fruit_info, query_type="calories")
-                print(f"🤖 AI: {response}")
-            elif "vitamin" in user_input.lower() or "維生素" in user_input:
-                response = query_ai_for_fruit(fruit_name, fruit_info, query_type="vitamins")
-                print(f"🤖 AI: {response}")
-            elif "health" in user_input.lower() or "益處" in user_input:
-                response = query_ai_for_fruit(fruit_name, fruit_info, query_type="health_benefits")
-                print(f"🤖 AI: {response}")
             elif user_input.lower() == "help":
-                print("Suggested questions: 'calories', 'vitamins', 'health benefits', or general inquiries.")
+                print("Suggested questions: 'calories', 'sugar', 'protein', 'vitamins', 'health benefits', or general inquiries.")
             else:
-                response = query_ai_for_fruit(fruit_name, fruit_info)
+                response = answer_intents(session.fruit_name, session.fruit_info, user_input, session)
                 print(f"🤖 AI: {response}")
 
 def main():
@@ -0,0 +1,270 @@
+import os
+import threading
+import time
+
+import httpx
+import ollama
+
+import fruit_metrics
+
+# -----------------------------
+# 多台 Ollama 主機的負載平衡：每台主機一個 ollama.Client，可限定只跑哪些模型
+# (例如 llava 在一台、llama3 在另一台)。同一模型有多台可用時挑進行中請求最少的一台，
+# 連續失敗的主機暫時剔除，背景健康檢查恢復後再加回來。
+# FRUIT_OLLAMA_BACKENDS：逗號分隔的主機，"=" 後以 "|" 分隔可服務的模型，沒寫表示全部
+#   FRUIT_OLLAMA_BACKENDS="http://10.0.0.2:11434=llava,http://10.0.0.3:11434=llama3|llava"
+# 未設定時 chat() 直接呼叫 ollama.chat (單一主機，OLLAMA_HOST)。
+# -----------------------------
+BACKENDS_SPEC = os.environ.get("FRUIT_OLLAMA_BACKENDS", "")
+# Ollama 端同時處理的請求數；伺服器、多水果、多攝影機的並行上限都從這裡讀，預設值只有這一個
+NUM_PARALLEL = int(os.environ.get("OLLAMA_NUM_PARALLEL", "2"))
+# 連續失敗幾次就剔除，剔除多久 (秒) 後才再讓請求嘗試
+EJECT_AFTER_FAILURES = 3
+EJECT_S = 30.0
+HEALTH_INTERVAL_S = float(os.environ.get("FRUIT_OLLAMA_HEALTH_S", "10"))
+HEALTH_TIMEOUT_S = 2.0
+# 單次 chat 的逾時 (秒)：接受連線後卡住的主機要算失敗，才會剔除並改用其他主機
+REQUEST_TIMEOUT_S = float(os.environ.get("FRUIT_OLLAMA_TIMEOUT_S", "120"))
+# 延遲的指數移動平均權重 (同樣進行中數量時選較快的主機)
+LATENCY_EWMA_ALPHA = 0.2
+
+
+def _model_name(model):
+    """llama3 與 llama3:latest 視為同一個模型"""
+    model = (model or "").strip()
+    return model[:-len(":latest")] if model.endswith(":latest") else model
+
+
+def parse_backends(spec):
+    """回傳 [(url, 模型集合或 None)]"""
+    backends = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        url, _, models = item.partition("=")
+        names = {_model_name(m) for m in models.split("|") if m.strip()}
+        backends.append((url.strip(), names or None))
+    return backends
+
+
+class Backend:
+    def __init__(self, url, models=None):
+        self.url = url
+        self.models = models
+        self.client = ollama.Client(host=url, timeout=REQUEST_TIMEOUT_S)
+        self._health_client = ollama.Client(host=url, timeout=HEALTH_TIMEOUT_S)
+        self.lock = threading.Lock()
+        self.outstanding = 0
+        self.calls = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.latency_total = 0.0
+        self.latency_ewma = None
+
+    def client_for(self, timeout):
+        """timeout 為 None 時用常駐的 client；呼叫端有時間預算時另建帶該逾時的 client"""
+        return self.client if timeout is None else ollama.Client(host=self.url, timeout=timeout)
+
+    def serves(self, model):
+        return self.models is None or _model_name(model) in self.models
+
+    def available(self, now):
+        return now >= self.ejected_until
+
+    def _eject(self, now, reason):
+        if self.available(now):
+            self.ejections += 1
+            fruit_metrics.inc("ollama_backend_ejections_total", backend=self.url)
+            print(f"⚠️ Ollama 主機 {self.url} 暫時剔除 {EJECT_S:.0f} 秒：{reason}")
+        self.ejected_until = now + EJECT_S
+
+    def record_success(self, latency):
+        with self.lock:
+            self.calls += 1
+            self.consecutive_failures = 0
+            self.latency_total += latency
+            self.latency_ewma = latency if self.latency_ewma is None else (
+                LATENCY_EWMA_ALPHA * latency + (1 - LATENCY_EWMA_ALPHA) * self.latency_ewma)
+        fruit_metrics.observe("ollama_backend_seconds", latency, backend=self.url)
+
+    def record_failure(self, error):
+        with self.lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= EJECT_AFTER_FAILURES:
+                self._eject(time.monotonic(), error)
+        fruit_metrics.inc("ollama_backend_failures_total", backend=self.url)
+
+    def check_health(self):
+        """
+        列出模型 (GET /api/tags) 失敗就剔除。成功不代表 /api/chat 正常，
+        所以不清除 chat 累計的失敗、也不提前加回：剔除期滿後才再接請求，
+        期滿後的第一次 chat 失敗會立即再剔除
+        """
+        try:
+            self._health_client.list()
+        except Exception as e:
+            with self.lock:
+                self._eject(time.monotonic(), f"health check failed: {e}")
+            return False
+        return True
+
+    def stats(self, outstanding):
+        """outstanding 由 BackendPool 在其鎖內讀取後傳入"""
+        with self.lock:
+            return {
+                "url": self.url,
+                "models": sorted(self.models) if self.models else None,
+                "healthy": self.available(time.monotonic()),
+                "outstanding": outstanding,
+                "calls": self.calls,
+                "failures": self.failures,
+                "ejections": self.ejections,
+                "avg_latency_s": round(self.latency_total / self.calls, 4) if self.calls else 0.0,
+                "ewma_latency_s": round(self.latency_ewma, 4) if self.latency_ewma is not None else None,
+            }
+
+
+class BackendPool:
+    def __init__(self, backends, health_interval=HEALTH_INTERVAL_S):
+        if not backends:
+            raise ValueError("BackendPool needs at least one backend")
+        self.backends = [Backend(url, models) for url, models in backends]
+        self._lock = threading.Lock()
+        self._turn = 0
+        self._stop = threading.Event()
+        if health_interval > 0:
+            threading.Thread(target=self._health_loop, args=(health_interval,), daemon=True).start()
+
+    def _health_loop(self, interval):
+        while not self._stop.wait(interval):
+            self.check_health()
+
+    def check_health(self):
+        return {backend.url: backend.check_health() for backend in self.backends}
+
+    def close(self):
+        self._stop.set()
+
+    def _acquire(self, model, exclude=()):
+        """挑選並佔用一台主機；都被剔除時仍退而求其次選最早恢復的那台"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [b for b in self.backends if b.serves(model) and b not in exclude]
+            if not candidates:
+                return None
+            healthy = [b for b in candidates if b.available(now)]
+            if healthy:
+                # 還沒有成功紀錄的主機以其他主機的中位數計，不會因為沒資料 (或一直失敗) 被當成最快；
+                # 起點輪替，同分時輪流分配
+                known = sorted(b.latency_ewma for b in healthy if b.latency_ewma is not None)
+                neutral = known[len(known) // 2] if known else 0.0
+                self._turn += 1
+                start = self._turn % len(healthy)
+                rotated = healthy[start:] + healthy[:start]
+                backend = min(rotated, key=lambda b: (
+                    b.outstanding, b.latency_ewma if b.latency_ewma is not None else neutral))
+            else:
+                backend = min(candidates, key=lambda b: b.ejected_until)
+            backend.outstanding += 1
+            return backend
+
+    def _release(self, backend):
+        with self._lock:
+            backend.outstanding -= 1
+
+    def chat(self, timeout=None, **kwargs):
+        """
+        送到負責該模型的主機；連線錯誤、逾時 (REQUEST_TIMEOUT_S) 或伺服器錯誤 (5xx) 時
+        換下一台重試，每台最多一次。4xx (例如參數錯誤) 直接丟出。
+        timeout：呼叫端的總時間預算 (秒，含重試)；用完時丟出 TimeoutError，不算主機失敗
+        """
+        model = kwargs.get("model")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        tried = []
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise TimeoutError(f"Ollama call exceeded its {timeout:.1f}s budget")
+            backend = self._acquire(model, tried)
+            if backend is None:
+                if tried:
+                    raise last_error
+                raise ValueError(f"no Ollama backend is configured for model '{model}'")
+            tried.append(backend)
+            start = time.perf_counter()
+            try:
+                response = backend.client_for(remaining).chat(**kwargs)
+            except httpx.TimeoutException as e:
+                if remaining is not None and remaining < REQUEST_TIMEOUT_S:
+                    raise TimeoutError(f"Ollama call exceeded its {timeout:.1f}s budget") from e
+                backend.record_failure(e)
+                last_error = e
+            except ollama.ResponseError as e:
+                if e.status_code is not None and e.status_code < 500:
+                    raise
+                backend.record_failure(e)
+                last_error = e
+            except Exception as e:
+                # 連線錯誤與 httpx 的逾時都在這裡
+                backend.record_failure(e)
+                last_error = e
+            else:
+                backend.record_success(time.perf_counter() - start)
+                fruit_metrics.inc("ollama_backend_requests_total", backend=backend.url, model=_model_name(model))
+                return response
+            finally:
+                self._release(backend)
+            print(f"⚠️ Ollama 主機 {backend.url} 失敗 ({last_error})，改用其他主機重試...")
+
+    def stats(self):
+        with self._lock:
+            outstanding = [backend.outstanding for backend in self.backends]
+        return [backend.stats(count) for backend, count in zip(self.backends, outstanding)]
+
+
+_pool_lock = threading.Lock()
+_pool = None
+
+
+def get_pool():
+    """依 FRUIT_OLLAMA_BACKENDS 建立 (一次) 主機池；未設定時回傳 None"""
+    global _pool
+    if not BACKENDS_SPEC:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = BackendPool(parse_backends(BACKENDS_SPEC))
+        return _pool
+
+
+def configure(spec, health_interval=HEALTH_INTERVAL_S):
+    """以新的設定取代目前的主機池 (空字串 = 回到單一主機)；測試與工具程式使用"""
+    global _pool, BACKENDS_SPEC
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        BACKENDS_SPEC = spec
+        _pool = BackendPool(parse_backends(spec), health_interval) if spec else None
+        return _pool
+
+
+def chat(timeout=None, **kwargs):
+    """timeout：這次呼叫的時間預算 (秒)，逾時丟出 TimeoutError；None = 不另外限制"""
+    pool = get_pool()
+    if pool is not None:
+        return pool.chat(timeout=timeout, **kwargs)
+    if timeout is None:
+        return ollama.chat(**kwargs)
+    try:
+        return ollama.Client(timeout=timeout).chat(**kwargs)
+    except httpx.TimeoutException as e:
+        raise TimeoutError(f"Ollama call exceeded its {timeout:.1f}s budget") from e
+
+
+def pool_stats():
+    pool = get_pool()
+    return pool.stats() if pool else None
@@ -0,0 +1,183 @@
+import argparse
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# -----------------------------
+# 本地 Ollama 替身：只實作本專案用到的 API，
+# 用於負載測試 / 重播，不需要 GPU 也不需要真的模型
+# -----------------------------
+DEFAULT_PORT = 11435
+
+STUB_ANSWER = "This fruit is a good source of vitamins and dietary fiber."
+STUB_NUTRITION = "Per 100g: 50 calories, 12g carbohydrates, 2g dietary fiber, rich in vitamin C."
+STUB_HEALTH = "Supports immunity and digestion."
+
+
+class StubConfig:
+    def __init__(self, labels=("Apple",), latency=0.05, per_token=0.0, parallel=1, fail=False):
+        # labels：多個標籤時，依圖片內容雜湊決定回傳哪一個 (同圖同答案)
+        self.labels = list(labels) or ["Apple"]
+        self.latency = latency
+        self.per_token = per_token
+        self.fail = fail
+        # 模擬 OLLAMA_NUM_PARALLEL：超過的請求排隊
+        self.slots = threading.Semaphore(max(1, parallel))
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.requests = []
+
+    def record(self, path, body):
+        with self.lock:
+            model = body.get("model", "")
+            self.calls[model] = self.calls.get(model, 0) + 1
+            self.requests.append({"path": path, "model": model, "options": body.get("options"),
+                                  "keep_alive": body.get("keep_alive"), "format": body.get("format")})
+
+
+def stub_reply(config, model, messages, fmt=None):
+    images = [img for m in messages for img in (m.get("images") or [])]
+    if images:
+        digest = hashlib.sha1("".join(str(i) for i in images).encode("utf-8")).digest()
+        return config.labels[digest[0] % len(config.labels)]
+
+    prompt = messages[-1].get("content", "") if messages else ""
+    if fmt == "json" or isinstance(fmt, dict):
+        return json.dumps({"nutrition": STUB_NUTRITION, "health": STUB_HEALTH})
+    if "nutrition:" in prompt and "health:" in prompt:
+        return f"nutrition: {STUB_NUTRITION}\nhealth: {STUB_HEALTH}"
+    return STUB_ANSWER
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server_version = "OllamaStub/0.1"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def config(self):
+        return self.server.stub_config
+
+    def _send_json(self, status, payload, ndjson=False):
+        body = json.dumps(payload).encode("utf-8") + (b"\n" if ndjson else b"")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/x-ndjson" if ndjson else "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path == "/":
+            body = b"Ollama is running"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == "/api/version":
+            self._send_json(200, {"version": "0.0.0-stub"})
+        elif self.path == "/api/tags":
+            models = sorted(set(self.config.calls) | {"llava", "llama3"})
+            self._send_json(200, {"models": [{"name": m, "model": m} for m in models]})
+        elif self.path == "/stub/stats":
+            with self.config.lock:
+                self._send_json(200, {"calls": dict(self.config.calls), "requests": list(self.config.requests)})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", "0") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "invalid JSON"})
+            return
+        if self.path not in ("/api/chat", "/api/generate"):
+            self._send_json(404, {"error": "not found"})
+            return
+
+        self.config.record(self.path, body)
+        if self.config.fail:
+            self._send_json(500, {"error": "stub configured to fail"})
+            return
+
+        model = body.get("model", "")
+        if self.path == "/api/chat":
+            messages = body.get("messages") or []
+        else:
+            messages = [{"role": "user", "content": body.get("prompt", ""), "images": body.get("images")}]
+        content = stub_reply(self.config, model, messages, body.get("format"))
+        # num_predict 以「字」近似 token 數截斷輸出，讓 options 調校看得到效果
+        num_predict = (body.get("options") or {}).get("num_predict")
+        truncated = bool(num_predict) and len(content.split()) > num_predict
+        if truncated:
+            content = " ".join(content.split()[:num_predict])
+
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in messages)
+        eval_count = max(1, len(content.split()))
+        with self.config.slots:
+            started = time.perf_counter()
+            time.sleep(self.config.latency + self.config.per_token * eval_count)
+            elapsed_ns = int((time.perf_counter() - started) * 1e9)
+
+        payload = {
+            "model": model,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "done": True,
+            "done_reason": "length" if truncated else "stop",
+            "total_duration": elapsed_ns,
+            "load_duration": 0,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": elapsed_ns // 4,
+            "eval_count": eval_count,
+            "eval_duration": elapsed_ns - elapsed_ns // 4,
+        }
+        if self.path == "/api/chat":
+            payload["message"] = {"role": "assistant", "content": content}
+        else:
+            payload["response"] = content
+            payload["context"] = list(range(prompt_tokens + eval_count))
+        self._send_json(200, payload, ndjson=body.get("stream", True))
+
+
+def start_stub_server(host="127.0.0.1", port=0, **config):
+    """在背景執行緒啟動替身伺服器，回傳 (server, base_url)；port=0 表示自動挑選"""
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.stub_config = StubConfig(**config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Minimal local stand-in for the Ollama HTTP API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--labels", default="Apple", help="comma separated labels returned for image requests")
+    parser.add_argument("--latency", type=float, default=0.05, help="base seconds per call")
+    parser.add_argument("--per-token", type=float, default=0.0, help="extra seconds per generated token")
+    parser.add_argument("--parallel", type=int, default=1, help="concurrent calls served, like OLLAMA_NUM_PARALLEL")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    server.daemon_threads = True
+    server.stub_config = StubConfig(args.labels.split(","), args.latency, args.per_token, args.parallel)
+    print(f"🧪 Ollama stub on http://{args.host}:{args.port}  (export OLLAMA_HOST to point clients here)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+# -----------------------------
+# Ollama options 調校：針對三種呼叫 (classify / summarize / answer)
+# 逐一掃描 num_ctx、num_predict、num_thread、temperature，
+# 以標記好的圖片與固定問題集量測延遲與輸出有效率，寫出 profile 檔；
+# 執行時 chatbot._ollama_chat 依 call_type 讀取並帶入 options 與 keep_alive。
+#   python ollama_tuner.py tune --per-label 2
+#   python ollama_tuner.py show
+# 以 ollama_stub.py 測試時設定 OLLAMA_HOST 指向替身即可。
+# -----------------------------
+PROFILE_SCHEMA = 1
+PROFILE_PATH = os.environ.get("FRUIT_OLLAMA_PROFILE", "ollama_profile.json")
+CALL_TYPES = ("classify", "summarize", "answer")
+# keep_alive 影響的是閒置後是否卸載模型，短時間的掃描量測不到，改由參數指定
+DEFAULT_KEEP_ALIVE = "30m"
+
+# 每種呼叫的候選值；None 表示不帶該選項 (使用伺服器預設)
+SWEEP = {
+    "classify": {
+        "num_predict": (None, 8, 16),
+        "temperature": (None, 0.0),
+        "num_ctx": (None, 1024, 2048),
+    },
+    "summarize": {
+        "num_predict": (None, 128, 256),
+        "temperature": (None, 0.0, 0.3),
+        "num_ctx": (None, 1024, 2048),
+    },
+    "answer": {
+        "num_predict": (None, 96, 192),
+        "temperature": (None, 0.3, 0.7),
+        "num_ctx": (None, 2048, 4096),
+    },
+}
+# num_thread 是 Ollama 主機的執行緒數，只有主機就是本機時 os.cpu_count() 才有意義；
+# 遠端主機 (或 FRUIT_OLLAMA_BACKENDS 主機池) 要以 --num-thread / FRUIT_TUNE_NUM_THREAD 指定，否則不掃描
+TUNE_NUM_THREAD = os.environ.get("FRUIT_TUNE_NUM_THREAD", "")
+LOCAL_HOSTS = ("", "localhost", "127.0.0.1", "::1", "0.0.0.0")
+# 有效率比目前最佳值低超過此幅度的設定不採用，即使比較快
+VALIDITY_TOLERANCE = 0.02
+# 有效率相當時，至少要快這個比例才換掉目前設定 (避免把量測雜訊當成改善)
+MIN_SPEEDUP = 0.03
+
+SUMMARY_TITLES = ("Apple", "Banana", "Mango", "Guava", "Pineapple")
+CANNED_QUESTIONS = (
+    ("Apple", "Can I eat the skin?"),
+    ("Banana", "How should I store it so it lasts longer?"),
+    ("Mango", "How do I know when it is ripe?"),
+    ("Kiwi", "Is it safe for dogs?"),
+    ("Orange", "What dishes can I cook with it?"),
+)
+
+_profile_lock = threading.Lock()
+_profile_cache = {"path": None, "mtime": None, "profile": None}
+# 調校時暫時覆寫某個 call_type 的設定
+_overrides = {}
+
+
+# -----------------------------
+# 執行時讀取 profile
+# -----------------------------
+def load_profile(path=PROFILE_PATH):
+    """讀取 profile 並依修改時間快取；檔案不存在或格式不符時回傳 None"""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _profile_lock:
+        if _profile_cache["path"] == path and _profile_cache["mtime"] == mtime:
+            return _profile_cache["profile"]
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            profile = json.load(f)
+    except ValueError as e:
+        print(f"⚠️ Ollama profile {path} 無法解析: {e}")
+        profile = None
+    if profile and profile.get("schema") != PROFILE_SCHEMA:
+        print(f"⚠️ Ollama profile {path} 格式版本 {profile.get('schema')} 不支援，略過。")
+        profile = None
+    with _profile_lock:
+        _profile_cache.update(path=path, mtime=mtime, profile=profile)
+    return profile
+
+
+def call_settings(call_type, model=None, path=PROFILE_PATH):
+    """
+    回傳這次呼叫要帶的 {"options": {...}, "keep_alive": ...}。
+    profile 是針對特定模型調校的，模型不同 (例如串接的小模型) 時不套用
+    """
+    if call_type in _overrides:
+        return _overrides[call_type]
+    entry = ((load_profile(path) or {}).get("call_types") or {}).get(call_type)
+    if not entry or (model and entry.get("model") and entry["model"] != model):
+        return {}
+    settings = {}
+    if entry.get("options"):
+        settings["options"] = entry["options"]
+    if entry.get("keep_alive") is not None:
+        settings["keep_alive"] = entry["keep_alive"]
+    return settings
+
+
+# -----------------------------
+# 各呼叫類型的量測工作
+# -----------------------------
+def _classify_workload(per_label):
+    import cv2
+    import chatbot
+    from fruit_images import list_reference_images
+
+    # 與攝影機流程相同：原始畫面經 fruit_roi 裁切縮放 (約 336px) 後才送 llava，
+    # 調出來的 num_ctx 等選項才對應執行時的輸入大小。解碼在量測前先做完
+    items = [(frame, label) for frame, label in
+             ((cv2.imread(path), label) for path, label in list_reference_images(per_label=per_label))
+             if frame is not None]
+
+    def run():
+        return [chatbot.identify_fruit(frame=frame, roi=True, cascade=False) == label for frame, label in items]
+    return "llava", run
+
+
+def _summary_texts():
+    """知識包保存的 Wikipedia 原文；舊版知識包沒有原文時才退回 wiki_stub 的範例文章"""
+    import chatbot
+    import knowledge_pack
+
+    texts = knowledge_pack.extracts(chatbot.KNOWLEDGE_PACK_PATH)
+    if texts:
+        return list(texts.values())
+    from wiki_stub import default_article
+    print(f"⚠️ {chatbot.KNOWLEDGE_PACK_PATH} 沒有原文 (請以 python knowledge_pack.py build --all 重建)，"
+          "改用 wiki_stub 的範例文章，量測結果不代表實際輸入。")
+    return [default_article(title) for title in SUMMARY_TITLES]
+
+
+def _summarize_workload():
+    import chatbot
+
+    texts = [chatbot._clean_wiki_text(text) for text in _summary_texts()]
+
+    def run():
+        results = []
+        for text in texts:
+            parsed = chatbot._shorten_wiki_text_one_call(text, chatbot.SUMMARY_FIELDS)
+            results.append(all(chatbot._valid_summary(parsed.get(f)) for f in chatbot.SUMMARY_FIELDS))
+        return results
+    return "llama3", run
+
+
+def _answer_workload():
+    import chatbot
+
+    dataset = {f["fruit"].lower(): f for f in chatbot.load_fruit_dataset()}
+
+    def run():
+        results = []
+        for fruit, question in CANNED_QUESTIONS:
+            info = dataset.get(fruit.lower(), {"fruit": fruit})
+            answer = (chatbot.query_ai_for_fruit(fruit, info, question=question) or "").strip()
+            # 被 num_predict 截斷的回答通常停在句子中間
+            results.append(len(answer) >= 20 and answer[-1] in ".!?。！？")
+        return results
+    return "llama3", run
+
+
+def _measure(call_type, run, options, samples):
+    _overrides[call_type] = {"options": options} if options else {}
+    try:
+        latencies, valid = [], []
+        for _ in range(samples):
+            start = time.perf_counter()
+            results = run()
+            latencies.append((time.perf_counter() - start) / max(1, len(results)))
+            valid.extend(results)
+    finally:
+        _overrides.pop(call_type, None)
+    return {
+        "avg_latency_s": round(sum(latencies) / len(latencies), 4),
+        "validity": round(sum(valid) / len(valid), 4) if valid else 0.0,
+    }
+
+
+def _ollama_is_local():
+    if os.environ.get("FRUIT_OLLAMA_BACKENDS"):
+        return False
+    host = os.environ.get("OLLAMA_HOST", "").strip()
+    if host and "://" not in host:
+        host = "http://" + host
+    return (urlparse(host).hostname or "") in LOCAL_HOSTS
+
+
+def num_thread_candidates(num_thread=TUNE_NUM_THREAD):
+    """
+    num_thread 的候選值：有指定時用指定值 (逗號分隔)，
+    否則本機主機用 os.cpu_count()，遠端主機不掃描 (回傳空 tuple)
+    """
+    if num_thread:
+        return tuple(int(n) for n in str(num_thread).split(",") if n.strip())
+    if _ollama_is_local():
+        return (os.cpu_count(),)
+    return ()
+
+
+def sweep_for(call_type, num_thread=TUNE_NUM_THREAD):
+    sweep = dict(SWEEP[call_type])
+    threads = num_thread_candidates(num_thread)
+    if threads:
+        sweep["num_thread"] = (None,) + threads
+    return sweep
+
+
+def _better(candidate, best):
+    if candidate["validity"] < best["validity"] - VALIDITY_TOLERANCE:
+        return False
+    if candidate["validity"] > best["validity"] + VALIDITY_TOLERANCE:
+        return True
+    return candidate["avg_latency_s"] < best["avg_latency_s"] * (1 - MIN_SPEEDUP)
+
+
+def tune_call_type(call_type, run, samples=1, sweep=None):
+    """
+    逐一選項做座標式搜尋：其他選項固定在目前最佳值，試過該選項所有候選值後保留最佳者。
+    比完整格點搜尋少很多次呼叫。回傳 (最佳 options, 最佳結果, 所有試驗)
+    """
+    sweep = sweep or sweep_for(call_type)
+    best_options = {}
+    # 先跑一次暖機，避免第一次載入模型的時間算進基準
+    run()
+    best = _measure(call_type, run, best_options, samples)
+    trials = [{"options": {}, **best}]
+    print(f"  baseline: {best['avg_latency_s']:.3f}s validity {best['validity']:.2f}")
+    for name, values in sweep.items():
+        for value in values:
+            if best_options.get(name) == value:
+                continue
+            options = {k: v for k, v in dict(best_options, **{name: value}).items() if v is not None}
+            result = _measure(call_type, run, options, samples)
+            trials.append({"options": options, **result})
+            print(f"  {json.dumps(options)}: {result['avg_latency_s']:.3f}s validity {result['validity']:.2f}")
+            if _better(result, best):
+                best, best_options = result, options
+    return best_options, best, trials
+
+
+def write_profile(path, call_types, keep_alive):
+    previous = load_profile(path) or {}
+    entries = dict(previous.get("call_types") or {})
+    entries.update(call_types)
+    for entry in entries.values():
+        entry["keep_alive"] = keep_alive
+    profile = {
+        "schema": PROFILE_SCHEMA,
+        "tuned_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "host": os.environ.get("OLLAMA_HOST", ""),
+        "call_types": entries,
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return profile
+
+
+def tune(call_types=CALL_TYPES, per_label=2, samples=1, path=PROFILE_PATH, keep_alive=DEFAULT_KEEP_ALIVE,
+         num_thread=TUNE_NUM_THREAD):
+    workloads = {
+        "classify": lambda: _classify_workload(per_label),
+        "summarize": _summarize_workload,
+        "answer": _answer_workload,
+    }
+    if not num_thread_candidates(num_thread):
+        print("⚠️ Ollama 主機不在本機且未指定 --num-thread，略過 num_thread。")
+    tuned = {}
+    for call_type in call_types:
+        print(f"🔧 Tuning {call_type}...")
+        model, run = workloads[call_type]()
+        options, result, trials = tune_call_type(call_type, run, samples, sweep_for(call_type, num_thread))
+        tuned[call_type] = {"model": model, "options": options, "measured": result, "trials": trials}
+    return write_profile(path, tuned, keep_alive)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep Ollama options per call type and write a runtime profile")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("tune", help="measure option candidates and write the profile")
+    run.add_argument("--call-types", default=",".join(CALL_TYPES))
+    run.add_argument("--per-label", type=int, default=2, help="labelled images per fruit for classify")
+    run.add_argument("--samples", type=int, default=1, help="repeat each workload this many times")
+    run.add_argument("--keep-alive", default=DEFAULT_KEEP_ALIVE)
+    run.add_argument("--num-thread", default=TUNE_NUM_THREAD,
+                     help="num_thread candidates for the Ollama host, comma separated (default: local cpu count, "
+                          "skipped for a remote host)")
+    run.add_argument("--out", default=PROFILE_PATH)
+    show = sub.add_parser("show", help="print the current profile")
+    show.add_argument("--path", default=PROFILE_PATH)
+    args = parser.parse_args()
+
+    if args.command == "show":
+        profile = load_profile(args.path)
+        if not profile:
+            print(f"⚠️ 找不到 {args.path}。")
+            return
+        print(f"tuned {profile['tuned_at']} against {profile['host'] or 'default host'}")
+        for call_type, entry in profile["call_types"].items():
+            measured = entry.get("measured", {})
+            print(f"- {call_type} ({entry['model']}): {json.dumps(entry['options'])} keep_alive={entry['keep_alive']} "
+                  f"→ {measured.get('avg_latency_s')}s, validity {measured.get('validity')}")
+        return
+
+    call_types = [c.strip() for c in args.call_types.split(",") if c.strip()]
+    unknown = [c for c in call_types if c not in CALL_TYPES]
+    if unknown:
+        parser.error(f"unknown call types: {', '.join(unknown)}")
+    try:
+        num_thread_candidates(args.num_thread)
+    except ValueError:
+        parser.error(f"--num-thread must be comma separated integers: {args.num_thread}")
+    tune(call_types, args.per_label, args.samples, args.out, args.keep_alive, args.num_thread)
+    print(f"📄 Profile written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
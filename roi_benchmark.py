@@ -0,0 +1,86 @@
+import argparse
+import json
+import time
+
+import cv2
+
+import chatbot
+import fruit_classifier
+import fruit_metrics
+from fruit_images import IMAGES_DIR, list_reference_images
+
+# -----------------------------
+# 比較「整張畫面」與「ROI 裁切」送 llava 的延遲與準確率
+#   python roi_benchmark.py --per-label 5 --out roi_report.json
+# -----------------------------
+
+
+def run_variant(items, roi):
+    fruit_metrics.reset()
+    latencies = []
+    correct = 0
+    per_label = {}
+    for path, label in items:
+        frame = cv2.imread(path)
+        if frame is None:
+            print(f"⚠️ 無法讀取 {path}，略過。")
+            continue
+        start = time.perf_counter()
+        # 不經過 cascade：特徵分類器是用同一批參考圖片建的，會讓比較失真
+        predicted = chatbot.identify_fruit(frame=frame, roi=roi, cascade=False)
+        latencies.append(time.perf_counter() - start)
+
+        hit = predicted == label
+        correct += hit
+        stats = per_label.setdefault(label, {"total": 0, "correct": 0})
+        stats["total"] += 1
+        stats["correct"] += hit
+
+    total = len(latencies)
+    latencies.sort()
+    return {
+        "images": total,
+        "accuracy": round(correct / total, 4) if total else 0.0,
+        "avg_latency_s": round(sum(latencies) / total, 4) if total else 0.0,
+        "p95_latency_s": round(latencies[int(0.95 * (total - 1))], 4) if total else 0.0,
+        "per_label": per_label,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare llava latency/accuracy with and without ROI cropping")
+    parser.add_argument("--images", default=IMAGES_DIR)
+    parser.add_argument("--per-label", type=int, default=None, help="limit images per fruit")
+    parser.add_argument("--out", help="write the report JSON here")
+    args = parser.parse_args()
+
+    items = list_reference_images(args.images, args.per_label)
+    if not items:
+        print(f"⚠️ {args.images} 中沒有圖片。")
+        return
+
+    print(f"🖼️ {len(items)} images, full frame first...")
+    report = {"full_frame": run_variant(items, roi=False)}
+    print("✂️ ROI crop...")
+    report["roi_crop"] = run_variant(items, roi=True)
+    # cascade 的特徵層只以留一法 (held-out) 評分
+    classifier = fruit_classifier.load_classifier()
+    if classifier is not None:
+        report["cascade_features_held_out"] = fruit_classifier.held_out_stats(classifier, chatbot.CASCADE_CONFIDENCE)
+
+    before, after = report["full_frame"], report["roi_crop"]
+    print(f"accuracy:    {before['accuracy']:.3f} → {after['accuracy']:.3f}")
+    print(f"avg latency: {before['avg_latency_s']:.3f}s → {after['avg_latency_s']:.3f}s")
+    print(f"p95 latency: {before['p95_latency_s']:.3f}s → {after['p95_latency_s']:.3f}s")
+    held_out = report.get("cascade_features_held_out")
+    if held_out:
+        print(f"cascade features (leave-one-out, ≥{held_out['threshold']}): "
+              f"coverage {held_out['coverage']:.1%}, accuracy {held_out['accuracy']:.1%}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fruit_intents
+
+APPLE = {
+    "fruit": "Apple",
+    "nutrition": "Per 100g: 52 calories, 13.8g carbohydrates, 2.4g dietary fiber, 10.4g sugar, 0.3g protein, "
+                 "rich in vitamin C and potassium.",
+    "health_benefits": "Rich in dietary fiber, promotes gut health, enhances immunity with vitamin C.",
+}
+
+
+# -----------------------------
+# 英文同義詞只命中整個單字
+# -----------------------------
+def test_substring_inside_word_does_not_match():
+    assert fruit_intents.route("Is this a carbonated drink") == []
+    assert fruit_intents.route("What about the environment?") == []
+
+
+def test_sweet_potato_is_not_sugar():
+    assert fruit_intents.route("How many carbs in a sweet potato") == ["carbohydrates"]
+
+
+def test_plural_and_inflected_forms_match():
+    assert fruit_intents.route("How many calories?") == ["calories"]
+    assert fruit_intents.route("carbs and sugars") == ["carbohydrates", "sugar"]
+    assert fruit_intents.route("What vitamins does it have?") == ["vitamins"]
+    assert fruit_intents.route("Is she allergic to it?") == ["conditions"]
+
+
+def test_match_at_text_edges_and_punctuation():
+    assert fruit_intents.route("fiber") == ["fiber"]
+    assert fruit_intents.route("(protein)?") == ["protein"]
+
+
+def test_cjk_synonyms_match_as_substrings():
+    assert fruit_intents.route("這個熱量多少") == ["calories"]
+    assert fruit_intents.route("含有維生素C嗎") == ["vitamins"]
+    assert fruit_intents.route("糖尿病可以吃嗎") == ["conditions"]
+
+
+def test_longest_match_wins():
+    assert fruit_intents.route("Does it raise blood sugar?") == ["conditions"]
+
+
+def test_mineral_names_route_to_minerals():
+    assert fruit_intents.route("Does it contain iron?") == ["minerals"]
+    assert fruit_intents.route("How much zinc and calcium?") == ["minerals"]
+    assert fruit_intents.route("有鐵嗎") == ["minerals"]
+    assert fruit_intents.route("Is it ironic?") == []
+
+
+def test_broad_keywords_only_when_requested():
+    assert fruit_intents.route("What are the health effects?") == []
+    assert fruit_intents.route("What are the health effects?", broad=True) == ["health_benefits"]
+    assert fruit_intents.route("對健康有什麼影響", broad=True) == ["health_benefits"]
+
+
+# -----------------------------
+# 點名的維生素 / 礦物質要在資料裡才直接回答
+# -----------------------------
+def test_named_vitamin_missing_from_data_falls_through():
+    answer, intents = fruit_intents.answer_question("Apple", APPLE, "Does it have vitamin D?")
+    assert intents == ["vitamins"]
+    assert answer is None
+
+
+def test_named_vitamin_present_in_data_is_answered():
+    answer, _ = fruit_intents.answer_question("Apple", APPLE, "Does it have vitamin C?")
+    assert answer == "Apple contains vitamin C."
+
+
+def test_named_mineral_missing_from_data_falls_through():
+    answer, intents = fruit_intents.answer_question("Apple", APPLE, "Does it contain iron?")
+    assert intents == ["minerals"]
+    assert answer is None
+
+
+def test_named_mineral_present_in_data_is_answered():
+    answer, _ = fruit_intents.answer_question("Apple", APPLE, "Does it contain potassium?")
+    assert answer == "Apple contains potassium."
+
+
+def test_general_vitamin_question_lists_vitamins():
+    answer, _ = fruit_intents.answer_question("Apple", APPLE, "What vitamins does it have?")
+    assert answer == "Apple is rich in vitamin C."
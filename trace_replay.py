@@ -0,0 +1,169 @@
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import fruit_trace
+
+# -----------------------------
+# 重播 fruit_trace 記錄的事件：
+#   FRUIT_TRACE_PATH=request_traces.jsonl python chatbot.py     # 錄製
+#   OLLAMA_HOST=http://127.0.0.1:11435 python trace_replay.py request_traces.jsonl --speed 10
+# -----------------------------
+DEFAULT_TRACE_PATH = "request_traces.jsonl"
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(pct / 100 * (len(values) - 1)))))
+    return values[k]
+
+
+class Replayer:
+    def __init__(self, concurrency=4):
+        # 延遲載入：chatbot 匯入時會讀取 wit_token.txt 並建立 ollama client
+        import chatbot
+        self.chatbot = chatbot
+        self.concurrency = concurrency
+        self._info_cache = {}
+        self._info_lock = threading.Lock()
+
+    def _info_for(self, fruit):
+        with self._info_lock:
+            if fruit in self._info_cache:
+                return self._info_cache[fruit]
+        info = self.chatbot.get_fruit_info(fruit) or {}
+        with self._info_lock:
+            self._info_cache[fruit] = info
+        return info
+
+    def run_event(self, event):
+        kind = event["kind"]
+        if kind == "identify":
+            image = event.get("image")
+            if not image or not os.path.exists(image):
+                return "skipped"
+            self.chatbot.identify_fruit(image_path=image)
+        elif kind == "info":
+            if not event.get("fruit"):
+                return "skipped"
+            self.chatbot.get_fruit_info(event["fruit"])
+        elif kind == "ask":
+            if not event.get("fruit"):
+                return "skipped"
+            info = self._info_for(event["fruit"])
+            # 錄製時的 session 以 "replay:" 前綴重建，多輪對話重播出相同的歷史與快取命中
+            session_id = event.get("session_id")
+            self.chatbot.query_ai_for_fruit(event["fruit"], info, event.get("query_type", "general"),
+                                            event.get("question"),
+                                            f"replay:{session_id}" if session_id is not None else None)
+        return "ok"
+
+    def _timed(self, event, previous=None):
+        # 同一個 session 的事件依錄製順序執行，前一筆完成後才開始
+        if previous is not None:
+            previous.exception()
+        start = time.perf_counter()
+        try:
+            status = self.run_event(event)
+        except Exception as e:
+            print(f"⚠️ 重播 {event['kind']} 失敗: {e}")
+            status = "error"
+        return event, status, time.perf_counter() - start
+
+    def replay(self, events, speed=1.0):
+        """
+        speed=1 依原始間隔送出，speed=10 快十倍，speed=0 不等待 (盡快送出)；
+        同時進行中的呼叫數受 concurrency 限制；同一個 session 的事件不會並行
+        """
+        if not events:
+            return []
+        t0 = events[0].get("ts", 0)
+        start = time.perf_counter()
+        futures = []
+        last_in_session = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for event in events:
+                if speed > 0:
+                    delay = (event.get("ts", t0) - t0) / speed - (time.perf_counter() - start)
+                    if delay > 0:
+                        time.sleep(delay)
+                session_id = event.get("session_id") if event["kind"] == "ask" else None
+                future = pool.submit(self._timed, event, last_in_session.get(session_id))
+                if session_id is not None:
+                    last_in_session[session_id] = future
+                futures.append(future)
+        return [f.result() for f in futures]
+
+
+def summarize(results, elapsed):
+    summary = {"events": len(results), "elapsed_s": round(elapsed, 3), "by_kind": {}}
+    done = [r for r in results if r[1] == "ok"]
+    summary["throughput_eps"] = round(len(done) / elapsed, 3) if elapsed > 0 else 0.0
+    for kind in ("identify", "info", "ask"):
+        rows = [r for r in results if r[0]["kind"] == kind]
+        if not rows:
+            continue
+        latencies = [lat for _, status, lat in rows if status == "ok"]
+        recorded = [e.get("latency_s", 0.0) for e, status, _ in rows if status == "ok"]
+        summary["by_kind"][kind] = {
+            "count": len(rows),
+            "ok": len(latencies),
+            "skipped": sum(1 for r in rows if r[1] == "skipped"),
+            "errors": sum(1 for r in rows if r[1] == "error"),
+            "p50_s": round(percentile(latencies, 50), 4),
+            "p95_s": round(percentile(latencies, 95), 4),
+            "recorded_p50_s": round(percentile(recorded, 50), 4),
+        }
+    return summary
+
+
+def compare(before, after):
+    print("\n📊 Before → After")
+    print(f"throughput_eps: {before.get('throughput_eps', 0)} → {after.get('throughput_eps', 0)}")
+    for kind, stats in after.get("by_kind", {}).items():
+        old = before.get("by_kind", {}).get(kind)
+        if not old:
+            continue
+        for key in ("p50_s", "p95_s"):
+            delta = stats[key] - old[key]
+            print(f"{kind}.{key}: {old[key]} → {stats[key]} ({delta:+.4f})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded fruit traces against the pipeline")
+    parser.add_argument("trace", nargs="?", default=DEFAULT_TRACE_PATH)
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = original pace, 0 = as fast as possible")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--out", help="write the summary JSON here")
+    parser.add_argument("--compare", help="summary JSON from an earlier run to compare against")
+    args = parser.parse_args()
+
+    events = fruit_trace.load_events(args.trace)
+    if not events:
+        print(f"⚠️ {args.trace} 中沒有可重播的事件。")
+        return
+    # 重播時不再錄製，避免把重播本身寫回 trace
+    fruit_trace.disable_tracing()
+
+    replayer = Replayer(args.concurrency)
+    print(f"🔁 Replaying {len(events)} events (speed={args.speed}, concurrency={args.concurrency})")
+    start = time.perf_counter()
+    results = replayer.replay(events, args.speed)
+    summary = summarize(results, time.perf_counter() - start)
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+# -----------------------------
+# 本地 Wikipedia 替身：只實作 wikipedia 套件在
+# summary() / page().content 用到的 MediaWiki API 參數。
+# 測試時設定 WIKIPEDIA_API_URL=http://127.0.0.1:<port>/w/api.php
+# -----------------------------
+DEFAULT_PORT = 8765
+
+
+def default_article(title):
+    return (
+        f"The {title.lower()} is an edible fruit. It is widely cultivated in warm regions. "
+        f"The fruit is eaten fresh or used in juices and desserts.\n\n"
+        f"Nutrition\nA 100-gram reference amount of raw {title.lower()} supplies 50 kilocalories "
+        f"and is a rich source of vitamin C, with moderate amounts of dietary fiber and potassium. "
+        f"Research suggests it may support immunity and digestion."
+    )
+
+
+def first_sentences(text, count):
+    sentences = re.split(r"(?<=[.!?])\s+", text.strip())
+    return " ".join(sentences[:count])
+
+
+class WikiStubHandler(BaseHTTPRequestHandler):
+    server_version = "WikiStub/0.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _lookup(self, title):
+        articles = self.server.articles
+        for pageid, (name, text) in enumerate(sorted(articles.items()), start=1):
+            if name.lower() == title.lower():
+                return str(pageid), name, text
+        return None, title, None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+        with self.server.stats_lock:
+            self.server.request_count += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if params.get("list") == "search":
+            query = params.get("srsearch", "")
+            titles = [name for name in sorted(self.server.articles)
+                      if name.lower() == query.lower() or name.lower().startswith(query.lower() + " (")]
+            self._send_json({"query": {"search": [{"title": t} for t in titles[:int(params.get("srlimit", 10))]]}})
+            return
+
+        pageid, title, text = self._lookup(params.get("titles", ""))
+        if pageid is None:
+            self._send_json({"query": {"pages": {"-1": {"ns": 0, "title": title, "missing": ""}}}})
+            return
+
+        prop = params.get("prop", "")
+        page = {"pageid": int(pageid), "ns": 0, "title": title}
+        if prop == "info|pageprops":
+            page["fullurl"] = f"http://stub.wikipedia.local/wiki/{title.replace(' ', '_')}"
+        elif "extracts" in prop:
+            if "exsentences" in params:
+                page["extract"] = first_sentences(text, int(params["exsentences"]))
+            else:
+                page["extract"] = text
+            if "revisions" in prop:
+                page["revisions"] = [{"revid": 1, "parentid": 0}]
+        self._send_json({"query": {"pages": {pageid: page}}})
+
+
+def start_wiki_stub(host="127.0.0.1", port=0, articles=None, titles=(), latency=0.0):
+    """
+    背景啟動替身，回傳 (server, api_url)。
+    articles：{標題: 全文}；titles 中沒有全文的標題會自動產生一篇通用條目
+    """
+    server = ThreadingHTTPServer((host, port), WikiStubHandler)
+    server.daemon_threads = True
+    server.articles = dict(articles or {})
+    for title in titles:
+        server.articles.setdefault(title, default_article(title))
+    server.latency = latency
+    server.stats_lock = threading.Lock()
+    server.request_count = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/w/api.php"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Minimal local stand-in for the Wikipedia API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--articles", help="JSON file mapping page titles to plain text")
+    parser.add_argument("--titles", default="", help="comma separated titles to serve with generic text")
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    articles = {}
+    if args.articles:
+        with open(args.articles, "r", encoding="utf-8") as f:
+            articles = json.load(f)
+    titles = [t.strip() for t in args.titles.split(",") if t.strip()]
+    server, api_url = start_wiki_stub(args.host, args.port, articles, titles, args.latency)
+    print(f"🧪 Wikipedia stub on {api_url}  (export WIKIPEDIA_API_URL to point clients here)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()